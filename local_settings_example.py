@@ -26,6 +26,18 @@ DATABASES = {
     }
 }
 
+# Example of a cache shared by all server processes. Without it, every
+# process keeps its own copy of cached pages and fight snapshots, so viewers
+# served by other processes miss live updates of fights. It's required for
+# SCIFIGHT_LIVE_EVENTS (see project settings).
+CACHES = {
+    'default': {
+        'BACKEND':  'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': '/var/tmp/scifight_cache',
+        'OPTIONS':  {'MAX_ENTRIES': 10000},
+    }
+}
+
 LANGUAGE_CODE = 'en-US'
 
 DEBUG = True
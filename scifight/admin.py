@@ -1,18 +1,73 @@
+from django.conf import settings
+from django.conf.urls import url
 from django.contrib import auth
 from django.contrib import admin
+from django.contrib import messages
 from django         import forms
+from django.core              import exceptions
+from django.core.urlresolvers import reverse
+from django.db                import transaction
+from django.db.models         import Case, IntegerField, Value, When
+from django.forms.utils       import flatatt
+from django.http              import HttpResponseRedirect, JsonResponse
+from django.shortcuts         import render
+from django.utils.html        import format_html
 from django.utils.translation import ugettext as _tr
+from scifight       import draw
+from scifight       import identities
+from scifight       import instrumentation
+from scifight       import jury
 from scifight       import models
+from scifight       import rules
+from scifight       import signals
 from scifight       import utils
 from scifight       import tournament_specific
 
 admin.AdminSite.site_header = 'SciFight'
 
 
+class IdentitySearchInput(forms.Widget):
+    """ Widget for choosing an identity by searching it by name instead of
+        picking from a drop-down list of all identities ever created. It
+        renders a hidden input holding identity id, and a text box which
+        queries JSON search view of identity admin (see
+        :class:`IdentityAdmin`) as the user types. Empty value means that
+        a new identity will be created.
+
+        :param search_view: Name of the search view to reverse.
+    """
+
+    def __init__(self, search_view, attrs=None):
+        super().__init__(attrs)
+        self.search_view = search_view
+
+    class Media:
+        js = ["scifight/identity_search.js"]
+
+    def render(self, name, value, attrs=None):
+        label = ''
+        if value:
+            # Field's 'choices' are never iterated here, only used to fetch
+            # the label of a single selected identity.
+            identity = self.choices.queryset.filter(pk=value).first()
+            label = str(identity) if identity else ''
+
+        final_attrs = self.build_attrs(attrs, type='hidden', name=name,
+                                       value=value or '')
+        return format_html(
+            '<input{}><input type="text" class="vTextField {}" '
+            'data-search-url="{}" placeholder="{}" value="{}" '
+            'autocomplete="off">',
+            flatatt(final_attrs), "scifight-identity-search",
+            reverse(self.search_view), _tr("--- Create new ---"), label)
+
+
 class PersonForm(forms.ModelForm):
     identity = forms.ModelChoiceField(
-        queryset    = models.PersonIdentity.objects.all(),
-        empty_label = _tr("--- Create new ---"),
+        queryset    = models.PersonIdentity.objects
+                                    .select_related('latest_tournament'),
+        widget      = IdentitySearchInput(
+                          "admin:scifight_personidentity_search"),
         required    = False)
 
     class Meta:
@@ -21,14 +76,166 @@ class PersonForm(forms.ModelForm):
 
 class TeamForm(forms.ModelForm):
     identity = forms.ModelChoiceField(
-        queryset    = models.TeamIdentity.objects.all(),
-        empty_label = _tr("--- Create new ---"),
+        queryset    = models.TeamIdentity.objects
+                                    .select_related('latest_tournament'),
+        widget      = IdentitySearchInput(
+                          "admin:scifight_teamidentity_search"),
         required    = False)
 
     class Meta:
         exclude = []
 
 
+class MarksGridForm(forms.Form):
+    """ Juror-by-stage grid of all marks of a single fight. Every cell holds
+        reporter, opponent and reviewer marks of one juror in one stage;
+        clearing all three marks of a cell deletes them.
+
+        :param fight: The fight.
+        :param stages: List of fight stages, in order of columns.
+        :param jurors: List of jurors of the fight, in order of rows.
+        :param points: Iterable of existing juror points of the fight.
+    """
+
+    ROLES = ("reporter", "opponent", "reviewer")
+
+    def __init__(self, fight, stages, jurors, points, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fight  = fight
+        self.stages = stages
+        self.jurors = jurors
+        self.points = {(p.fight_stage_id, p.juror_id): p for p in points}
+        self.context = models.MarksContext(
+            fight.team3_id is not None, {juror.pk for juror in jurors})
+
+        for stage in stages:
+            for juror in jurors:
+                existing = self.points.get((stage.pk, juror.pk))
+                for role in self.ROLES:
+                    self.fields[self._name(stage, juror, role)] = \
+                        forms.IntegerField(
+                            required  = False,
+                            min_value = models.MIN_MARK,
+                            max_value = models.MAX_MARK,
+                            initial   = getattr(existing, role + "_mark",
+                                                None),
+                            widget    = forms.NumberInput(
+                                attrs={"style": "width: 3em"}))
+
+    @staticmethod
+    def _name(stage, juror, role):
+        return "{0}-{1}-{2}".format(stage.pk, juror.pk, role)
+
+    def rows(self):
+        """ Yields `(juror, cells)` pairs, where `cells` is a list of bound
+            fields triples, one triple for every stage. """
+        for juror in self.jurors:
+            yield juror, [[self[self._name(stage, juror, role)]
+                           for role in self.ROLES]
+                          for stage in self.stages]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        self.new, self.changed, self.deleted = [], [], []
+
+        for stage in self.stages:
+            for juror in self.jurors:
+                names = [self._name(stage, juror, role) for role in self.ROLES]
+                if any(name in self.errors for name in names):
+                    continue
+                marks = [cleaned_data.get(name) for name in names]
+                existing = self.points.get((stage.pk, juror.pk))
+
+                if all(mark is None for mark in marks):
+                    if existing is not None:
+                        self.deleted.append(existing)
+                    continue
+
+                obj = existing or models.JurorPoints(
+                    tournament_id = self.fight.tournament_id,
+                    fight_stage   = stage,
+                    juror         = juror)
+                old_marks = [getattr(obj, role + "_mark")
+                             for role in self.ROLES]
+                for role, mark in zip(self.ROLES, marks):
+                    setattr(obj, role + "_mark", mark)
+
+                obj.marks_context = self.context
+                try:
+                    obj.clean()
+                except exceptions.ValidationError as e:
+                    for field, errors in e.message_dict.items():
+                        role = field.replace("_mark", "")
+                        if role in self.ROLES:
+                            self.add_error(self._name(stage, juror, role),
+                                           errors)
+                        else:
+                            self.add_error(None, errors)
+                    continue
+
+                if existing is None:
+                    self.new.append(obj)
+                elif marks != old_marks:
+                    self.changed.append(obj)
+
+        return cleaned_data
+
+    def _reconcile(self):
+        # Cells may have been filled or cleared by somebody else since the
+        # form was shown, so the rows of changed cells are looked up again:
+        # a filled cell is updated instead of inserted, and a cleared one is
+        # inserted instead of updated.
+        current = {(p.fight_stage_id, p.juror_id): p.pk
+                   for p in models.JurorPoints.objects
+                   .filter(fight_stage__fight=self.fight)
+                   .only('fight_stage_id', 'juror_id')}
+        new, changed = [], []
+        for obj in self.new + self.changed:
+            obj.pk = current.get((obj.fight_stage_id, obj.juror_id))
+            (new if obj.pk is None else changed).append(obj)
+        deleted = [current[key] for key in
+                   ((obj.fight_stage_id, obj.juror_id)
+                    for obj in self.deleted)
+                   if key in current]
+        return new, changed, deleted
+
+    def save(self):
+        """ Saves changed cells in a single transaction: cleared marks are
+            deleted, new marks are inserted with one query, changed marks
+            are updated with another one, and the standings of the fight are
+            refreshed once. Concurrent saves of the grid of a fight are
+            applied one after another.
+
+            :return: Number of changed cells.
+        """
+        touched = {obj.fight_stage_id
+                   for obj in self.new + self.changed + self.deleted}
+        if not touched:
+            return 0
+
+        with transaction.atomic(), \
+                signals.marks_batch(self.fight, touched):
+            models.Fight.objects.select_for_update().get(pk=self.fight.pk)
+            self.new, self.changed, deleted = self._reconcile()
+            if deleted:
+                models.JurorPoints.objects.filter(pk__in=deleted).delete()
+            if self.new:
+                models.JurorPoints.objects.bulk_create(self.new)
+            if self.changed:
+                values = {}
+                for role in self.ROLES:
+                    field = role + "_mark"
+                    values[field] = Case(
+                        *[When(pk=obj.pk, then=Value(getattr(obj, field)))
+                          for obj in self.changed],
+                        output_field=IntegerField())
+                models.JurorPoints.objects \
+                    .filter(pk__in=[obj.pk for obj in self.changed]) \
+                    .update(**values)
+
+        return len(self.new) + len(self.changed) + len(deleted)
+
+
 class ParticipantInline(tournament_specific.InlineMixin, admin.StackedInline):
     model         = models.Participant
     form          = PersonForm
@@ -62,14 +269,34 @@ class JurorInline(admin.TabularInline):
     extra         = 0
 
 
+class IdentityAdmin(admin.ModelAdmin):
+    """ Base admin for identity models, adding a JSON view which searches
+        identities by name for :class:`IdentitySearchInput` widget. It is
+        available to any staff user, as tournament managers must be able to
+        link their participants to identities. """
+
+    list_select_related = ['latest_tournament']
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        search_view = self.admin_site.admin_view(self.search_view)
+        return [url(r'^search/$', search_view, name='%s_%s_search' % info)] \
+            + super().get_urls()
+
+    def search_view(self, request):
+        found = type(self).search_function(request.GET.get('q', ''))
+        return JsonResponse({
+            "results": [{"id": obj.pk, "text": str(obj)} for obj in found]})
+
+
 @admin.register(models.TeamIdentity)
-class TeamIdentityAdmin(admin.ModelAdmin):
-    pass
+class TeamIdentityAdmin(IdentityAdmin):
+    search_function = identities.search_teams
 
 
 @admin.register(models.PersonIdentity)
-class PersonIdentityAdmin(admin.ModelAdmin):
-    pass
+class PersonIdentityAdmin(IdentityAdmin):
+    search_function = identities.search_people
 
 
 @admin.register(models.Team)
@@ -78,6 +305,7 @@ class TeamAdmin(tournament_specific.ModelAdmin):
     fieldset      = ['name']
     list_display  = ['name', 'origin', ]
     inlines       = [LeaderInline, ParticipantInline]
+    query_budget  = 5
 
     class Media:
         js = ["scifight/autopopulate.js"]
@@ -89,6 +317,7 @@ class ProblemAdmin(tournament_specific.ModelAdmin):
     list_display  = ["problem_num", "title", '_get_short_description']
     list_display_links \
                   = ["problem_num", "title", '_get_short_description']
+    query_budget  = 5
 
     def _get_short_description(self, model):
         return utils.shorten_text(model.description, maxchars=90)
@@ -97,6 +326,38 @@ class ProblemAdmin(tournament_specific.ModelAdmin):
 @admin.register(models.TournamentRound)
 class TournamentRoundAdmin(tournament_specific.ModelAdmin):
     list_display  = ["round_num", "opening_time", "closing_time"]
+    actions       = ["make_draw", "assign_jury"]
+    query_budget  = 5
+
+    def make_draw(self, request, queryset):
+        for tournament_round in queryset.order_by("round_num"):
+            try:
+                result = draw.draw_round(tournament_round)
+            except draw.DrawError as e:
+                self.message_user(request, str(e), messages.ERROR)
+                continue
+            level = messages.WARNING if result.repeats else messages.SUCCESS
+            self.message_user(request, _tr(
+                "Round {0}: {1} fights created, {2} repeated meetings, "
+                "{3} meetings of teams of the same origin.").format(
+                    tournament_round.round_num, len(result.fights),
+                    result.repeats, result.origin_clashes), level)
+    make_draw.short_description = _tr("Make draw for selected rounds")
+
+    def assign_jury(self, request, queryset):
+        for tournament_round in queryset.order_by("round_num"):
+            try:
+                result = jury.assign_round(tournament_round)
+            except jury.JuryError as e:
+                self.message_user(request, str(e), messages.ERROR)
+                continue
+            level = messages.WARNING if result.conflicts else messages.SUCCESS
+            self.message_user(request, _tr(
+                "Round {0}: jury assigned to {1} fights, {2} repeated "
+                "juror-team encounters, {3} origin conflicts.").format(
+                    tournament_round.round_num, len(result.panels),
+                    result.repeats, result.conflicts), level)
+    assign_jury.short_description = _tr("Assign jury for selected rounds")
 
 
 @admin.register(models.Fight)
@@ -105,26 +366,105 @@ class FightAdmin(tournament_specific.ModelAdmin):
     exclude       = ["jury"]
     ordering      = ["round", "room"]
     list_display  = ["round", "room",
-                     "team1", "team2", "team3", "team4"]
+                     "team1", "team2", "team3", "team4", "_marks_link"]
     list_display_links \
                   = ["round", "room"]
-    list_select_related \
-                  = ["room", "team1", "team2", "team3", "team4"]
     foreignkey_filtered_fields \
                   = ["room", "team1", "team2", "team3", "team4"]
-
+    query_budget  = 5
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        marks_view = self.admin_site.admin_view(self.marks_view)
+        return [url(r'^(\d+)/marks/$', marks_view,
+                    name='%s_%s_marks' % info)] + super().get_urls()
+
+    def _marks_link(self, model):
+        return format_html('<a href="{}">{}</a>',
+                           reverse("admin:scifight_fight_marks",
+                                   args=[model.pk]),
+                           _tr("Marks"))
+    _marks_link.short_description = _tr("Marks")
+
+    @staticmethod
+    def _has_marks_permission(request, action):
+        opts = models.JurorPoints._meta
+        return request.user.has_perm("{0}.{1}".format(
+            opts.app_label, auth.get_permission_codename(action, opts)))
+
+    def marks_view(self, request, object_id):
+        """ Shows marks of all jurors in all stages of the fight as a single
+            grid, and saves all changed cells at once. Changing marks needs
+            permission to change juror points, and filling or clearing cells
+            also to add or delete them. """
+        fight = self.get_object(request, object_id)
+        if fight is None or not self.has_change_permission(request, fight) \
+                or not self._has_marks_permission(request, "change"):
+            raise exceptions.PermissionDenied()
+
+        stages = list(models.FightStage.objects
+                      .filter(fight=fight)
+                      .select_related("problem", "reporter", "opponent",
+                                      "reviewer")
+                      .order_by("stage_num"))
+        jurors = list(fight.jury.order_by("short_name"))
+        points = models.JurorPoints.objects.filter(fight_stage__fight=fight)
+
+        form = MarksGridForm(fight, stages, jurors, points,
+                             request.POST or None)
+        if request.method == "POST" and form.is_valid():
+            if form.new and not self._has_marks_permission(request, "add") \
+                    or form.deleted and \
+                    not self._has_marks_permission(request, "delete"):
+                raise exceptions.PermissionDenied()
+            count = form.save()
+            self.message_user(request, _tr(
+                "{0} juror marks changed.").format(count), messages.SUCCESS)
+            return HttpResponseRedirect(request.path)
+
+        context = dict(self.admin_site.each_context(request),
+                       title  = _tr("Marks of round {0} in {1}").format(
+                           fight.round.round_num, fight.room),
+                       opts   = self.model._meta,
+                       fight  = fight,
+                       stages = stages,
+                       form   = form)
+        return render(request, "admin/scifight/fight/marks.html", context)
 
 
 @admin.register(models.FightStage)
 class FightStageAdmin(tournament_specific.ModelAdmin):
     inlines       = [RefusalInline, JurorPointsInline]
     list_display  = ["fight", "stage_num"]
-    list_select_related = ["fight"]
+    query_budget  = 5
 
-    tournament_alias_field     = "fight__tournament"
     foreignkey_filtered_fields = ["problem", "fight",
                                   "reporter", "opponent", "reviewer"]
 
+    def get_form(self, request, obj=None, **kwargs):
+        form = super().get_form(request, obj, **kwargs)
+        if obj is not None and "problem" in form.base_fields:
+            # The admin builds the form several times per request, while
+            # checking the problem history takes a query.
+            if getattr(request, "_scifight_allowed", (None,))[0] != obj.pk:
+                request._scifight_allowed = (obj.pk,
+                                             rules.allowed_problems(obj))
+            allowed = request._scifight_allowed[1]
+            form.base_fields["problem"].help_text = _tr(
+                "Problems allowed by the rules: {0}").format(
+                    ", ".join(str(num) for num in allowed) or _tr("none"))
+        return form
+
+
+@admin.register(models.JurorPoints)
+class JurorPointsAdmin(tournament_specific.ModelAdmin):
+    list_display  = ["fight_stage", "juror",
+                     "reporter_mark", "opponent_mark", "reviewer_mark"]
+    raw_id_fields = ["fight_stage"]
+    foreignkey_filtered_fields \
+                  = ["juror"]
+    query_budget  = 5
+
 
 @admin.register(models.TeamOrigin)
 class TeamOriginAdmin(admin.ModelAdmin):
@@ -137,6 +477,7 @@ class ParticipantAdmin(tournament_specific.ModelAdmin):
     list_display  = ['full_name', '_team_name', 'grade', 'is_captain']
     list_select_related = ['team']
     foreignkey_filtered_fields = ["team"]
+    query_budget  = 5
 
     def _team_name(self, model):
         return model.team.name
@@ -151,8 +492,8 @@ class ParticipantAdmin(tournament_specific.ModelAdmin):
 class LeaderAdmin(tournament_specific.ModelAdmin):
     form          = PersonForm
     list_display  = ['full_name', 'team', 'origin']
-    list_select_related = ['team']
     foreignkey_filtered_fields = ["team"]
+    query_budget  = 5
 
     class Media:
         js = ["scifight/autopopulate.js"]
@@ -164,7 +505,7 @@ class JurorAdmin(tournament_specific.ModelAdmin):
     ordering      = ['full_name']
     list_display  = ['full_name', 'short_name', 'origin', 'tournament']
     list_display_links = ['full_name', 'short_name', 'tournament']
-    list_select_related = ['origin']
+    query_budget  = 5
 
     class Media:
         js = ["scifight/autopopulate.js"]
@@ -179,16 +520,11 @@ class TournamentAdmin(admin.ModelAdmin):
     def _get_short_description(self, model):
         return utils.shorten_text(model.description, maxchars=90)
 
-    # TODO: Move this method into 'tournament_specific' module.
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if not request.user.is_superuser:
-            tournament_id = None
-            if hasattr(request.user, 'scifight_user_profile'):
-                if request.user.scifight_user_profile.tournament:
-                    scifight_user_profile = request.user.scifight_user_profile
-                    tournament_id = scifight_user_profile.tournament.id
-            qs = qs.filter(id=tournament_id)
+            tournament = tournament_specific.user_tournament(request)
+            qs = qs.filter(id=tournament and tournament.pk)
         return qs
 
 
@@ -199,7 +535,7 @@ class CommonOriginAdmin(admin.ModelAdmin):
 
 @admin.register(models.Room)
 class RoomAdmin(tournament_specific.ModelAdmin):
-    pass
+    query_budget  = 5
 
 # ---
 
@@ -214,3 +550,19 @@ class UserAdmin(auth.admin.UserAdmin):
 
 admin.site.unregister(auth.models.User)
 admin.site.register(auth.models.User, UserAdmin)
+
+
+def performance_report(request):
+    """ Shows recorded costs of views (see
+        :mod:`scifight.instrumentation`) to superusers. """
+    if not request.user.is_superuser:
+        raise exceptions.PermissionDenied()
+    order_by = request.GET.get("o", "total_time")
+    if order_by not in instrumentation.Row._fields:
+        order_by = "total_time"
+    context = dict(admin.site.each_context(request),
+                   title    = _tr("Performance"),
+                   rows     = instrumentation.summary(order_by),
+                   order_by = order_by,
+                   enabled  = settings.SCIFIGHT_INSTRUMENTATION)
+    return render(request, "admin/scifight/performance.html", context)
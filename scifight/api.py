@@ -0,0 +1,357 @@
+import collections
+
+from django.http import Http404, JsonResponse
+
+from scifight import models
+from scifight import page_cache
+from scifight import views
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+""" Default and maximum number of objects on a single page of paginated
+    lists. """
+
+
+class ApiError(Exception):
+    """ Raised by views on bad query parameters; turned into a JSON response
+        with '400 Bad Request' status. """
+    pass
+
+
+class Serializer(object):
+    """ Lightweight serializer converting rows of a queryset into
+        dictionaries. Each output field is read by its ORM lookup (which may
+        follow relations) with a single `values_list()` query, so no model
+        objects are created and no related objects are queried one by one.
+
+        :param fields: List of `(name, lookup)` pairs, in output order.
+    """
+
+    def __init__(self, fields):
+        self.fields = collections.OrderedDict(fields)
+
+    def select(self, request):
+        """ Returns names of fields requested by the client in comma-separated
+            `fields` GET parameter, or all fields by default. """
+        names = request.GET.get('fields')
+        if not names:
+            return list(self.fields)
+        names = [name.strip() for name in names.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError("unknown fields: " + ", ".join(unknown))
+        return names
+
+    def serialize(self, queryset, names):
+        lookups = [self.fields[name] for name in names]
+        return [dict(zip(names, row))
+                for row in queryset.values_list(*lookups)]
+
+
+TOURNAMENT = Serializer([
+    ('id',           'id'),
+    ('slug',         'slug'),
+    ('full_name',    'full_name'),
+    ('short_name',   'short_name'),
+    ('description',  'description'),
+    ('opening_date', 'opening_date'),
+    ('closing_date', 'closing_date'),
+])
+
+FIGHT = Serializer([
+    ('id',           'id'),
+    ('round',        'round__round_num'),
+    ('room',         'room_id'),
+    ('room_name',    'room__designation'),
+    ('status',       'status'),
+    ('start_time',   'start_time'),
+    ('stop_time',    'stop_time'),
+    ('team1',        'team1_id'),
+    ('team2',        'team2_id'),
+    ('team3',        'team3_id'),
+    ('team4',        'team4_id'),
+])
+
+STAGE = Serializer([
+    ('id',           'id'),
+    ('stage_num',    'stage_num'),
+    ('problem',      'problem__problem_num'),
+    ('reporter',     'reporter_id'),
+    ('opponent',     'opponent_id'),
+    ('reviewer',     'reviewer_id'),
+])
+
+ROOM = Serializer([
+    ('id',           'id'),
+    ('designation',  'designation'),
+    ('slug',         'slug'),
+])
+
+TEAM = Serializer([
+    ('id',           'id'),
+    ('name',         'name'),
+    ('slug',         'slug'),
+    ('origin',       'origin__place_name'),
+])
+
+PARTICIPANT = Serializer([
+    ('id',           'id'),
+    ('full_name',    'full_name'),
+    ('short_name',   'short_name'),
+    ('team',         'team_id'),
+    ('origin',       'origin__place_name'),
+    ('grade',        'grade'),
+    ('is_captain',   'is_captain'),
+])
+
+LEADER = Serializer([
+    ('id',           'id'),
+    ('full_name',    'full_name'),
+    ('short_name',   'short_name'),
+    ('team',         'team_id'),
+    ('origin',       'origin__place_name'),
+])
+
+JUROR = Serializer([
+    ('id',           'id'),
+    ('full_name',    'full_name'),
+    ('short_name',   'short_name'),
+    ('origin',       'origin__place_name'),
+])
+
+PROBLEM = Serializer([
+    ('id',           'id'),
+    ('num',          'problem_num'),
+    ('title',        'title'),
+    ('description',  'description'),
+])
+
+MARK = Serializer([
+    ('id',           'id'),
+    ('fight',        'fight_stage__fight_id'),
+    ('stage',        'fight_stage_id'),
+    ('juror',        'juror_id'),
+    ('reporter_mark', 'reporter_mark'),
+    ('opponent_mark', 'opponent_mark'),
+    ('reviewer_mark', 'reviewer_mark'),
+])
+
+STANDING = Serializer([
+    ('team',         'team_id'),
+    ('name',         'team__name'),
+    ('points',       'points'),
+])
+
+
+def _int_param(request, name, default, minimum=0):
+    value = request.GET.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ApiError("'{0}' must be an integer".format(name))
+    if value < minimum:
+        raise ApiError("'{0}' must be at least {1}".format(name, minimum))
+    return value
+
+
+def _page(request, queryset, serializer):
+    """ Returns a page of the list using keyset pagination: objects are
+        ordered by id, and the page starts after the id given by `after`
+        GET parameter. Unlike offset pagination, fetching a page costs the
+        same no matter how far it is, and pages don't shift when objects
+        are added. """
+    names = serializer.select(request)
+    after = _int_param(request, 'after', 0)
+    limit = min(_int_param(request, 'limit', DEFAULT_LIMIT, 1), MAX_LIMIT)
+
+    # The id is always read, as it's the cursor.
+    lookups = names if 'id' in names else names + ['id']
+    rows = serializer.serialize(
+        queryset.filter(pk__gt=after).order_by('pk')[:limit + 1], lookups)
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1]['id']
+    if 'id' not in names:
+        for row in rows:
+            del row['id']
+    return {"results": rows, "next_after": next_after}
+
+
+def _one(request, queryset, serializer):
+    """ Returns the only object of `queryset`, or raises 404. """
+    data = serializer.serialize(queryset, serializer.select(request))
+    if not data:
+        raise Http404()
+    return data[0]
+
+
+def _all(request, queryset, serializer):
+    return {"results": serializer.serialize(queryset,
+                                            serializer.select(request))}
+
+
+def api_view(view):
+    """ Decorator for API views: resolves the tournament by slug, turns
+        :class:`ApiError` into '400 Bad Request', and caches responses as
+        public pages are cached, so that polling clients get '304 Not
+        Modified' until something changes. """
+    @page_cache.tournament_page
+    def wrapper(request, tournament_slug, **kwargs):
+        tournament = views.tournament_or_404(request, tournament_slug)
+        try:
+            data = view(request, tournament, **kwargs)
+        except ApiError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        return JsonResponse(data)
+    return wrapper
+
+
+@api_view
+def tournament(request, tnmt):
+    return _one(request, models.Tournament.objects.filter(pk=tnmt.pk),
+                TOURNAMENT)
+
+
+@api_view
+def schedule(request, tnmt):
+    return _all(request, models.Fight.objects
+                .for_tournament(tnmt)
+                .order_by('round__round_num', 'room__sorting_key', 'pk'),
+                FIGHT)
+
+
+@api_view
+def fight(request, tnmt, fight_id):
+    data = _one(request, models.Fight.objects
+                .for_tournament(tnmt).filter(pk=fight_id), FIGHT)
+    data["jury"] = list(models.Fight.jury.through.objects
+                        .filter(fight_id=fight_id)
+                        .order_by('juror_id')
+                        .values_list('juror_id', flat=True))
+    data["stages"] = STAGE.serialize(
+        models.FightStage.objects.filter(fight_id=fight_id)
+                                 .order_by('stage_num'),
+        list(STAGE.fields))
+    return data
+
+
+@api_view
+def rooms(request, tnmt):
+    return _all(request, models.Room.objects.for_tournament(tnmt)
+                                            .order_by('sorting_key', 'pk'),
+                ROOM)
+
+
+@api_view
+def room(request, tnmt, room_id):
+    return _one(request, models.Room.objects
+                .for_tournament(tnmt).filter(pk=room_id), ROOM)
+
+
+@api_view
+def teams(request, tnmt):
+    return _all(request, models.Team.objects.for_tournament(tnmt)
+                                            .order_by('pk'),
+                TEAM)
+
+
+@api_view
+def team(request, tnmt, team_id=None, team_slug=None):
+    teams = models.Team.objects.for_tournament(tnmt)
+    if team_id is not None:
+        teams = teams.filter(pk=team_id)
+    else:
+        teams = teams.filter(slug=team_slug)
+
+    # The id is read even if it's not selected, to find team members.
+    names = TEAM.select(request)
+    rows = TEAM.serialize(teams, names if 'id' in names else names + ['id'])
+    if not rows:
+        raise Http404()
+    data = rows[0]
+    team_id = data['id'] if 'id' in names else data.pop('id')
+
+    data["participants"] = list(models.Participant.objects
+                                .filter(team_id=team_id)
+                                .order_by('pk')
+                                .values_list('pk', flat=True))
+    data["leaders"] = list(models.Leader.objects
+                           .filter(team_id=team_id)
+                           .order_by('pk')
+                           .values_list('pk', flat=True))
+    return data
+
+
+@api_view
+def participants(request, tnmt):
+    return _page(request, models.Participant.objects.for_tournament(tnmt),
+                 PARTICIPANT)
+
+
+@api_view
+def participant(request, tnmt, participant_id):
+    return _one(request, models.Participant.objects
+                .for_tournament(tnmt).filter(pk=participant_id),
+                PARTICIPANT)
+
+
+@api_view
+def leaders(request, tnmt):
+    return _all(request, models.Leader.objects.for_tournament(tnmt)
+                                              .order_by('pk'),
+                LEADER)
+
+
+@api_view
+def leader(request, tnmt, leader_id):
+    return _one(request, models.Leader.objects
+                .for_tournament(tnmt).filter(pk=leader_id),
+                LEADER)
+
+
+@api_view
+def jury(request, tnmt):
+    return _all(request, models.Juror.objects.for_tournament(tnmt)
+                                             .order_by('pk'),
+                JUROR)
+
+
+@api_view
+def juror(request, tnmt, jury_id):
+    return _one(request, models.Juror.objects
+                .for_tournament(tnmt).filter(pk=jury_id),
+                JUROR)
+
+
+@api_view
+def problems(request, tnmt):
+    return _all(request, models.Problem.objects.for_tournament(tnmt)
+                                               .order_by('problem_num'),
+                PROBLEM)
+
+
+@api_view
+def problem(request, tnmt, problem_num):
+    return _one(request, models.Problem.objects
+                .for_tournament(tnmt).filter(problem_num=problem_num),
+                PROBLEM)
+
+
+@api_view
+def marks(request, tnmt):
+    return _page(request, models.JurorPoints.objects.for_tournament(tnmt),
+                 MARK)
+
+
+@api_view
+def standings(request, tnmt):
+    """ Team standings read from persisted points (see
+        :mod:`scifight.scoring`), best teams first. """
+    return _all(request, models.TeamScore.objects
+                .filter(tournament=tnmt)
+                .order_by('-points', 'team__name'),
+                STANDING)
@@ -1,5 +1,10 @@
 from django.apps import AppConfig
 
 
-class WebsiteConfig(AppConfig):
-    name = 'website'
+class ScifightConfig(AppConfig):
+    name = 'scifight'
+
+    def ready(self):
+        # Connect signal handlers and register system checks.
+        from scifight import checks   # noqa
+        from scifight import signals  # noqa
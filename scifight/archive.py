@@ -0,0 +1,350 @@
+import gzip
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from scifight import models
+from scifight import page_cache
+from scifight import scoring
+from scifight import utils
+
+FORMAT_NAME = "scifight-archive"
+FORMAT_VERSION = 1
+
+CHUNK_SIZE = 1000
+""" Number of rows read from or written to the database at once. Both export
+    and import hold no more than this many objects in memory, apart from
+    mappings of primary keys. """
+
+# Models of a tournament archive, in the order of dependencies. Each entry
+# holds record type name, model class, and lookup path from the model to
+# its tournament. Origins and identities are shared between tournaments, so
+# they are exported separately and matched with existing rows on import.
+_STAGE_PATH = 'fight_stage__fight__tournament'
+_TOURNAMENT_MODELS = [
+    ('tournament_round', models.TournamentRound,    'tournament'),
+    ('room',             models.Room,               'tournament'),
+    ('problem',          models.Problem,            'tournament'),
+    ('team',             models.Team,               'tournament'),
+    ('participant',      models.Participant,        'tournament'),
+    ('leader',           models.Leader,             'tournament'),
+    ('juror',            models.Juror,              'tournament'),
+    ('fight',            models.Fight,              'tournament'),
+    ('fight_jury',       models.Fight.jury.through, 'fight__tournament'),
+    ('fight_stage',      models.FightStage,         'fight__tournament'),
+    ('refusal',          models.Refusal,            _STAGE_PATH),
+    ('juror_points',     models.JurorPoints,        _STAGE_PATH),
+]
+
+_SHARED_MODELS = [
+    ('team_origin',      models.TeamOrigin),
+    ('person_origin',    models.PersonOrigin),
+    ('team_identity',    models.TeamIdentity),
+    ('person_identity',  models.PersonIdentity),
+    ('tournament',       models.Tournament),
+]
+
+_MODELS = dict((name, model) for name, model, *_ in
+               _SHARED_MODELS + _TOURNAMENT_MODELS)
+_NAMES = {model: name for name, model in _MODELS.items()}
+
+_PEOPLE = (models.Participant, models.Leader, models.Juror)
+
+
+class ArchiveError(Exception):
+    """ Raised when an archive file is malformed or can't be restored. """
+    pass
+
+
+def open_archive(path, mode):
+    """ Opens archive file for reading (`mode` is 'r') or writing ('w') as
+        text. Files with '.gz' extension are transparently compressed. """
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _fields(model):
+    return [f for f in model._meta.concrete_fields if not f.primary_key]
+
+
+def _chunked(queryset):
+    """ Iterates over `queryset` in chunks of primary key ranges, so that
+        neither the database driver nor Django cache the whole result. """
+    last_pk = None
+    while True:
+        chunk = queryset.order_by('pk')
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        chunk = list(chunk[:CHUNK_SIZE])
+        if not chunk:
+            return
+        yield from chunk
+        last_pk = chunk[-1].pk
+
+
+# --- Export ---
+
+def export_tournament(tournament, stream):
+    """ Writes the `tournament` with all its rounds, rooms, problems, teams,
+        people, fights, stages, refusals and marks into `stream` as JSON
+        Lines, one object per line. Derived data, like standings, is not
+        exported, as it's rebuilt on import.
+
+        :return: Dictionary mapping record type to the number of records.
+    """
+    counts = {}
+
+    def write(name, pk, fields):
+        stream.write(json.dumps({"model": name, "pk": pk, "fields": fields},
+                                cls=DjangoJSONEncoder, ensure_ascii=False))
+        stream.write("\n")
+        counts[name] = counts.get(name, 0) + 1
+
+    stream.write(json.dumps({"format": FORMAT_NAME,
+                             "version": FORMAT_VERSION}) + "\n")
+
+    # Shared rows are referenced by ids collected from tournament's rows.
+    team_origins = set(models.Team.objects.filter(tournament=tournament)
+                       .values_list('origin_id', flat=True))
+    team_identities = set(models.Team.objects.filter(tournament=tournament)
+                          .values_list('identity_id', flat=True))
+    person_origins, person_identities = set(), set()
+    for model in _PEOPLE:
+        rows = model.objects.filter(tournament=tournament) \
+                            .values_list('origin_id', 'identity_id')
+        for origin_id, identity_id in rows:
+            person_origins.add(origin_id)
+            person_identities.add(identity_id)
+
+    shared = [(models.TeamOrigin,     team_origins,      ['place_name']),
+              (models.PersonOrigin,   person_origins,    ['place_name']),
+              (models.TeamIdentity,   team_identities,   ['latest_name']),
+              (models.PersonIdentity, person_identities, ['latest_name'])]
+    for model, pks, field_names in shared:
+        queryset = model.objects.filter(pk__in=pks - {None})
+        for obj in _chunked(queryset):
+            write(_NAMES[model], obj.pk,
+                  {name: getattr(obj, name) for name in field_names})
+
+    fields = _fields(models.Tournament)
+    write('tournament', tournament.pk,
+          {f.attname: getattr(tournament, f.attname) for f in fields})
+
+    for name, model, path in _TOURNAMENT_MODELS:
+        fields = _fields(model)
+        for obj in _chunked(model.objects.filter(**{path: tournament})):
+            write(name, obj.pk,
+                  {f.attname: getattr(obj, f.attname) for f in fields})
+
+    return counts
+
+
+# --- Import ---
+
+class _Importer(object):
+
+    def __init__(self, slug, reuse_identities, full_name, short_name):
+        self.slug             = slug
+        self.full_name        = full_name
+        self.short_name       = short_name
+        self.reuse_identities = reuse_identities
+        self.pk_maps          = {name: {} for name in _MODELS}
+        self.counts           = {}
+        self.tournament       = None
+        self.origins          = {}
+        self.reused           = {models.TeamIdentity: set(),
+                                 models.PersonIdentity: set()}
+        self.pending_name     = None
+        self.pending          = []
+
+    def add(self, name, pk, fields):
+        if name not in _MODELS:
+            raise ArchiveError("unknown record type '%s'" % name)
+        if name != self.pending_name or len(self.pending) >= CHUNK_SIZE:
+            self.flush()
+        self.pending_name = name
+        self.pending.append((pk, fields))
+
+    def flush(self):
+        if not self.pending:
+            return
+        name, model = self.pending_name, _MODELS[self.pending_name]
+        records, self.pending = self.pending, []
+        self.counts[name] = self.counts.get(name, 0) + len(records)
+
+        if model in (models.TeamOrigin, models.PersonOrigin):
+            self._add_origins(name, model, records)
+        elif model in (models.TeamIdentity, models.PersonIdentity):
+            self._add_identities(name, model, records)
+        else:
+            self._add_objects(name, model, records)
+
+    def _add_origins(self, name, model, records):
+        # Origins are matched by name, as they are shared by tournaments.
+        if model not in self.origins:
+            self.origins[model] = dict(model.objects
+                                       .values_list('place_name', 'id'))
+        known = self.origins[model]
+        names = {fields['place_name'] for _, fields in records}
+        missing = [model(place_name=place_name)
+                   for place_name in sorted(names - set(known))]
+        for origin in utils.bulk_create_with_pks(model, missing):
+            known[origin.place_name] = origin.pk
+        for pk, fields in records:
+            self.pk_maps[name][pk] = known[fields['place_name']]
+
+    def _add_identities(self, name, model, records):
+        pk_map = self.pk_maps[name]
+        if self.reuse_identities:
+            existing = set(model.objects
+                           .filter(pk__in=[pk for pk, _ in records])
+                           .values_list('pk', flat=True))
+            for pk in existing:
+                pk_map[pk] = pk
+            self.reused[model] |= existing
+            records = [r for r in records if r[0] not in existing]
+
+        # New identities have tournament being imported as the only one,
+        # which is set as their latest when the tournament is created.
+        objs = utils.bulk_create_with_pks(model, [
+            model(latest_name=fields.get('latest_name', ''))
+            for _, fields in records])
+        for (pk, _), obj in zip(records, objs):
+            pk_map[pk] = obj.pk
+
+    def _add_objects(self, name, model, records):
+        objs = []
+        for pk, fields in records:
+            values = {}
+            for field in _fields(model):
+                value = fields.get(field.attname)
+                if field.is_relation and value is not None:
+                    target = _NAMES[field.related_model]
+                    try:
+                        value = self.pk_maps[target][value]
+                    except KeyError:
+                        raise ArchiveError("%s #%s refers to missing %s #%s"
+                                           % (name, pk, target, value))
+                elif value is not None:
+                    value = field.to_python(value)
+                values[field.attname] = value
+            objs.append(model(**values))
+
+        if model is models.Tournament:
+            self._prepare_tournament(objs)
+
+        objs = utils.bulk_create_with_pks(model, objs)
+        for (pk, _), obj in zip(records, objs):
+            self.pk_maps[name][pk] = obj.pk
+
+        if model is models.Tournament:
+            self.tournament = objs[0]
+            self._label_new_identities()
+
+    def _prepare_tournament(self, objs):
+        if len(objs) != 1 or self.tournament is not None:
+            raise ArchiveError("archive must contain exactly one tournament")
+        tournament = objs[0]
+        if self.slug:
+            tournament.slug = self.slug
+        for field in ('full_name', 'short_name'):
+            value = getattr(self, field)
+            if value:
+                setattr(tournament, field, value)
+            elif self.slug and _tournament_exists(
+                    **{field: getattr(tournament, field)}):
+                # Names are unique too, so a copy restored next to the
+                # archived tournament under a new slug is named after it.
+                setattr(tournament, field, "%s (%s)" % (
+                    getattr(tournament, field), self.slug))
+        for field in ('slug', 'full_name', 'short_name'):
+            value = getattr(tournament, field)
+            if _tournament_exists(**{field: value}):
+                raise ArchiveError("tournament with %s '%s' already exists"
+                                   % (field, value))
+
+    def _label_new_identities(self):
+        for model, name in ((models.TeamIdentity,   'team_identity'),
+                            (models.PersonIdentity, 'person_identity')):
+            new_pks = set(self.pk_maps[name].values()) - self.reused[model]
+            for pks in _split(sorted(new_pks)):
+                model.objects.filter(pk__in=pks) \
+                             .update(latest_tournament=self.tournament)
+
+    def finish(self):
+        self.flush()
+        if self.tournament is None:
+            raise ArchiveError("archive contains no tournament")
+
+        for model in self.reused:
+            for identity in model.objects.filter(pk__in=self.reused[model]):
+                identity.refresh_label()
+
+        scoring.rebuild_tournament(self.tournament)
+        # New tournament is listed on the index page.
+        page_cache.bump()
+
+
+def _tournament_exists(**lookup):
+    return models.Tournament.objects.filter(**lookup).exists()
+
+
+def _split(items):
+    for i in range(0, len(items), CHUNK_SIZE):
+        yield items[i:i + CHUNK_SIZE]
+
+
+def import_tournament(stream, slug=None, reuse_identities=False,
+                      full_name=None, short_name=None):
+    """ Restores a tournament written by :func:`export_tournament` from
+        `stream`, reading it line by line and creating objects in batches.
+        All objects get new primary keys; references between them, including
+        links of teams and people to their identities, are preserved.
+
+        :param slug: New slug for the tournament, instead of archived one.
+            Archived names which are taken too get the slug appended, unless
+            new names are given.
+        :param full_name: New full name for the tournament.
+        :param short_name: New short name for the tournament.
+        :param reuse_identities: If true, identities which exist in this
+            database under the archived ids are reused instead of creating
+            new ones. This is right when restoring an archive made on the
+            same site, and is wrong for archives from other sites.
+        :return: Pair of created tournament and dictionary mapping record
+            type to the number of records.
+    """
+    importer = _Importer(slug, reuse_identities, full_name, short_name)
+
+    with transaction.atomic():
+        header = None
+        for line_num, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ArchiveError("line %d: %s" % (line_num, e))
+
+            if header is None:
+                header = record
+                if header.get("format") != FORMAT_NAME or \
+                        header.get("version") != FORMAT_VERSION:
+                    raise ArchiveError("not a SciFight archive of version %d"
+                                       % FORMAT_VERSION)
+                continue
+
+            try:
+                name, pk, fields = (record["model"], record["pk"],
+                                    record["fields"])
+            except (KeyError, TypeError):
+                name = fields = None
+            if not isinstance(fields, dict):
+                raise ArchiveError("line %d: record must have 'model', 'pk' "
+                                   "and 'fields'" % line_num)
+            importer.add(name, pk, fields)
+
+        importer.finish()
+
+    return importer.tournament, importer.counts
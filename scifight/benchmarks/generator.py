@@ -0,0 +1,207 @@
+import collections
+import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from scifight import models
+from scifight import scoring
+from scifight import utils
+
+Size = collections.namedtuple('Size', ['teams', 'rounds', 'team_size',
+                                       'jurors_per_fight', 'problems'])
+""" Size of a generated tournament. Every round has a fight in each room,
+    and there are as many rooms as complete groups of three teams; the rest
+    of teams join some of the fights as fourth teams. Every fight has a
+    stage per team, and every juror of the fight marks every stage. """
+
+DEFAULT_SIZE = Size(teams=30, rounds=5, team_size=5, jurors_per_fight=5,
+                    problems=17)
+
+
+def _stage_roles(group, stage_num):
+    # Roles rotate, so that every team reports once per fight.
+    count = len(group)
+    return (group[stage_num % count],
+            group[(stage_num + 1) % count],
+            group[(stage_num + 2) % count])
+
+
+def generate(slug, size=DEFAULT_SIZE):
+    """ Creates a finished tournament of the given :class:`Size` with marks
+        of all fights and standings computed from them. Objects are inserted
+        with `bulk_create`, so signals are not sent; identities are created
+        as a roster import does (see `import_roster` command).
+
+        :return: The tournament object.
+        :raise ValueError: If there are too few problems to play all rounds
+            by the rules.
+    """
+    with transaction.atomic():
+        return _generate(slug, size)
+
+
+def _generate(slug, size):
+    opening = datetime.date(2016, 7, 1)
+    tnmt = models.Tournament.objects.create(
+        full_name    = "Benchmark " + slug,
+        short_name   = slug.upper(),
+        slug         = slug,
+        opening_date = opening,
+        closing_date = opening + datetime.timedelta(days=size.rounds))
+
+    team_origin = models.TeamOrigin.objects.create(place_name="Benchmark")
+    person_origin = models.PersonOrigin.objects.create(
+        place_name="Benchmark")
+
+    team_identities = utils.bulk_create_with_pks(models.TeamIdentity, [
+        models.TeamIdentity(latest_name="Team {0}".format(i),
+                            latest_tournament=tnmt)
+        for i in range(size.teams)])
+    teams = utils.bulk_create_with_pks(models.Team, [
+        models.Team(tournament  = tnmt,
+                    identity_id = identity.pk,
+                    name        = identity.latest_name,
+                    slug        = "team{0}".format(i),
+                    origin      = team_origin)
+        for i, identity in enumerate(team_identities)])
+
+    people = [("participant", team, j)
+              for team in teams for j in range(size.team_size)]
+    people += [("leader", team, 0) for team in teams]
+    num_rooms = max(size.teams // 3, 1)
+    people += [("juror", None, j)
+               for j in range(num_rooms * size.jurors_per_fight)]
+    identities = utils.bulk_create_with_pks(models.PersonIdentity, [
+        models.PersonIdentity(latest_name="{0} {1}{2}".format(
+                                  j, kind.title(), team and team.pk or ""),
+                              latest_tournament=tnmt)
+        for kind, team, j in people])
+
+    avatars = collections.defaultdict(list)
+    for (kind, team, j), identity in zip(people, identities):
+        fields = dict(tournament  = tnmt,
+                      identity_id = identity.pk,
+                      full_name   = identity.latest_name,
+                      short_name  = identity.latest_name,
+                      origin      = person_origin)
+        if kind == "participant":
+            avatars[kind].append(models.Participant(
+                team=team, grade="11", is_captain=(j == 0), **fields))
+        elif kind == "leader":
+            avatars[kind].append(models.Leader(team=team, **fields))
+        else:
+            avatars[kind].append(models.Juror(**fields))
+    players = collections.defaultdict(list)
+    for player in utils.bulk_create_with_pks(models.Participant,
+                                             avatars["participant"]):
+        players[player.team_id].append(player)
+    models.Leader.objects.bulk_create(avatars["leader"])
+    jurors = utils.bulk_create_with_pks(models.Juror, avatars["juror"])
+
+    rooms = utils.bulk_create_with_pks(models.Room, [
+        models.Room(tournament  = tnmt,
+                    designation = "Room {0}".format(i + 1),
+                    sorting_key = i,
+                    slug        = "room{0}".format(i + 1))
+        for i in range(num_rooms)])
+    problems = utils.bulk_create_with_pks(models.Problem, [
+        models.Problem(tournament  = tnmt,
+                       problem_num = i + 1,
+                       title       = "Problem {0}".format(i + 1))
+        for i in range(size.problems)])
+
+    start = timezone.make_aware(datetime.datetime.combine(
+        opening, datetime.time(10)))
+    rounds = utils.bulk_create_with_pks(models.TournamentRound, [
+        models.TournamentRound(
+            tournament   = tnmt,
+            round_num    = r + 1,
+            opening_time = start + datetime.timedelta(days=r),
+            closing_time = start + datetime.timedelta(days=r, hours=4))
+        for r in range(size.rounds)])
+
+    fights, groups = [], []
+    for r, tround in enumerate(rounds):
+        shift = r * (1 + size.teams // max(size.rounds, 1))
+        order = teams[shift % size.teams:] + teams[:shift % size.teams]
+        room_groups = [order[3 * k: 3 * k + 3] for k in range(num_rooms)]
+        for k, team in enumerate(order[3 * num_rooms:]):
+            room_groups[k].append(team)
+        for room, group in zip(rooms, room_groups):
+            fights.append(models.Fight(
+                tournament = tnmt,
+                round      = tround,
+                room       = room,
+                start_time = tround.opening_time,
+                stop_time  = tround.closing_time,
+                status     = models.Fight.COMPLETED,
+                team1      = group[0],
+                team2      = group[1],
+                team3      = group[2] if len(group) > 2 else None,
+                team4      = group[3] if len(group) > 3 else None))
+            groups.append(group)
+    fights = utils.bulk_create_with_pks(models.Fight, fights)
+
+    panels = {}
+    for i, fight in enumerate(fights):
+        k = i % num_rooms
+        panels[fight.pk] = jurors[k * size.jurors_per_fight:
+                                  (k + 1) * size.jurors_per_fight]
+    models.Fight.jury.through.objects.bulk_create([
+        models.Fight.jury.through(fight_id=fight_id, juror_id=juror.pk)
+        for fight_id, panel in panels.items() for juror in panel])
+
+    # Problems are picked by tournament rules (see `scifight.rules`), the
+    # reporting teams of the first round refusing one problem each.
+    reported, opposed, refused = (collections.defaultdict(set)
+                                  for _ in range(3))
+    stages, refusals = [], []
+    for i, (fight, group) in enumerate(zip(fights, groups)):
+        presented = set()
+        for s in range(len(group)):
+            reporter, opponent, reviewer = _stage_roles(group, s)
+            # Rules hold for all stages, not just earlier ones, so a team
+            # may not report what it has opposed either.
+            forbidden = (reported[reporter.pk] | refused[reporter.pk] |
+                         opposed[reporter.pk] | opposed[opponent.pk] |
+                         reported[opponent.pk] | presented)
+            allowed = [problem for problem in problems[i:] + problems[:i]
+                       if problem.problem_num not in forbidden]
+            refusing = fight.round_id == rounds[0].pk
+            if len(allowed) < 1 + refusing:
+                raise ValueError("not enough problems for {0} rounds".format(
+                                 size.rounds))
+            problem = allowed[0]
+            reported[reporter.pk].add(problem.problem_num)
+            opposed[opponent.pk].add(problem.problem_num)
+            presented.add(problem.problem_num)
+            stages.append(models.FightStage(
+                fight     = fight,
+                stage_num = s + 1,
+                problem   = problem,
+                reporter  = players[reporter.pk][0],
+                opponent  = players[opponent.pk][s % size.team_size],
+                reviewer  = players[reviewer.pk][-1]))
+            if refusing:
+                refused[reporter.pk].add(allowed[1].problem_num)
+                refusals.append((len(stages) - 1, allowed[1]))
+    stages = utils.bulk_create_with_pks(models.FightStage, stages)
+
+    models.Refusal.objects.bulk_create([
+        models.Refusal(tournament  = tnmt,
+                       fight_stage = stages[index],
+                       problem     = problem)
+        for index, problem in refusals])
+    models.JurorPoints.objects.bulk_create([
+        models.JurorPoints(tournament    = tnmt,
+                           fight_stage   = stage,
+                           juror         = juror,
+                           reporter_mark = 5 + (stage.pk + j) % 6,
+                           opponent_mark = 4 + (stage.pk + 2 * j) % 7,
+                           reviewer_mark = 3 + (stage.pk + 3 * j) % 8)
+        for stage in stages
+        for j, juror in enumerate(panels[stage.fight_id])])
+
+    scoring.rebuild_tournament(tnmt)
+    return tnmt
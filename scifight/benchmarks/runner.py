@@ -0,0 +1,226 @@
+import collections
+import json
+import time
+
+from django.contrib import admin
+from django.core.urlresolvers import RegexURLPattern, reverse
+from django.db import connection
+from django.forms.widgets import CheckboxInput, MultiWidget
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from scifight import tournament_specific
+from scifight import urls
+
+Target = collections.namedtuple('Target', ['name', 'url', 'post'])
+""" A request to measure. If `post` is true, the URL is a change form of
+    the admin, and the form is posted back unchanged, which saves the
+    object and its inlines; otherwise the URL is requested with GET. """
+
+Result = collections.namedtuple('Result', ['name', 'queries', 'p50', 'p90',
+                                           'max'])
+""" Costs of a target measured by :func:`run`: the largest number of SQL
+    queries of a request and percentiles of request time in
+    milliseconds. """
+
+Regression = collections.namedtuple('Regression', ['name', 'metric',
+                                                   'baseline', 'current'])
+""" A metric of a target which got worse than in the baseline. """
+
+MIN_TIME_REGRESSION = 1.0
+""" Time in milliseconds a target must slow down by, on top of the relative
+    tolerance, to count as a regression, so that noise of very fast pages
+    is not reported. """
+
+_SKIPPED_VIEWS = {
+    # Streams events for as long as the client stays connected.
+    'fight_events',
+}
+
+# Values of URL arguments, taken from the first object of every kind.
+_URL_ARGUMENTS = {
+    'fight_id':       lambda t: t.fight_set.order_by('pk')[0].pk,
+    'room_id':        lambda t: t.room_set.order_by('pk')[0].pk,
+    'team_id':        lambda t: t.team_set.order_by('pk')[0].pk,
+    'team_slug':      lambda t: t.team_set.exclude(slug=None)
+                                          .order_by('pk')[0].slug,
+    'participant_id': lambda t: t.participant_set.order_by('pk')[0].pk,
+    'leader_id':      lambda t: t.leader_set.order_by('pk')[0].pk,
+    'jury_id':        lambda t: t.juror_set.order_by('pk')[0].pk,
+    'problem_num':    lambda t: t.problem_set.order_by('pk')[0].problem_num,
+}
+
+
+def public_targets(tournament):
+    """ Returns a target for every page of `scifight.urls`, on the first
+        object of every kind in the `tournament`. """
+    targets = [Target('index', reverse('index'), False)]
+    for pattern in urls.tournament_urls + urls.api_urls:
+        if not isinstance(pattern, RegexURLPattern) or \
+                pattern.name in _SKIPPED_VIEWS:
+            continue
+        kwargs = {name: _URL_ARGUMENTS[name](tournament)
+                  for name in pattern.regex.groupindex}
+        kwargs['tournament_slug'] = tournament.slug
+        url = reverse('scifight:' + pattern.name, kwargs=kwargs)
+        targets.append(Target(pattern.name, url, False))
+    return targets
+
+
+def admin_targets(tournament):
+    """ Returns targets of the admin: changelists of all registered models,
+        and a change form of the first object of the `tournament` for every
+        tournament-specific model, both shown and saved. """
+    targets = []
+    for model, model_admin in sorted(admin.site._registry.items(),
+                                     key=lambda item: item[0]._meta.label):
+        opts = model._meta
+        prefix = 'admin:{0}_{1}'.format(opts.app_label, opts.model_name)
+        targets.append(Target(prefix + '_changelist',
+                              reverse(prefix + '_changelist'), False))
+        if not isinstance(model_admin, tournament_specific.ModelAdmin):
+            continue
+        obj = model.objects.for_tournament(tournament).order_by('pk').first()
+        if obj is None:
+            continue
+        url = reverse(prefix + '_change', args=[obj.pk])
+        targets.append(Target(prefix + '_change', url, False))
+        targets.append(Target(prefix + '_save', url, True))
+    return targets
+
+
+def _field_data(bound_field):
+    name = bound_field.html_name
+    value = bound_field.value()
+    widget = bound_field.field.widget
+    if isinstance(widget, MultiWidget):
+        if not isinstance(value, (list, tuple)):
+            value = widget.decompress(value)
+        return {'{0}_{1}'.format(name, i): str(part)
+                for i, part in enumerate(value) if part is not None}
+    if value is None:
+        return {}
+    if isinstance(widget, CheckboxInput):
+        return {name: 'on'} if value else {}
+    if isinstance(value, (list, tuple)):
+        return {name: [str(item) for item in value]}
+    return {name: str(value)}
+
+
+def form_data(response):
+    """ Returns POST data which submits the admin change form rendered in
+        `response` with its current values, including inline formsets. """
+    forms = [response.context['adminform'].form]
+    for inline in response.context['inline_admin_formsets']:
+        forms.append(inline.formset.management_form)
+        forms.extend(inline.formset.forms)
+    data = {}
+    for form in forms:
+        for bound_field in form:
+            data.update(_field_data(bound_field))
+    return data
+
+
+def _form_errors(response):
+    errors = [response.context['adminform'].form.errors]
+    for inline in response.context['inline_admin_formsets']:
+        errors.append(inline.formset.non_form_errors())
+        errors.extend(inline.formset.errors)
+    return "; ".join(str(error) for error in errors if error)
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _measure(client, target, repeat):
+    data = None
+    if target.post:
+        data = form_data(client.get(target.url))
+    times, queries = [], 0
+    # The first request fills caches of templates and the like, and isn't
+    # counted.
+    for i in range(repeat + 1):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            if target.post:
+                response = client.post(target.url, data)
+            else:
+                response = client.get(target.url)
+            elapsed = time.perf_counter() - started
+        if target.post and response.status_code == 200:
+            raise ValueError("{0} rejected its own data: {1}".format(
+                             target.url, _form_errors(response)))
+        expected = 302 if target.post else 200
+        if response.status_code != expected:
+            raise ValueError("{0} returned status {1}".format(
+                             target.url, response.status_code))
+        if i:
+            times.append(1000 * elapsed)
+            queries = max(queries, len(context.captured_queries))
+    return Result(target.name, queries, _percentile(times, 0.5),
+                  _percentile(times, 0.9), max(times))
+
+
+def run(tournament, user, repeat=10, only=None):
+    """ Measures public pages of the `tournament` and, as the `user`, its
+        admin pages, each requested `repeat` times. Pages are rendered
+        bypassing the cache, so that their full cost is measured. Needs
+        the test environment (see `setup_test_environment`), for change
+        forms are read from contexts of their responses.
+
+        :param only: If given, only targets with names containing this
+            string are measured.
+        :return: List of :class:`Result`.
+    """
+    dummy_cache = {'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    with override_settings(CACHES=dummy_cache,
+                           ALLOWED_HOSTS=['testserver']):
+        client = Client()
+        client.force_login(user)
+        targets = public_targets(tournament) + admin_targets(tournament)
+        return [_measure(client, target, repeat) for target in targets
+                if only is None or only in target.name]
+
+
+def save_baseline(path, size, results):
+    """ Writes `results` of a tournament of the `size` (see
+        :class:`scifight.benchmarks.generator.Size`) to a JSON file. """
+    baseline = {
+        'vendor':  connection.vendor,
+        'size':    size._asdict(),
+        'results': {r.name: {'queries': r.queries, 'p50': round(r.p50, 2),
+                             'p90': round(r.p90, 2)}
+                    for r in results},
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance):
+    """ Returns a list of :class:`Regression` of `results` against a loaded
+        `baseline`. Any growth of the number of queries is a regression;
+        median time is a regression if it exceeds the baseline by more than
+        `tolerance` (a fraction) and :data:`MIN_TIME_REGRESSION`. Targets
+        missing from the baseline are skipped. """
+    regressions = []
+    for result in results:
+        base = baseline['results'].get(result.name)
+        if base is None:
+            continue
+        if result.queries > base['queries']:
+            regressions.append(Regression(result.name, 'queries',
+                                          base['queries'], result.queries))
+        limit = base['p50'] * (1 + tolerance) + MIN_TIME_REGRESSION
+        if result.p50 > limit:
+            regressions.append(Regression(result.name, 'p50',
+                                          base['p50'], round(result.p50, 2)))
+    return regressions
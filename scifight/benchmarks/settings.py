@@ -0,0 +1,17 @@
+# Settings of the `benchmark` management command, which needs an SQLite
+# database to create its throwaway copy in memory:
+#
+#    $ ./manage.py benchmark --settings=scifight.benchmarks.settings
+#
+# Everything else is taken from project settings as is, so that pages are
+# measured as they are served.
+from scifight_proj.settings import *
+
+SECRET_KEY = 'benchmark'
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME':   ':memory:',
+    }
+}
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core import checks
+
+from scifight import live
+
+
+def _private_cache():
+    return settings.CACHES['default']['BACKEND'] in live.PRIVATE_CACHE_BACKENDS
+
+
+@checks.register(checks.Tags.caches)
+def check_live_events(app_configs, **kwargs):
+    """ Event streams of fights are served to many viewers by many
+        processes, which only works with snapshots shared through the
+        cache. """
+    if settings.SCIFIGHT_LIVE_EVENTS and _private_cache():
+        return [checks.Error(
+            "SCIFIGHT_LIVE_EVENTS needs a cache shared by server processes",
+            hint="Configure a shared cache backend in CACHES, see "
+                 "local_settings_example.py.",
+            id='scifight.E001')]
+    return []
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """ Live fight updates and invalidation of cached pages are seen only
+        by the process making changes, unless the cache is shared. """
+    if _private_cache():
+        return [checks.Warning(
+            "the cache is private to a process, so viewers served by other "
+            "processes get fights late and stale pages",
+            hint="Configure a shared cache backend in CACHES, see "
+                 "local_settings_example.py.",
+            id='scifight.W001')]
+    return []
@@ -0,0 +1,238 @@
+import collections
+import itertools
+import random
+
+from django.db import transaction
+
+from scifight import models
+from scifight import page_cache
+
+REPEAT_PENALTY = 1000
+""" Cost of two teams meeting again in a fight. It's much larger than other
+    costs, so any draw without repeated meetings is better than any draw
+    with them. """
+
+ORIGIN_PENALTY = 10
+""" Cost of two teams of the same origin meeting in a fight. """
+
+ROOM_PENALTY = 1
+""" Cost of a team coming into a room it has already fought in. """
+
+MAX_STALLED_STEPS = 2000
+""" Number of local search steps (attempted swaps of two teams) without any
+    improvement after which the search is restarted from another random
+    draw. """
+
+RESTARTS = 5
+""" Number of searches started from different random draws when none of
+    them reaches a draw of zero cost. The best draw found is used. """
+
+Draw = collections.namedtuple('Draw', ['fights', 'repeats', 'origin_clashes'])
+""" Result of :func:`make_draw`. `fights` is a list of `(room_id, team_ids)`
+    pairs, `repeats` and `origin_clashes` are numbers of pairs of teams that
+    meet again or share origin, respectively. """
+
+
+class DrawError(Exception):
+    """ Raised when the draw can't be made at all, for example when there are
+        too few rooms for all teams. """
+    pass
+
+
+def fight_sizes(num_teams):
+    """ Splits `num_teams` into fights of three teams, adding fights of four
+        teams as needed. Two and five teams are special cases, as they can't
+        be split that way.
+    """
+    if num_teams < 2:
+        raise DrawError("at least two teams are required")
+    if num_teams == 2:
+        return [2]
+    if num_teams == 5:
+        return [3, 2]
+    num_fours = num_teams % 3
+    return [4] * num_fours + [3] * ((num_teams - 4 * num_fours) // 3)
+
+
+class _History(object):
+    """ Pairwise costs of putting teams together, computed from fights of
+        other rounds and team origins. """
+
+    def __init__(self, previous_fights, origins):
+        self.met   = collections.Counter()
+        self.rooms = collections.Counter()
+        for room_id, team_ids in previous_fights:
+            team_ids = [t for t in team_ids if t is not None]
+            for a, b in itertools.combinations(team_ids, 2):
+                self.met[a, b] += 1
+                self.met[b, a] += 1
+            for team_id in team_ids:
+                self.rooms[team_id, room_id] += 1
+        self.origins = origins
+
+    def pair_cost(self, a, b):
+        cost = REPEAT_PENALTY * self.met[a, b]
+        origin = self.origins.get(a)
+        if origin is not None and origin == self.origins.get(b):
+            cost += ORIGIN_PENALTY
+        return cost
+
+    def group_cost(self, group):
+        return sum(self.pair_cost(a, b)
+                   for a, b in itertools.combinations(group, 2))
+
+    def room_cost(self, group, room_id):
+        return ROOM_PENALTY * sum(self.rooms[t, room_id] for t in group)
+
+
+def _search_groups(team_ids, sizes, history, rng):
+    """ Randomized local search: start from a random split into groups and
+        keep swapping teams of different groups while it doesn't make the
+        draw worse. Sideways moves let the search walk across plateaus.
+
+        :return: Pair of groups and their total cost.
+    """
+    order = list(team_ids)
+    rng.shuffle(order)
+
+    groups, start = [], 0
+    for size in sizes:
+        groups.append(order[start:start + size])
+        start += size
+
+    costs = [history.group_cost(g) for g in groups]
+    total = sum(costs)
+    if len(groups) < 2:
+        return groups, total
+
+    stalled = 0
+    while total > 0 and stalled < MAX_STALLED_STEPS:
+        stalled += 1
+        # Pick a team from a costly group, otherwise the search wastes most
+        # of its time shuffling teams which are already fine.
+        i = rng.choice([k for k, c in enumerate(costs) if c > 0])
+        j = rng.randrange(len(groups) - 1)
+        if j >= i:
+            j += 1
+        a = rng.randrange(len(groups[i]))
+        b = rng.randrange(len(groups[j]))
+
+        gi, gj = groups[i][:], groups[j][:]
+        gi[a], gj[b] = gj[b], gi[a]
+        ci, cj = history.group_cost(gi), history.group_cost(gj)
+
+        delta = ci + cj - costs[i] - costs[j]
+        if delta <= 0:
+            groups[i], groups[j] = gi, gj
+            costs[i], costs[j] = ci, cj
+            total += delta
+        if delta < 0:
+            stalled = 0
+
+    return groups, total
+
+
+def _assign_rooms(groups, room_ids, history):
+    """ Assigns groups to rooms, improving room balance by swapping rooms of
+        two groups (or moving a group to a free room) while it helps. """
+    slots = list(groups) + [[]] * (len(room_ids) - len(groups))
+
+    improved = True
+    while improved:
+        improved = False
+        for i, j in itertools.combinations(range(len(slots)), 2):
+            before = (history.room_cost(slots[i], room_ids[i]) +
+                      history.room_cost(slots[j], room_ids[j]))
+            after  = (history.room_cost(slots[j], room_ids[i]) +
+                      history.room_cost(slots[i], room_ids[j]))
+            if after < before:
+                slots[i], slots[j] = slots[j], slots[i]
+                improved = True
+
+    return [(room_id, group)
+            for room_id, group in zip(room_ids, slots) if group]
+
+
+def make_draw(team_ids, room_ids, previous_fights=(), origins=None,
+              seed=None):
+    """ Splits teams into fights of a single round, avoiding repeated
+        meetings of teams, meetings of teams of the same origin, and teams
+        fighting in the same room again, in this order of importance.
+
+        :param team_ids: Ids of teams taking part in the round.
+        :param room_ids: Ids of available rooms, in order of preference.
+        :param previous_fights: Iterable of `(room_id, team_ids)` pairs for
+            fights of other rounds.
+        :param origins: Dictionary mapping team id to its origin id.
+        :param seed: Seed for random number generator, to get the same draw
+            for the same input.
+        :return: Object of :class:`Draw`.
+    """
+    team_ids = list(team_ids)
+    room_ids = list(room_ids)
+
+    sizes = fight_sizes(len(team_ids))
+    if len(sizes) > len(room_ids):
+        raise DrawError("%d rooms are needed for %d teams, but only %d are "
+                        "available" % (len(sizes), len(team_ids),
+                                       len(room_ids)))
+
+    history = _History(previous_fights, origins or {})
+    rng = random.Random(seed)
+    groups, cost = _search_groups(team_ids, sizes, history, rng)
+    for _ in range(RESTARTS - 1):
+        if cost == 0:
+            break
+        other, other_cost = _search_groups(team_ids, sizes, history, rng)
+        if other_cost < cost:
+            groups, cost = other, other_cost
+
+    repeats = clashes = 0
+    for group in groups:
+        for a, b in itertools.combinations(group, 2):
+            repeats += history.met[a, b] > 0
+            origin = history.origins.get(a)
+            clashes += origin is not None and origin == history.origins.get(b)
+
+    return Draw(_assign_rooms(groups, room_ids, history), repeats, clashes)
+
+
+def draw_round(tournament_round, seed=None):
+    """ Makes the draw for `tournament_round` with all teams and rooms of its
+        tournament, taking fights of other rounds into account, and creates
+        its fights. The round must have no fights yet.
+
+        :return: Object of :class:`Draw`.
+    """
+    tournament = tournament_round.tournament
+    if models.Fight.objects.filter(round=tournament_round).exists():
+        raise DrawError("round %s already has fights" % tournament_round)
+
+    teams = dict(models.Team.objects
+                 .filter(tournament=tournament)
+                 .values_list('id', 'origin_id'))
+    room_ids = list(models.Room.objects
+                    .filter(tournament=tournament)
+                    .values_list('id', flat=True))
+    previous = [(row[0], row[1:]) for row in models.Fight.objects
+                .filter(tournament=tournament)
+                .values_list('room_id', 'team1_id', 'team2_id',
+                             'team3_id', 'team4_id')]
+
+    draw = make_draw(sorted(teams), room_ids, previous, teams, seed)
+
+    fights = []
+    for room_id, group in draw.fights:
+        group = list(group) + [None] * (4 - len(group))
+        fights.append(models.Fight(tournament = tournament,
+                                   round      = tournament_round,
+                                   room_id    = room_id,
+                                   team1_id   = group[0],
+                                   team2_id   = group[1],
+                                   team3_id   = group[2],
+                                   team4_id   = group[3]))
+    with transaction.atomic():
+        models.Fight.objects.bulk_create(fights)
+        page_cache.bump_tournament(tournament.pk)
+
+    return draw
@@ -0,0 +1,261 @@
+import collections
+import re
+import unicodedata
+
+from django.db        import transaction
+from django.db.models import Q
+
+from scifight import models
+from scifight import utils
+
+SEARCH_LIMIT = 20
+""" Maximum number of identities returned by search functions below. It's
+    a list for a human to choose from, so there is no point in making it
+    longer than a screen. """
+
+MATCH_THRESHOLD = 0.75
+""" Minimum similarity of two names (from 0 to 1) for people to be proposed
+    as the same person by :func:`match_people`. """
+
+NGRAM_LENGTH = 3
+""" Length of character n-grams used both as blocking keys and for measuring
+    similarity of names. Trigrams are good enough for catching typos and
+    different transliterations of the same name. """
+
+_id_pattern = re.compile(r'^\s*(?:[HT]ID\s*#?\s*)?(\d+)\s*$', re.IGNORECASE)
+
+
+def _prefix_search(identity_model, avatar_querysets, name_fields, term,
+                   limit):
+    """ Returns up to `limit` identities which have an avatar with any of
+        `name_fields` starting with `term`, most recently seen first. Every
+        avatar table is queried separately, so that each query is a simple
+        prefix scan over the name index.
+    """
+    found = []
+
+    match = _id_pattern.match(term)
+    if match:
+        found.append(int(match.group(1)))
+
+    condition = Q()
+    for field in name_fields:
+        condition |= Q(**{field + '__istartswith': term})
+
+    for queryset in avatar_querysets:
+        identity_ids = (queryset
+                        .filter(condition)
+                        .exclude(identity=None)
+                        .order_by('-tournament__opening_date')
+                        .values_list('identity_id', flat=True)[:limit])
+        found.extend(identity_ids)
+
+    # Remove duplicates while keeping the order.
+    seen = set()
+    found = [pk for pk in found if not (pk in seen or seen.add(pk))][:limit]
+
+    identities = (identity_model.objects
+                  .select_related('latest_tournament')
+                  .in_bulk(found))
+    return [identities[pk] for pk in found if pk in identities]
+
+
+def search_people(term, limit=SEARCH_LIMIT):
+    """ Finds person identities by a prefix of full or short name of any
+        participant, leader or juror they have ever been, or by identity
+        number like 'HID#42'.
+
+        :return: List of :class:`scifight.models.PersonIdentity` objects.
+    """
+    term = term.strip()
+    if not term:
+        return []
+    avatars = [models.Participant.objects,
+               models.Leader.objects,
+               models.Juror.objects]
+    return _prefix_search(models.PersonIdentity, avatars,
+                          ['full_name', 'short_name'], term, limit)
+
+
+def search_teams(term, limit=SEARCH_LIMIT):
+    """ Finds team identities by a prefix of any name the team has ever had,
+        or by identity number like 'TID#42'.
+
+        :return: List of :class:`scifight.models.TeamIdentity` objects.
+    """
+    term = term.strip()
+    if not term:
+        return []
+    return _prefix_search(models.TeamIdentity, [models.Team.objects],
+                          ['name'], term, limit)
+
+
+# --- Matching returning people across tournaments ---
+
+_PERSON_MODELS = (models.Participant, models.Leader, models.Juror)
+
+Match = collections.namedtuple('Match', ['avatar', 'identity_id', 'score'])
+""" Proposal to merge the person identity of `avatar` (participant, leader
+    or juror) into the identity with `identity_id`, with name similarity
+    `score`. The avatar is the one whose name matched best; other avatars
+    of the same identity are moved along with it. """
+
+
+def normalize_name(full_name):
+    """ Converts full name to a canonical form suitable for comparison. Names
+        are expected to follow "Last, First Middle" convention, which is also
+        assumed by 'autopopulate.js'; text after the comma but the first word
+        is ignored, as middle names are often omitted. Case, accents and
+        punctuation don't matter:
+
+        .. code-block:: none
+
+           Uskov, Grigory Konstantinovich   -> grigory uskov
+           Saint-Exupéry, Antoine           -> antoine saint exupery
+
+        Names without a comma are just normalized as a whole.
+    """
+    full_name = utils.convert_name(full_name) or full_name
+
+    decomposed = unicodedata.normalize('NFKD', full_name.lower())
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'\w+', stripped))
+
+
+def _ngrams(name):
+    padded = ' {} '.format(name)
+    return {padded[i:i + NGRAM_LENGTH]
+            for i in range(len(padded) - NGRAM_LENGTH + 1)}
+
+
+def _similarity(grams1, grams2):
+    # Dice coefficient is less harsh to short names than Jaccard index.
+    return 2.0 * len(grams1 & grams2) / (len(grams1) + len(grams2))
+
+
+class PeopleIndex(object):
+    """ In-memory index of historical people, that is, person identities with
+        all names and origins they have had in previous tournaments. Names
+        are split into n-grams, and each n-gram points to identities having
+        it, so finding candidates for a name requires looking only at
+        identities sharing at least a few n-grams with it instead of
+        comparing the name with everybody.
+
+        :param exclude_tournament: Tournament whose people are not indexed.
+    """
+
+    def __init__(self, exclude_tournament=None):
+        self.names   = collections.defaultdict(set)
+        self.origins = collections.defaultdict(set)
+        self.blocks  = collections.defaultdict(set)
+
+        for model in _PERSON_MODELS:
+            avatars = model.objects.exclude(identity=None)
+            if exclude_tournament is not None:
+                avatars = avatars.exclude(tournament=exclude_tournament)
+            rows = avatars.values_list('identity_id', 'full_name',
+                                       'origin_id')
+            for identity_id, full_name, origin_id in rows:
+                self.add(identity_id, full_name, origin_id)
+
+    def add(self, identity_id, full_name, origin_id=None):
+        grams = frozenset(_ngrams(normalize_name(full_name)))
+        if grams not in self.names[identity_id]:
+            self.names[identity_id].add(grams)
+            for gram in grams:
+                self.blocks[gram].add(identity_id)
+        if origin_id is not None:
+            self.origins[identity_id].add(origin_id)
+
+    def find(self, full_name, origin_id=None, threshold=MATCH_THRESHOLD):
+        """ Returns list of `(identity_id, score)` pairs for identities
+            whose names are similar to `full_name` at least as `threshold`,
+            best matches first. Matching origin slightly raises the score.
+        """
+        grams = _ngrams(normalize_name(full_name))
+        if not grams:
+            return []
+
+        shared = collections.Counter()
+        for gram in grams:
+            shared.update(self.blocks.get(gram, ()))
+
+        # Dice coefficient can't reach the threshold without sharing at least
+        # this many n-grams, so the rest of identities are not examined.
+        min_shared = threshold * len(grams) / 2.0
+
+        found = []
+        for identity_id, count in shared.items():
+            if count < min_shared:
+                continue
+            score = max(_similarity(grams, other)
+                        for other in self.names[identity_id])
+            if origin_id in self.origins[identity_id]:
+                score = min(1.0, score + 0.05)
+            if score >= threshold:
+                found.append((identity_id, score))
+
+        found.sort(key=lambda item: (-item[1], item[0]))
+        return found
+
+
+def match_people(tournament, threshold=MATCH_THRESHOLD):
+    """ Proposes links of people from the `tournament` roster to identities
+        of people known from other tournaments. Only identities which haven't
+        been used outside of the tournament are considered, as the others
+        are already linked, and each of them gets at most one proposal, the
+        best match of any of its avatars. As merging moves all avatars of an
+        identity, a target is never proposed if it already has an avatar in
+        the tournament of any kind the merged identity has here, or is
+        proposed for another identity with such an avatar.
+
+        :return: List of :class:`Match` tuples.
+    """
+    index = PeopleIndex(exclude_tournament=tournament)
+
+    taken = collections.defaultdict(set)
+    roster = collections.OrderedDict()
+    for model in _PERSON_MODELS:
+        avatars = list(model.objects.filter(tournament=tournament)
+                                    .exclude(identity=None)
+                                    .order_by('pk'))
+        taken[model] = {avatar.identity_id for avatar in avatars}
+        for avatar in avatars:
+            roster.setdefault(avatar.identity_id, []).append(avatar)
+
+    matches = []
+    for source_id, avatars in roster.items():
+        if source_id in index.names:
+            continue
+        best = {}
+        for avatar in avatars:
+            for identity_id, score in index.find(avatar.full_name,
+                                                 avatar.origin_id,
+                                                 threshold):
+                if identity_id not in best or score > best[identity_id][0]:
+                    best[identity_id] = (score, avatar)
+
+        kinds = {type(avatar) for avatar in avatars}
+        for identity_id, (score, avatar) in sorted(
+                best.items(), key=lambda item: (-item[1][0], item[0])):
+            if not any(identity_id in taken[kind] for kind in kinds):
+                matches.append(Match(avatar, identity_id, score))
+                for kind in kinds:
+                    taken[kind].add(identity_id)
+                break
+
+    return matches
+
+
+def merge_people(source_id, target_id):
+    """ Moves all avatars of person identity `source_id` to `target_id` and
+        deletes the former. Caller must ensure that this doesn't make two
+        avatars of the same kind in one tournament share an identity.
+    """
+    with transaction.atomic():
+        for model in _PERSON_MODELS:
+            model.objects.filter(identity_id=source_id) \
+                         .update(identity_id=target_id)
+        models.PersonIdentity.objects.filter(pk=source_id).delete()
+        for identity in models.PersonIdentity.objects.filter(pk=target_id):
+            identity.refresh_label()
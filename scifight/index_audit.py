@@ -0,0 +1,143 @@
+import collections
+import re
+
+from django.contrib import admin
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from scifight import links
+from scifight import models
+
+Finding = collections.namedtuple('Finding', ['url', 'table', 'problem',
+                                             'sql'])
+""" A query plan problem found by :func:`audit`: a full scan of a table or
+    sorting without an index ('filesort'), in a query made by the page at
+    `url`. """
+
+FULL_SCAN = "full scan"
+FILESORT = "filesort"
+
+_LIST_VIEWS = ['tournament', 'schedule', 'rooms', 'teams', 'participants',
+               'leaders', 'jury', 'problems', 'api_tournament',
+               'api_schedule', 'api_participants', 'api_marks',
+               'api_standings']
+
+_DETAIL_MODELS = [models.Fight, models.Room, models.Team, models.Participant,
+                  models.Leader, models.Juror, models.Problem]
+
+
+def public_urls(tournament):
+    """ Returns URLs of public pages of the `tournament`: every list page
+        and a page of the first object of every kind. """
+    urls = [reverse('index')]
+    urls.extend(reverse('scifight:' + view_name, args=[tournament.slug])
+                for view_name in _LIST_VIEWS)
+    for model in _DETAIL_MODELS:
+        obj = model.objects.for_tournament(tournament).for_display() \
+                           .first()
+        if obj is not None:
+            urls.append(links.model_url(obj))
+    return urls
+
+
+def admin_urls():
+    """ Returns URLs of changelists of all models registered in the admin
+        site. """
+    return [reverse('admin:{0}_{1}_changelist'.format(
+                model._meta.app_label, model._meta.model_name))
+            for model in admin.site._registry]
+
+
+def _explain_sqlite(cursor, sql):
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+    for row in cursor.fetchall():
+        detail = row[-1]
+        match = re.match(r'SCAN (?:TABLE )?(\w+)', detail)
+        if match and 'USING' not in detail:
+            yield match.group(1), FULL_SCAN
+        elif detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+            yield None, FILESORT
+
+
+def _explain_mysql(cursor, sql):
+    cursor.execute('EXPLAIN ' + sql)
+    columns = [column[0] for column in cursor.description]
+    for row in cursor.fetchall():
+        row = dict(zip(columns, row))
+        if row['type'] == 'ALL':
+            yield row['table'], FULL_SCAN
+        if 'Using filesort' in (row['Extra'] or ''):
+            yield row['table'], FILESORT
+
+
+def _explain_postgresql(cursor, sql):
+    cursor.execute('EXPLAIN ' + sql)
+    for line, in cursor.fetchall():
+        match = re.search(r'Seq Scan on (\w+)', line)
+        if match:
+            yield match.group(1), FULL_SCAN
+        elif line.strip().startswith('Sort '):
+            yield None, FILESORT
+
+
+_explainers = {
+    'sqlite':     _explain_sqlite,
+    'mysql':      _explain_mysql,
+    'postgresql': _explain_postgresql,
+}
+
+
+def explain(sql):
+    """ Returns a list of `(table, problem)` pairs found in the query plan
+        of `sql`. The table is None if the database doesn't tell it. """
+    explainer = _explainers.get(connection.vendor)
+    if explainer is None:
+        raise NotImplementedError("can't read query plans of '{0}' "
+                                  "database".format(connection.vendor))
+    with connection.cursor() as cursor:
+        return list(explainer(cursor, sql))
+
+
+def _page_queries(client, url):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    if response.status_code != 200:
+        raise ValueError("{0} returned status {1}".format(
+                         url, response.status_code))
+    return [query['sql'] for query in context.captured_queries
+            if query['sql'].lstrip().upper().startswith('SELECT')]
+
+
+def audit(tournament, user=None):
+    """ Requests all public pages of the `tournament` and, if `user` is
+        given, admin changelists as that user, and checks plans of all their
+        queries. Pages are rendered bypassing the cache, and all changes
+        made by requests (like sessions) are rolled back.
+
+        :return: List of :class:`Finding`, one for every problem of every
+            distinct query.
+    """
+    findings = []
+    dummy_cache = {'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    with override_settings(CACHES=dummy_cache,
+                           ALLOWED_HOSTS=['testserver']), \
+            transaction.atomic():
+        client = Client()
+        urls = public_urls(tournament)
+        if user is not None:
+            client.force_login(user)
+            urls += admin_urls()
+
+        seen = set()
+        for url in urls:
+            for sql in _page_queries(client, url):
+                if sql in seen:
+                    continue
+                seen.add(sql)
+                findings.extend(Finding(url, table, problem, sql)
+                                for table, problem in explain(sql))
+        transaction.set_rollback(True)
+    return findings
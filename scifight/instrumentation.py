@@ -0,0 +1,197 @@
+import collections
+import os
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connections
+from django.template.backends import django as django_backend
+
+SAMPLES_PER_VIEW = 1000
+""" Number of the latest requests kept for every view. Older requests are
+    dropped, so the store takes bounded memory and reflects recent
+    performance only. """
+
+FLUSH_INTERVAL = 30
+""" Time in seconds between copies of the store of a process into the
+    Django cache, where reports of all processes are merged. With a cache
+    shared by server processes (see `local_settings_example.py`) reports
+    cover the whole server, otherwise only the process serving them. """
+
+FLUSH_TIMEOUT = 24 * 60 * 60
+""" Time in seconds stores of processes are kept in the cache, so that
+    stores of finished processes eventually disappear from reports. """
+
+_PROCESSES_KEY = 'scifight:perf:processes'
+
+Sample = collections.namedtuple('Sample',
+                                ['queries', 'db_time', 'render_time',
+                                 'total_time'])
+""" Costs of a single request. Times are in seconds. """
+
+Row = collections.namedtuple('Row',
+                             ['view', 'requests', 'queries', 'max_queries',
+                              'db_time', 'render_time', 'total_time',
+                              'p95_time'])
+""" Summary of a view in :func:`summary`: number of requests, average and
+    maximum number of queries, average times and 95th percentile of the
+    total time. Times are in milliseconds. """
+
+_samples = collections.defaultdict(
+    lambda: collections.deque(maxlen=SAMPLES_PER_VIEW))
+_lock = threading.Lock()
+_last_flush = [time.time()]
+_local = threading.local()
+
+
+class Recording(object):
+    """ Costs of the request being served by the current thread. """
+
+    def __init__(self):
+        self.started = time.time()
+        self.render_time = 0.0
+        self.rendering = False
+        self.debug_cursors = {}
+        self.query_offsets = {}
+        # Connections log their queries only with a debug cursor, which is
+        # on with DEBUG=True only, unless forced.
+        for conn in connections.all():
+            self.debug_cursors[conn.alias] = conn.force_debug_cursor
+            conn.force_debug_cursor = True
+            self.query_offsets[conn.alias] = len(conn.queries_log)
+
+    def finish(self):
+        """ Stops recording and returns costs as :class:`Sample`. """
+        num_queries, db_time = 0, 0.0
+        for conn in connections.all():
+            if conn.alias not in self.query_offsets:
+                continue
+            queries = list(conn.queries_log)[self.query_offsets[conn.alias]:]
+            num_queries += len(queries)
+            db_time += sum(float(query['time']) for query in queries)
+            conn.force_debug_cursor = self.debug_cursors[conn.alias]
+        return Sample(num_queries, db_time, self.render_time,
+                      time.time() - self.started)
+
+
+def start():
+    """ Starts recording costs of the request served by the current
+        thread. """
+    _local.recording = Recording()
+
+
+def finish(view_name):
+    """ Stops recording costs of the current request and adds them to the
+        store under `view_name`. Does nothing if recording wasn't started. """
+    recording = getattr(_local, 'recording', None)
+    if recording is None:
+        return
+    _local.recording = None
+    sample = recording.finish()
+    with _lock:
+        _samples[view_name].append(sample)
+    if time.time() - _last_flush[0] >= FLUSH_INTERVAL:
+        flush()
+
+
+def discard():
+    """ Stops recording costs of the current request without storing
+        them. """
+    recording = getattr(_local, 'recording', None)
+    _local.recording = None
+    if recording is not None:
+        recording.finish()
+
+
+_original_render = django_backend.Template.render
+
+
+def _timed_render(self, context=None, request=None):
+    recording = getattr(_local, 'recording', None)
+    # Templates rendered from inside other templates are already counted.
+    if recording is None or recording.rendering:
+        return _original_render(self, context, request)
+    recording.rendering = True
+    started = time.time()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        recording.render_time += time.time() - started
+        recording.rendering = False
+
+
+def install():
+    """ Makes rendering of Django templates measured. Called once by
+        :class:`scifight.middleware.InstrumentationMiddleware` if
+        `SCIFIGHT_INSTRUMENTATION` setting is on. """
+    django_backend.Template.render = _timed_render
+
+
+def _process_key(pid):
+    return 'scifight:perf:process:{0}'.format(pid)
+
+
+def flush():
+    """ Copies the store of this process into the cache. """
+    _last_flush[0] = time.time()
+    with _lock:
+        samples = {view: list(view_samples)
+                   for view, view_samples in _samples.items()}
+    pid = os.getpid()
+    cache.set(_process_key(pid), samples, FLUSH_TIMEOUT)
+    processes = cache.get(_PROCESSES_KEY, set())
+    if pid not in processes:
+        cache.set(_PROCESSES_KEY, processes | {pid}, None)
+
+
+def reset():
+    """ Clears stores of this and all other processes. """
+    with _lock:
+        _samples.clear()
+    processes = cache.get(_PROCESSES_KEY, set())
+    cache.delete_many([_process_key(pid) for pid in processes])
+    cache.delete(_PROCESSES_KEY)
+
+
+def _collect():
+    # The store of this process is taken as is, stores of other processes
+    # are taken from the cache as of their last flush.
+    merged = collections.defaultdict(list)
+    processes = cache.get(_PROCESSES_KEY, set()) - {os.getpid()}
+    stored = cache.get_many([_process_key(pid) for pid in processes])
+    for samples in stored.values():
+        for view, view_samples in samples.items():
+            merged[view].extend(view_samples)
+    with _lock:
+        for view, view_samples in _samples.items():
+            merged[view].extend(view_samples)
+    return merged
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summary(order_by='total_time'):
+    """ Returns a list of :class:`Row` for every view with recorded
+        requests, sorted by `order_by` field, in descending order for
+        numbers. """
+    rows = []
+    for view, samples in _collect().items():
+        if not samples:
+            continue
+        count = len(samples)
+        rows.append(Row(
+            view        = view,
+            requests    = count,
+            queries     = sum(s.queries for s in samples) / count,
+            max_queries = max(s.queries for s in samples),
+            db_time     = 1000 * sum(s.db_time for s in samples) / count,
+            render_time = 1000 * sum(s.render_time for s in samples) / count,
+            total_time  = 1000 * sum(s.total_time for s in samples) / count,
+            p95_time    = 1000 * _percentile([s.total_time for s in samples],
+                                             0.95)))
+    rows.sort(key=lambda row: getattr(row, order_by),
+              reverse=(order_by != 'view'))
+    return rows
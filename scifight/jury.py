@@ -0,0 +1,222 @@
+import collections
+
+import numpy as np
+from django.db import transaction
+
+from scifight import models
+from scifight import page_cache
+
+CONFLICT_PENALTY = 1000
+""" Cost of a juror judging a team of their own origin, that is, a team whose
+    origin or any leader's origin has the same place name as the juror's. """
+
+REPEAT_PENALTY = 10
+""" Cost of a juror judging a team they have already judged in another
+    round, counted for every previous encounter. """
+
+_FILL_BONUS = 10 ** 6
+""" Bonus (negative cost) for taking a seat which must be taken to keep
+    panel sizes balanced. It's larger than any possible penalty, so balance
+    is never sacrificed to avoid conflicts. """
+
+Assignment = collections.namedtuple('Assignment',
+                                    ['panels', 'repeats', 'conflicts'])
+""" Result of :func:`make_assignment`. `panels` is a dictionary mapping fight
+    id to a list of juror ids, `repeats` is the number of repeated juror-team
+    encounters and `conflicts` is the number of juror-team origin conflicts.
+"""
+
+
+class JuryError(Exception):
+    """ Raised when jury can't be assigned, for example when a round has no
+        fights. """
+    pass
+
+
+def _place_key(place_name):
+    return place_name.strip().lower() if place_name else None
+
+
+def min_cost_assignment(cost):
+    """ Solves rectangular assignment problem with Hungarian algorithm in its
+        shortest augmenting path form, taking O(n^2 m) time for `n` rows and
+        `m` columns. The inner loop over columns is vectorized.
+
+        :param cost: NumPy array of shape (n, m) with n <= m.
+        :return: Array of n distinct column numbers, one for each row, with
+            the minimal total cost.
+    """
+    n, m = cost.shape
+    if n > m:
+        raise ValueError("more rows than columns")
+
+    # Index 0 stands for a fictitious column holding the row being added.
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of = np.zeros(m + 1, dtype=int)
+    way = np.zeros(m + 1, dtype=int)
+
+    for i in range(1, n + 1):
+        row_of[0] = i
+        j0 = 0
+        min_v = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = row_of[j0]
+            free = ~used[1:]
+
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < min_v[1:])
+            min_v[1:][better] = reduced[better]
+            way[1:][better] = j0
+
+            candidates = np.where(free, min_v[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+
+            used_columns = np.nonzero(used)[0]
+            u[row_of[used_columns]] += delta
+            v[used_columns] -= delta
+            min_v[1:][free] -= delta
+
+            j0 = j1
+            if row_of[j0] == 0:
+                break
+
+        # Flip the augmenting path.
+        while j0:
+            j1 = way[j0]
+            row_of[j0] = row_of[j1]
+            j0 = j1
+
+    result = np.zeros(n, dtype=int)
+    for j in np.nonzero(row_of[1:])[0]:
+        result[row_of[j + 1] - 1] = j
+    return result
+
+
+def make_assignment(juror_ids, fights, juror_origins=None, team_origins=None,
+                    previous_panels=()):
+    """ Assigns every juror to one of `fights`, so that panel sizes differ by
+        at most one, with the minimal total of :data:`CONFLICT_PENALTY` and
+        :data:`REPEAT_PENALTY` costs. As the cost of seating a juror doesn't
+        depend on other members of the panel, this is an assignment problem
+        of jurors to seats, and is solved exactly.
+
+        :param juror_ids: Ids of jurors to assign.
+        :param fights: Iterable of `(fight_id, team_ids)` pairs.
+        :param juror_origins: Dictionary mapping juror id to their origin key.
+        :param team_origins: Dictionary mapping team id to a set of origin
+            keys in conflict with it.
+        :param previous_panels: Iterable of `(team_ids, juror_ids)` pairs
+            for fights of other rounds.
+        :return: Object of :class:`Assignment`.
+    """
+    juror_ids = list(juror_ids)
+    fights = [(fight_id, [t for t in team_ids if t is not None])
+              for fight_id, team_ids in fights]
+    juror_origins = juror_origins or {}
+    team_origins = team_origins or {}
+    if not fights:
+        raise JuryError("there are no fights to assign jury to")
+
+    met = collections.Counter()
+    for team_ids, panel in previous_panels:
+        for juror_id in panel:
+            for team_id in team_ids:
+                if team_id is not None:
+                    met[juror_id, team_id] += 1
+
+    num_jurors, num_fights = len(juror_ids), len(fights)
+    repeats = np.zeros((num_jurors, num_fights), dtype=int)
+    conflicts = np.zeros((num_jurors, num_fights), dtype=int)
+    for j, juror_id in enumerate(juror_ids):
+        origin = juror_origins.get(juror_id)
+        for f, (_, team_ids) in enumerate(fights):
+            repeats[j, f] = sum(met[juror_id, t] for t in team_ids)
+            if origin is not None:
+                conflicts[j, f] = sum(origin in team_origins.get(t, ())
+                                      for t in team_ids)
+    cost = CONFLICT_PENALTY * conflicts + REPEAT_PENALTY * repeats
+
+    # Every fight has `base` seats which must be taken and one spare seat;
+    # `num_jurors % num_fights` spare seats end up being taken.
+    base = num_jurors // num_fights
+    seat_fights = np.repeat(np.arange(num_fights), base + 1)
+    seat_cost = cost[:, seat_fights].astype(float)
+    seat_cost[:, np.arange(len(seat_fights)) % (base + 1) != base] \
+        -= _FILL_BONUS
+
+    seats = min_cost_assignment(seat_cost) if num_jurors else []
+
+    panels = collections.OrderedDict((fight_id, []) for fight_id, _ in fights)
+    total_repeats = total_conflicts = 0
+    for j, seat in enumerate(seats):
+        f = seat_fights[seat]
+        panels[fights[f][0]].append(juror_ids[j])
+        total_repeats += repeats[j, f]
+        total_conflicts += conflicts[j, f]
+
+    return Assignment(panels, int(total_repeats), int(total_conflicts))
+
+
+def assign_round(tournament_round):
+    """ Assigns all jurors of the tournament to fights of `tournament_round`,
+        taking jury of other rounds into account, and saves the panels. The
+        round's fights must have no jury yet.
+
+        :return: Object of :class:`Assignment`.
+    """
+    tournament = tournament_round.tournament
+    through = models.Fight.jury.through
+
+    if through.objects.filter(fight__round=tournament_round).exists():
+        raise JuryError("round %s already has jury" % tournament_round)
+
+    juror_origins = {
+        juror_id: _place_key(place_name)
+        for juror_id, place_name in models.Juror.objects
+        .filter(tournament=tournament)
+        .values_list('id', 'origin__place_name')}
+
+    team_origins = collections.defaultdict(set)
+    for team_id, place_name in models.Team.objects \
+            .filter(tournament=tournament) \
+            .values_list('id', 'origin__place_name'):
+        team_origins[team_id].add(_place_key(place_name))
+    for team_id, place_name in models.Leader.objects \
+            .filter(tournament=tournament) \
+            .values_list('team_id', 'origin__place_name'):
+        team_origins[team_id].add(_place_key(place_name))
+
+    fight_teams = {}
+    fights = []
+    for row in models.Fight.objects \
+            .filter(tournament=tournament) \
+            .order_by('round', 'room') \
+            .values_list('id', 'round_id', 'team1_id', 'team2_id',
+                         'team3_id', 'team4_id'):
+        fight_teams[row[0]] = row[2:]
+        if row[1] == tournament_round.pk:
+            fights.append((row[0], row[2:]))
+
+    previous = collections.defaultdict(list)
+    for fight_id, juror_id in through.objects \
+            .filter(fight__tournament=tournament) \
+            .values_list('fight_id', 'juror_id'):
+        previous[fight_id].append(juror_id)
+
+    assignment = make_assignment(
+        sorted(juror_origins), fights, juror_origins, team_origins,
+        [(fight_teams[fight_id], panel)
+         for fight_id, panel in previous.items()])
+
+    with transaction.atomic():
+        through.objects.bulk_create([
+            through(fight_id=fight_id, juror_id=juror_id)
+            for fight_id, panel in assignment.panels.items()
+            for juror_id in panel])
+        page_cache.bump_tournament(tournament.pk)
+
+    return assignment
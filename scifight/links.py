@@ -0,0 +1,122 @@
+import logging
+
+from django.core.urlresolvers import (reverse, NoReverseMatch,
+                                      get_script_prefix, get_urlconf)
+from django.utils.http import urlquote
+
+from scifight import models
+
+logger = logging.getLogger(__name__)
+
+# Values which are passed to 'reverse()' once per view to obtain a URL
+# template. They must match URL patterns of corresponding arguments, and
+# must never occur in any other part of URL.
+_SLUG_MARKER = "scifightslugmarker"
+_TEXT_MARKER = "scifighttextmarker"
+_NUM_MARKER  = "918273645"
+
+_single_arg_views = {
+#   Model type           View name                 Field to pass as arg
+    models.Participant: ("scifight:participant",   'id'),
+    models.Leader:      ("scifight:leader",        'id'),
+    models.Juror:       ("scifight:juror",         'id'),
+    models.Room:        ("scifight:room",          'id'),
+    models.Fight:       ("scifight:fight",         'id'),
+    models.Problem:     ("scifight:problem",       'problem_num')
+}
+
+_url_templates = {}
+""" Cache of URL templates, mapping a tuple of URL configuration, script
+    prefix and view name to format string with '{0}' standing for tournament
+    slug and '{1}' standing for the second argument, if any. """
+
+_tournament_slugs = {}
+""" Process-wide cache mapping tournament id to its slug. It's cleared by
+    :mod:`scifight.signals` whenever a tournament is saved or deleted. Note
+    that other processes are not notified, so renaming tournament's slug on
+    a live multi-process server may require a restart. """
+
+
+def _url_template(view_name, arg_marker):
+    key = (get_urlconf(), get_script_prefix(), view_name)
+    template = _url_templates.get(key)
+    if template is None:
+        args = [_SLUG_MARKER] + ([arg_marker] if arg_marker else [])
+        url = reverse(view_name, args=args)
+        template = (url.replace('{', '{{').replace('}', '}}')
+                       .replace(_SLUG_MARKER, '{0}'))
+        if arg_marker:
+            template = template.replace(arg_marker, '{1}')
+        _url_templates[key] = template
+    return template
+
+
+def _format_url(view_name, slug, arg=None, arg_marker=None):
+    try:
+        template = _url_template(view_name, arg_marker)
+    except NoReverseMatch:
+        logger.error('NoReverseMatch: view = %s slug = %s arg = %s'
+                     % (view_name, slug, arg))
+        return ''
+    return template.format(urlquote(slug), urlquote(str(arg)))
+
+
+def forget_tournaments():
+    """ Clears cached tournament slugs. """
+    _tournament_slugs.clear()
+
+
+def tournament_slug(model):
+    """ Returns slug of the tournament `model` belongs to without touching
+        the database, if possible. The slug is taken either from already
+        loaded `model.tournament` object or from process-wide cache, which
+        is filled for all tournaments at once on a cache miss.
+    """
+    cache_name = type(model)._meta.get_field('tournament').get_cache_name()
+    tournament = getattr(model, cache_name, None)
+    if tournament is not None:
+        return tournament.slug
+    return slug_by_id(model.tournament_id)
+
+
+def slug_by_id(tournament_id):
+    """ Returns slug of the tournament with `tournament_id` from process-wide
+        cache, which is filled for all tournaments at once on a cache miss.
+    """
+    slug = _tournament_slugs.get(tournament_id)
+    if slug is None:
+        _tournament_slugs.update(models.Tournament.objects
+                                 .values_list('id', 'slug'))
+        slug = _tournament_slugs.get(tournament_id)
+    return slug
+
+
+def model_url(model):
+    """ Returns URL of the public page of the `model`, which must be one of
+        SciFight models having such a page, or an empty string otherwise.
+        Unlike plain `reverse()`, this function resolves each view only once
+        per process and then just formats strings, and doesn't need related
+        tournament object to be loaded. See also
+        :func:`scifight.templatetags.scifight_url.scifight_url`.
+    """
+    model_type = type(model)
+
+    if model_type == models.Tournament:
+        return _format_url('scifight:tournament', model.slug)
+
+    if model_type == models.Team:
+        if model.slug:
+            return _format_url('scifight:team_slug', tournament_slug(model),
+                               model.slug, _TEXT_MARKER)
+        else:
+            return _format_url('scifight:team_id', tournament_slug(model),
+                               model.id, _NUM_MARKER)
+
+    if model_type in _single_arg_views:
+        (view_name, field_name) = _single_arg_views[model_type]
+        return _format_url(view_name, tournament_slug(model),
+                           getattr(model, field_name), _NUM_MARKER)
+
+    logger.error("unsupported model passed: %s" % model_type)
+    return ''
+
@@ -0,0 +1,175 @@
+import collections
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from scifight import models
+
+CACHE_TIMEOUT = 6 * 60 * 60
+""" Time in seconds a published fight snapshot is kept in the cache. It's
+    long enough to cover a day of fights; snapshots of fights nobody has
+    watched for that long are just computed again on demand. """
+
+POLL_INTERVAL = 1.0
+""" Time in seconds between checks of the cache for a new snapshot by
+    an event stream. Checking costs a single cache read. """
+
+POLL_DELAY = 5
+""" Time in seconds a viewer waits between requests for the snapshot of
+    a fight. Polling is the default way of following fights: every request
+    is answered right away, usually with '304 Not Modified' and without
+    touching the database, so viewers don't hold workers of a synchronous
+    server. """
+
+KEEPALIVE_INTERVAL = 15.0
+""" Time in seconds between comments sent to idle event streams, so that
+    proxies don't close them. """
+
+STREAM_DURATION = 5 * 60
+""" Time in seconds an event stream is served before it's closed. Browsers
+    reconnect automatically, passing the last received version, so this
+    only limits how long a single connection lasts. Streams are served only
+    with `SCIFIGHT_LIVE_EVENTS` setting on, see project settings. """
+
+PRIVATE_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+""" Cache backends which don't share data between server processes.
+    Snapshots published by one process are not seen by viewers served by
+    others with them, so they are kept only for :data:`POLL_DELAY` and
+    then computed again; see also :mod:`scifight.checks`. """
+
+Entry = collections.namedtuple('Entry', ['version', 'tournament', 'data'])
+""" Published snapshot of a fight: its version, id of the tournament of the
+    fight, and the snapshot itself as JSON text. """
+
+
+def _key(fight_id):
+    return "scifight:live:fight:{0}".format(fight_id)
+
+
+def _timeout():
+    if settings.CACHES['default']['BACKEND'] in PRIVATE_CACHE_BACKENDS:
+        return POLL_DELAY
+    return CACHE_TIMEOUT
+
+
+def snapshot(fight_id):
+    """ Computes the current state of the fight as a JSON-serializable
+        dictionary: its status and times, the current (last entered) stage,
+        and running points of its teams. Takes three queries. Returns None
+        if the fight doesn't exist.
+    """
+    fight = (models.Fight.objects
+             .select_related('team1', 'team2', 'team3', 'team4')
+             .filter(pk=fight_id)
+             .first())
+    if fight is None:
+        return None
+
+    stage = (models.FightStage.objects
+             .filter(fight_id=fight_id)
+             .select_related('problem', 'reporter', 'opponent', 'reviewer')
+             .order_by('-stage_num')
+             .first())
+    points = dict(models.FightScore.objects
+                  .filter(fight_id=fight_id)
+                  .values_list('team_id', 'points'))
+
+    teams = [team for team in (fight.team1, fight.team2,
+                               fight.team3, fight.team4) if team]
+    return {
+        "fight":       fight.pk,
+        "tournament":  fight.tournament_id,
+        "status":      fight.status,
+        "status_text": fight.get_status_display(),
+        "start_time":  fight.start_time,
+        "stop_time":   fight.stop_time,
+        "stage": stage and {
+            "num":      stage.stage_num,
+            "problem":  str(stage.problem),
+            "reporter": stage.reporter.short_name,
+            "opponent": stage.opponent.short_name,
+            "reviewer": stage.reviewer and stage.reviewer.short_name,
+        },
+        "teams": [{"id":     team.pk,
+                   "name":   team.name,
+                   "points": round(points.get(team.pk, 0.0), 2)}
+                  for team in teams],
+    }
+
+
+def _serialize(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+
+
+def _new_version(old_version=0):
+    # Versions are based on time, so that they keep growing even if the
+    # snapshot is evicted from the cache and published anew.
+    return max(old_version + 1, int(time.time() * 1000))
+
+
+def current(fight_id):
+    """ Returns the latest published :class:`Entry` of the fight, or None if
+        the fight doesn't exist. The snapshot is computed and published if
+        nobody has asked for it yet. """
+    entry = cache.get(_key(fight_id))
+    if entry is None:
+        data = snapshot(fight_id)
+        if data is None:
+            return None
+        entry = Entry(_new_version(), data["tournament"], _serialize(data))
+        cache.add(_key(fight_id), entry, _timeout())
+    return entry
+
+
+def publish(fight_id):
+    """ Recomputes the snapshot of the fight and publishes it with a new
+        version, but only if it differs from the published one, so that
+        viewers are not woken up by saves which change nothing they see.
+        Fights which nobody watches are skipped. """
+    entry = cache.get(_key(fight_id))
+    if entry is None:
+        return
+    data = snapshot(fight_id)
+    if data is None:
+        cache.delete(_key(fight_id))
+        return
+    new_data = _serialize(data)
+    if new_data != entry.data:
+        cache.set(_key(fight_id),
+                  Entry(_new_version(entry.version), entry.tournament,
+                        new_data),
+                  _timeout())
+
+
+def publish_on_commit(fight_id):
+    """ Schedules :func:`publish` after the current transaction is
+        committed, so that viewers never see uncommitted data. """
+    transaction.on_commit(lambda: publish(fight_id))
+
+
+def event_stream(fight_id, since=0):
+    """ Yields server-sent events with fight snapshots: the current one
+        right away (unless the client already has it), and then every new
+        version as soon as it's published. """
+    started = last_sent = time.time()
+    while time.time() - started < STREAM_DURATION:
+        entry = current(fight_id)
+        if entry is None:
+            break
+        if entry.version > since:
+            since, last_sent = entry.version, time.time()
+            yield "id: {0}\ndata: {1}\n\n".format(entry.version, entry.data)
+        elif time.time() - last_sent >= KEEPALIVE_INTERVAL:
+            last_sent = time.time()
+            yield ": keep-alive\n\n"
+        else:
+            time.sleep(POLL_INTERVAL)
+    # Tell the browser to reconnect soon after the stream is closed.
+    yield "retry: 1000\n\n"
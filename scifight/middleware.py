@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from scifight import instrumentation
+from scifight import tournament_cache
+
+
+class InstrumentationMiddleware(object):
+    """ Records the number of SQL queries, database time, template rendering
+        time and total time of every request, grouped by URL name, into the
+        store of :mod:`scifight.instrumentation`. Should go first in
+        `MIDDLEWARE_CLASSES`, so that costs of other middleware are counted
+        too. Streaming responses, like live fight events, are not recorded,
+        as their time is the time the client stays connected. Does nothing
+        unless `SCIFIGHT_INSTRUMENTATION` setting is on. """
+
+    def __init__(self):
+        if not settings.SCIFIGHT_INSTRUMENTATION:
+            raise MiddlewareNotUsed()
+        instrumentation.install()
+
+    def process_request(self, request):
+        instrumentation.start()
+
+    def process_response(self, request, response):
+        if response.streaming:
+            instrumentation.discard()
+            return response
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else '<unresolved>'
+        instrumentation.finish(view_name)
+        return response
+
+
+class TournamentMiddleware(object):
+    """ Resolves the tournament of views taking `tournament_slug` argument
+        once per request, from a process-wide cache (see
+        :mod:`scifight.tournament_cache`), and sets it as
+        `request.tournament`; it's None for other views and for unknown
+        slugs. """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        slug = view_kwargs.get('tournament_slug')
+        if slug is None:
+            request.tournament = None
+        else:
+            tournament_cache.for_request(request, slug)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 13:58
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scifight', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FightScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.FloatField()),
+                ('fight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scifight.Fight')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='scifight.Team')),
+                ('tournament', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scifight.Tournament')),
+            ],
+            options={
+                'ordering': ['fight', 'team'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StageScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.PositiveSmallIntegerField()),
+                ('points', models.FloatField()),
+                ('fight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scifight.Fight')),
+                ('fight_stage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scifight.FightStage')),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='scifight.Participant')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='scifight.Team')),
+                ('tournament', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scifight.Tournament')),
+            ],
+            options={
+                'ordering': ['fight_stage', 'role'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TeamScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.FloatField()),
+                ('team', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='score', to='scifight.Team')),
+                ('tournament', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scifight.Tournament')),
+            ],
+            options={
+                'ordering': ['tournament', '-points'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='stagescore',
+            unique_together=set([('fight_stage', 'role')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='fightscore',
+            unique_together=set([('fight', 'team')]),
+        ),
+    ]
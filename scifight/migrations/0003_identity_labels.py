@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 14:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_labels(apps, schema_editor):
+    # Walk avatars from the oldest tournament to the newest one, so that
+    # the last written label of each identity is the most recent one.
+    avatar_models = [('TeamIdentity',   'Team',        'name'),
+                     ('PersonIdentity', 'Juror',       'short_name'),
+                     ('PersonIdentity', 'Leader',      'short_name'),
+                     ('PersonIdentity', 'Participant', 'short_name')]
+
+    labels = {}
+    for identity_name, model_name, name_field in avatar_models:
+        avatars = (apps.get_model('scifight', model_name).objects
+                   .exclude(identity=None)
+                   .values_list('identity_id', name_field, 'tournament_id',
+                                'tournament__opening_date'))
+        for identity_id, name, tournament_id, date in avatars:
+            key = (identity_name, identity_id)
+            if key not in labels or labels[key][2] <= date:
+                labels[key] = (name, tournament_id, date)
+
+    for (identity_name, identity_id), (name, tournament_id, _) \
+            in labels.items():
+        (apps.get_model('scifight', identity_name).objects
+         .filter(pk=identity_id)
+         .update(latest_name=name, latest_tournament_id=tournament_id))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scifight', '0002_standings_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='personidentity',
+            name='latest_name',
+            field=models.CharField(blank=True, editable=False, max_length=140),
+        ),
+        migrations.AddField(
+            model_name='personidentity',
+            name='latest_tournament',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='scifight.Tournament'),
+        ),
+        migrations.AddField(
+            model_name='teamidentity',
+            name='latest_name',
+            field=models.CharField(blank=True, editable=False, max_length=140),
+        ),
+        migrations.AddField(
+            model_name='teamidentity',
+            name='latest_tournament',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='scifight.Tournament'),
+        ),
+        migrations.RunPython(fill_labels, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 14:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scifight', '0003_identity_labels'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='juror',
+            name='full_name',
+            field=models.CharField(db_index=True, max_length=140),
+        ),
+        migrations.AlterField(
+            model_name='juror',
+            name='short_name',
+            field=models.CharField(db_index=True, max_length=140),
+        ),
+        migrations.AlterField(
+            model_name='leader',
+            name='full_name',
+            field=models.CharField(db_index=True, max_length=140),
+        ),
+        migrations.AlterField(
+            model_name='leader',
+            name='short_name',
+            field=models.CharField(db_index=True, max_length=140),
+        ),
+        migrations.AlterField(
+            model_name='participant',
+            name='full_name',
+            field=models.CharField(db_index=True, max_length=140),
+        ),
+        migrations.AlterField(
+            model_name='participant',
+            name='short_name',
+            field=models.CharField(db_index=True, max_length=140),
+        ),
+        migrations.AlterField(
+            model_name='team',
+            name='name',
+            field=models.CharField(db_index=True, max_length=140),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.7 on 2026-10-18 14:25
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scifight', '0005_tournament_last_modified'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='fight',
+            index_together=set([('tournament', 'round', 'room')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='juror',
+            index_together=set([('tournament', 'full_name')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='jurorpoints',
+            index_together=set([('fight_stage', 'juror', 'reporter_mark', 'opponent_mark', 'reviewer_mark')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='leader',
+            index_together=set([('tournament', 'full_name')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='participant',
+            index_together=set([('tournament', 'full_name')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='room',
+            index_together=set([('tournament', 'sorting_key')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='team',
+            index_together=set([('tournament', 'name')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='teamscore',
+            index_together=set([('tournament', 'points')]),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from scifight import scoring
+
+
+def fill_standings(apps, schema_editor):
+    # Same as 'rebuild_standings' command, but with historical models, so
+    # that only pure functions of 'scoring' are used.
+    tables = [('StageScore', ('fight_stage_id', 'role')),
+              ('FightScore', ('fight_id', 'team_id')),
+              ('TeamScore',  ('team_id',))]
+    juror_points = apps.get_model('scifight', 'JurorPoints')
+
+    for tournament in apps.get_model('scifight', 'Tournament').objects.all():
+        rows = list(juror_points.objects
+                    .filter(fight_stage__fight__tournament=tournament)
+                    .order_by()
+                    .values_list(*scoring._COLUMNS))
+        expected = scoring.expected_rows(tournament,
+                                         scoring.standings_from_rows(rows))
+        for (model_name, key_fields), wanted in zip(tables, expected):
+            model = apps.get_model('scifight', model_name)
+            model.objects.filter(tournament=tournament).delete()
+            model.objects.bulk_create([
+                model(**dict(zip(key_fields, key), **values))
+                for key, values in wanted.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scifight', '0006_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_standings, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+import collections
+
 from django.db   import models
 from django.core import exceptions
 from django.utils import timezone
@@ -23,44 +25,123 @@ GRADE_LENGTH = 20
 """ Maximum length of the `grade` field. This value should be long enough to
     hold a number plus possible brief one-word explanation. """
 
+MIN_MARK = 1
+MAX_MARK = 10
+""" Range of marks a juror may give, inclusive. """
+
+
+class TournamentQuerySet(models.QuerySet):
+    """ QuerySet of a model belonging to a tournament. The model may set
+        `tournament_path` to the lookup reaching its tournament, if it has no
+        `tournament` field of its own, and `display_select_related` to
+        relations read when its objects are shown on pages. """
+
+    def for_tournament(self, tournament):
+        """ Returns objects of the `tournament` (an object or an id). """
+        path = getattr(self.model, "tournament_path", "tournament")
+        return self.filter(**{path: tournament})
+
+    def for_display(self):
+        """ Returns objects with all relations shown on pages loaded by the
+            same query, including tournaments needed to build their URLs.
+            Columns are not deferred, as pages show most of them. """
+        return self.select_related(
+            *getattr(self.model, "display_select_related", ()))
+
 
 class TeamIdentity(models.Model):
+    # For people to be able to guess where *exactly* they may have seen this
+    # team before, its string representation shows the latest known name and
+    # tournament it participated in. These are cached here to avoid queries
+    # when rendering long lists of identities, and are kept up to date by
+    # 'scifight.signals' whenever teams are saved or deleted.
+    latest_name       = models.CharField(max_length=NAME_LENGTH, blank=True,
+                                         editable=False)
+    latest_tournament = models.ForeignKey('Tournament', related_name="+",
+                                          null=True, blank=True,
+                                          editable=False,
+                                          on_delete=models.SET_NULL)
+
+    def note_avatar(self, team):
+        """ Updates cached label if `team` is the most recent one. """
+        _note_avatar(self, team.name, team.tournament)
+
+    def refresh_label(self):
+        """ Recomputes cached label from scratch. """
+        latest_team = _get_most_recent(self.teams)
+        _set_label(self, latest_team and latest_team.name,
+                         latest_team and latest_team.tournament)
+
+    str_select_related = ("latest_tournament",)
 
     def __str__(self):
-        # For people to be able to guess where *exactly* they may have seen
-        # this team before, show it's latest known name and tournament it
-        # participated in.
-        latest_team = self.teams.order_by("-tournament__opening_date").first()
-        if latest_team:
+        if self.latest_name and self.latest_tournament:
             return _tr("TID#{0}: «{1}» on {2}").format(self.pk,
-                                             latest_team.name,
-                                             latest_team.tournament.short_name)
+                                             self.latest_name,
+                                             self.latest_tournament.short_name)
         else:
             return _tr("TID#{0}").format(self.pk)
 
 
 class PersonIdentity(models.Model):
+    # See comment in 'TeamIdentity'.
+    latest_name       = models.CharField(max_length=NAME_LENGTH, blank=True,
+                                         editable=False)
+    latest_tournament = models.ForeignKey('Tournament', related_name="+",
+                                          null=True, blank=True,
+                                          editable=False,
+                                          on_delete=models.SET_NULL)
+
+    def note_avatar(self, person):
+        """ Updates cached label if `person` (participant, leader or juror)
+            is the most recent avatar of this identity. """
+        _note_avatar(self, person.short_name, person.tournament)
+
+    def refresh_label(self):
+        """ Recomputes cached label from scratch. """
+        avatars = {_get_most_recent(self.jury),
+                   _get_most_recent(self.leaders),
+                   _get_most_recent(self.participants)} - {None}
+
+        latest_avatar = None
+        if avatars:
+            latest_avatar = max(avatars,
+                                key=lambda a: a.tournament.opening_date)
+
+        _set_label(self, latest_avatar and latest_avatar.short_name,
+                         latest_avatar and latest_avatar.tournament)
+
+    str_select_related = ("latest_tournament",)
 
     def __str__(self):
+        if self.latest_name and self.latest_tournament:
+            return _tr("HID#{0}: {1} on {2}").format(self.pk,
+                                            self.latest_name,
+                                            self.latest_tournament.short_name)
+        else:
+            return _tr("HID#{0}").format(self.pk)
 
-        # Shorthand function. Will return 'None' if nothing is found.
-        def get_most_recent(objs: models.manager.Manager):
-            return objs.order_by("-tournament__opening_date").first()
 
-        latest_juror       = get_most_recent(self.jury)
-        latest_leader      = get_most_recent(self.leaders)
-        latest_participant = get_most_recent(self.participants)
+# Shorthand function. Will return 'None' if nothing is found.
+def _get_most_recent(objs: models.manager.Manager):
+    return (objs.select_related("tournament")
+                .order_by("-tournament__opening_date")
+                .first())
 
-        avatars = {latest_juror, latest_leader, latest_participant}
-        avatars.remove(None)
 
-        if not avatars:
-            return _tr("HID#{0}").format(self.pk)
+def _set_label(identity, name, tournament):
+    identity.latest_name       = name or ""
+    identity.latest_tournament = tournament
+    type(identity).objects.filter(pk=identity.pk).update(
+        latest_name       = identity.latest_name,
+        latest_tournament = tournament)
+
 
-        latest_avatar = max(avatars, key=lambda a: a.tournament.closing_date)
-        return _tr("HID#{0}: {1} on {2}").format(self.pk,
-                                        latest_avatar.short_name,
-                                        latest_avatar.tournament.short_name)
+def _note_avatar(identity, name, tournament):
+    latest = identity.latest_tournament
+    if latest is None or tournament.opening_date >= latest.opening_date:
+        if identity.latest_name != name or latest != tournament:
+            _set_label(identity, name, tournament)
 
 
 class TeamOrigin(models.Model):
@@ -95,6 +176,10 @@ class Tournament(models.Model):
     opening_date  = models.DateField()
     closing_date  = models.DateField(blank=True, null=True)
 
+    # Time of the last change of anything shown on public pages of the
+    # tournament, maintained by 'scifight.page_cache'.
+    last_modified = models.DateTimeField(auto_now=True)
+
     def __str__(self):
         return self.short_name
 
@@ -106,12 +191,15 @@ class Team(models.Model):
     tournament    = models.ForeignKey(Tournament)
     identity      = models.ForeignKey(TeamIdentity, related_name="teams",
                                       null=True, blank=True)
-    name          = models.CharField(max_length=NAME_LENGTH)
+    name          = models.CharField(max_length=NAME_LENGTH, db_index=True)
     slug          = models.SlugField(max_length=SLUG_LENGTH,
                                      null=True, blank=True)
     description   = models.TextField(max_length=TEXT_LENGTH, blank=True)
     origin        = models.ForeignKey(TeamOrigin, null=True, blank=True)
 
+    objects       = TournamentQuerySet.as_manager()
+    display_select_related = ("tournament", "origin")
+
     def clean(self):
         super().clean()
 
@@ -136,6 +224,7 @@ class Team(models.Model):
     class Meta:
         ordering        = ['tournament', 'name']
         unique_together = ('tournament', 'slug')
+        index_together  = ('tournament', 'name')
 
 
 class Participant(models.Model):
@@ -143,13 +232,16 @@ class Participant(models.Model):
     identity      = models.ForeignKey(PersonIdentity,
                                       related_name="participants",
                                       null=True, blank=True)
-    full_name     = models.CharField(max_length=NAME_LENGTH)
-    short_name    = models.CharField(max_length=NAME_LENGTH)
+    full_name     = models.CharField(max_length=NAME_LENGTH, db_index=True)
+    short_name    = models.CharField(max_length=NAME_LENGTH, db_index=True)
     origin        = models.ForeignKey(PersonOrigin, null=True, blank=True)
     grade         = models.CharField(max_length=GRADE_LENGTH, blank=True)
     team          = models.ForeignKey(Team)
     is_captain    = models.BooleanField()
 
+    objects       = TournamentQuerySet.as_manager()
+    display_select_related = ("tournament", "origin", "team__tournament")
+
     def fill_tournament(self):
         self.tournament = self.team.tournament
 
@@ -168,17 +260,21 @@ class Participant(models.Model):
     class Meta:
         ordering        = ['tournament', 'full_name']
         unique_together = ('tournament', 'identity')
+        index_together  = ('tournament', 'full_name')
 
 
 class Leader(models.Model):
     tournament    = models.ForeignKey(Tournament)
     identity      = models.ForeignKey(PersonIdentity, related_name="leaders",
                                       null=True, blank=True)
-    full_name     = models.CharField(max_length=NAME_LENGTH)
-    short_name    = models.CharField(max_length=NAME_LENGTH)
+    full_name     = models.CharField(max_length=NAME_LENGTH, db_index=True)
+    short_name    = models.CharField(max_length=NAME_LENGTH, db_index=True)
     origin        = models.ForeignKey(PersonOrigin, null=True, blank=True)
     team          = models.ForeignKey(Team)
 
+    objects       = TournamentQuerySet.as_manager()
+    display_select_related = ("tournament", "origin", "team__tournament")
+
     def fill_tournament(self):
         self.tournament = self.team.tournament
 
@@ -197,16 +293,20 @@ class Leader(models.Model):
     class Meta:
         ordering        = ['tournament', 'full_name']
         unique_together = ('tournament', 'identity')
+        index_together  = ('tournament', 'full_name')
 
 
 class Juror(models.Model):
     tournament    = models.ForeignKey(Tournament)
     identity      = models.ForeignKey(PersonIdentity, related_name="jury",
                                       null=True, blank=True)
-    full_name     = models.CharField(max_length=NAME_LENGTH)
-    short_name    = models.CharField(max_length=NAME_LENGTH)
+    full_name     = models.CharField(max_length=NAME_LENGTH, db_index=True)
+    short_name    = models.CharField(max_length=NAME_LENGTH, db_index=True)
     origin        = models.ForeignKey(PersonOrigin, null=True, blank=True)
 
+    objects       = TournamentQuerySet.as_manager()
+    display_select_related = ("tournament", "origin")
+
     def save(self, *args, **kwargs):
         if self.identity is None:
             new_identity = PersonIdentity()
@@ -222,6 +322,7 @@ class Juror(models.Model):
     class Meta:
         ordering        = ['tournament', 'full_name']
         unique_together = ('tournament', 'identity')
+        index_together  = ('tournament', 'full_name')
 
 
 class Room(models.Model):
@@ -230,12 +331,16 @@ class Room(models.Model):
     sorting_key   = models.FloatField(null=True, blank=True)
     slug          = models.SlugField(max_length=SLUG_LENGTH)
 
+    objects       = TournamentQuerySet.as_manager()
+    display_select_related = ("tournament",)
+
     def __str__(self):
         return self.designation
 
     class Meta:
         ordering        = ['sorting_key']
         unique_together = ('tournament', 'slug')
+        index_together  = ('tournament', 'sorting_key')
 
 
 class Problem(models.Model):
@@ -244,6 +349,9 @@ class Problem(models.Model):
     title         = models.CharField(max_length=NAME_LENGTH)
     description   = models.TextField(max_length=TEXT_LENGTH, blank=True)
 
+    objects       = TournamentQuerySet.as_manager()
+    display_select_related = ("tournament",)
+
     def __str__(self):
         return _tr("#{0}. {1}").format(self.problem_num, self.title)
 
@@ -258,6 +366,9 @@ class TournamentRound(models.Model):
     opening_time  = models.DateTimeField()
     closing_time  = models.DateTimeField()
 
+    objects       = TournamentQuerySet.as_manager()
+    display_select_related = ("tournament",)
+
     def __str__(self):
         return str(self.round_num)
 
@@ -294,6 +405,9 @@ class Fight(models.Model):
                                             null=True, blank=True)
     jury          = models.ManyToManyField(Juror, blank=True)
 
+    objects       = TournamentQuerySet.as_manager()
+    display_select_related = ("tournament", "round", "room__tournament")
+
     def clean(self):
         super().clean()
 
@@ -321,12 +435,19 @@ class Fight(models.Model):
             msg = _tr('Teams belong to different tournaments!')
             raise exceptions.ValidationError(msg)
 
+    str_select_related = ("round", "room")
+    """ Relations read by `__str__`, to be loaded along with lists of
+        objects shown as strings (see
+        :meth:`scifight.tournament_specific.ModelAdmin.get_list_select_related`).
+    """
+
     def __str__(self):
         return _tr("{0} at {1}").format(self.round, self.room)
 
     class Meta:
         ordering        = ["round", "room"]
         unique_together = ("room", "round")
+        index_together  = ("tournament", "round", "room")
 
 
 class FightStage(models.Model):
@@ -338,6 +459,13 @@ class FightStage(models.Model):
     reviewer      = models.ForeignKey(Participant, related_name="+",
                                                    null=True, blank=True)
 
+    objects       = TournamentQuerySet.as_manager()
+    tournament_path = "fight__tournament"
+    display_select_related = ("problem__tournament",
+                              "reporter__tournament",
+                              "opponent__tournament",
+                              "reviewer__tournament")
+
     def clean(self):
         super().clean()
 
@@ -346,6 +474,20 @@ class FightStage(models.Model):
             msg = _tr("Single person is assigned for two or more roles")
             raise exceptions.ValidationError(msg)
 
+        # clean problem choice
+        if None not in (self.fight_id, self.problem_id,
+                        self.reporter_id, self.opponent_id):
+            # 'rules' module imports this one.
+            from scifight import rules
+            reasons = rules.check_stage(self)
+            if reasons:
+                msg = _tr("Problem {0} can't be reported in this stage: "
+                          "{1}").format(self.problem.problem_num,
+                                        "; ".join(reasons))
+                raise exceptions.ValidationError({"problem": msg})
+
+    str_select_related = ("fight__round", "fight__room")
+
     def __str__(self):
         return 'Fight #{0}, stage #{1} at {2}'.format(
             self.fight.round, self.stage_num, self.fight.room)
@@ -360,11 +502,23 @@ class Refusal(models.Model):
     fight_stage   = models.ForeignKey(FightStage)
     problem       = models.ForeignKey(Problem)
 
+    objects       = TournamentQuerySet.as_manager()
+    display_select_related = ("problem__tournament", "fight_stage__fight")
+
+    def fill_tournament(self):
+        self.tournament_id = self.fight_stage.fight.tournament_id
+
     class Meta:
         ordering        = ['fight_stage', 'problem']
         unique_together = ("fight_stage", "problem")
 
 
+MarksContext = collections.namedtuple('MarksContext',
+                                      ['has_reviewer', 'jury_ids'])
+""" Data shared by validation of all juror marks of a fight stage: whether
+    the fight has a reviewing team, and ids of jurors of the fight. """
+
+
 class JurorPoints(models.Model):
     tournament    = models.ForeignKey(Tournament)
     fight_stage   = models.ForeignKey(FightStage)
@@ -373,26 +527,116 @@ class JurorPoints(models.Model):
     opponent_mark = models.IntegerField(null=True, blank=True)
     reviewer_mark = models.IntegerField(null=True, blank=True)
 
+    objects       = TournamentQuerySet.as_manager()
+    display_select_related = ("juror__tournament", "fight_stage__fight")
+
+    marks_context = None
+    """ Object of :class:`MarksContext` for the stage, set by formsets which
+        validate many marks of one stage at once, so that it's loaded only
+        once. If not set, :meth:`clean` loads it by itself. """
+
+    @staticmethod
+    def load_marks_context(fight_stage):
+        """ Loads :class:`MarksContext` of the `fight_stage` in two queries.
+        """
+        fight_id = fight_stage.fight_id
+        team3_id = (Fight.objects
+                    .filter(pk=fight_id)
+                    .values_list('team3_id', flat=True)
+                    .first())
+        jury_ids = set(Fight.jury.through.objects
+                       .filter(fight_id=fight_id)
+                       .values_list('juror_id', flat=True))
+        return MarksContext(team3_id is not None, jury_ids)
+
+    def fill_tournament(self):
+        self.tournament_id = self.fight_stage.fight.tournament_id
+
     def clean(self):
         super().clean()
 
+        context = self.marks_context
+        if context is None:
+            context = self.load_marks_context(self.fight_stage)
+
+        # clean mark ranges
+        errors = {}
+        for field in ("reporter_mark", "opponent_mark", "reviewer_mark"):
+            mark = getattr(self, field)
+            if mark is not None and not MIN_MARK <= mark <= MAX_MARK:
+                errors[field] = _tr("Mark must be from {0} to {1}").format(
+                    MIN_MARK, MAX_MARK)
+        if errors:
+            raise exceptions.ValidationError(errors)
+
         # clean reviewer
-        bad = (self.reviewer_mark is None and
-               self.fight_stage.fight.team3 is not None)
-        if bad:
+        if self.reviewer_mark is None and context.has_reviewer:
             msg = _tr("Reviewer mark must be set, because there is "
                       "a reviewing team in this fight")
             raise exceptions.ValidationError({"reviewer_mark": msg})
 
         # clean jury
-        jury_set = set(self.fight_stage.fight.jury.all())
-        if self.juror not in jury_set:
+        if self.juror_id not in context.jury_ids:
             msg = _tr("Selected juror doesn't take part in the fight")
             raise exceptions.ValidationError({"juror": msg})
 
     class Meta:
         ordering        = ['fight_stage', 'juror']
         unique_together = ("fight_stage", "juror")
+        # Covers reading marks of stages, as done by scoring.
+        index_together  = ("fight_stage", "juror", "reporter_mark",
+                           "opponent_mark", "reviewer_mark")
+
+
+class StageScore(models.Model):
+    """ Denormalized weighted average mark of a single role in a fight stage.
+        Rows of this table (as well as of :class:`FightScore` and
+        :class:`TeamScore`) are never edited by hand: they are maintained
+        by :mod:`scifight.signals` whenever juror marks or stages change,
+        and may be rebuilt with `rebuild_standings` management command. """
+
+    tournament    = models.ForeignKey(Tournament)
+    fight         = models.ForeignKey(Fight)
+    fight_stage   = models.ForeignKey(FightStage)
+    role          = models.PositiveSmallIntegerField()
+    participant   = models.ForeignKey(Participant, related_name="+")
+    team          = models.ForeignKey(Team, related_name="+")
+    points        = models.FloatField()
+
+    sync_key = ('fight_stage_id', 'role')
+
+    class Meta:
+        ordering        = ['fight_stage', 'role']
+        unique_together = ("fight_stage", "role")
+
+
+class FightScore(models.Model):
+    """ Denormalized total points of a team in a single fight. """
+
+    tournament    = models.ForeignKey(Tournament)
+    fight         = models.ForeignKey(Fight)
+    team          = models.ForeignKey(Team, related_name="+")
+    points        = models.FloatField()
+
+    sync_key = ('fight_id', 'team_id')
+
+    class Meta:
+        ordering        = ['fight', 'team']
+        unique_together = ("fight", "team")
+
+
+class TeamScore(models.Model):
+    """ Denormalized total points of a team in the whole tournament. """
+
+    tournament    = models.ForeignKey(Tournament)
+    team          = models.OneToOneField(Team, related_name="score")
+    points        = models.FloatField()
+
+    sync_key = ('team_id',)
+
+    class Meta:
+        ordering        = ['tournament', '-points']
+        index_together  = ('tournament', 'points')
 
 # ---
 
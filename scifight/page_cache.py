@@ -0,0 +1,168 @@
+import datetime
+import functools
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from scifight import links
+from scifight import models
+
+PAGE_TIMEOUT = 24 * 60 * 60
+""" Time in seconds a rendered page is kept in the cache. Pages are never
+    invalidated one by one: a change bumps the version of the tournament,
+    and pages of older versions are just never read again and expire. """
+
+_GLOBAL = '*'
+""" Pseudo slug of the version shared by all tournaments. It's bumped when
+    something visible on pages of many tournaments changes, like origins or
+    tournaments themselves (including their slugs). """
+
+
+def _version_key(slug):
+    return 'scifight:version:{0}'.format(slug)
+
+
+def _new_version(old_version=0):
+    # Versions are milliseconds since the epoch, so that they never repeat
+    # and tell the time of the last change at the same time.
+    return max(old_version + 1, int(time.time() * 1000))
+
+
+def _stored_version(slug):
+    # Versions missing from the cache are restored from the modification
+    # time of tournaments, so they survive cache restarts.
+    tournaments = models.Tournament.objects.all()
+    if slug != _GLOBAL:
+        tournaments = tournaments.filter(slug=slug)
+    last_modified = tournaments.aggregate(Max('last_modified'))
+    last_modified = last_modified['last_modified__max']
+    if last_modified is None:
+        return None
+    return int(last_modified.timestamp() * 1000)
+
+
+def versions(slug):
+    """ Returns a pair of the global version and the version of the
+        tournament with `slug`. Takes a single cache read when both are
+        cached, and a query for each missing one otherwise. The version of
+        a tournament which doesn't exist is 0. """
+    keys = [_version_key(_GLOBAL), _version_key(slug)]
+    found = cache.get_many(keys)
+    result = []
+    for key, key_slug in zip(keys, [_GLOBAL, slug]):
+        if key not in found:
+            # Another process may have added the version in the meantime;
+            # the stored one is used with caches which keep nothing.
+            # Versions of missing tournaments aren't cached, or any
+            # requested slug would add a key that never expires.
+            stored = _stored_version(key_slug)
+            if stored is None:
+                found[key] = 0
+            else:
+                cache.add(key, stored, None)
+                found[key] = cache.get(key, stored)
+        result.append(found[key])
+    return tuple(result)
+
+
+def bump(slug=None):
+    """ Invalidates all cached pages of the tournament with `slug`, or of all
+        tournaments if `slug` is None. Should be called after any change of
+        data shown on public pages, which is done by :mod:`scifight.signals`
+        for regular saves and deletions, and explicitly by code making bulk
+        changes. Modification time of the tournament is updated right away,
+        while the cached version is bumped when the transaction is
+        committed.
+
+        :return: The new modification time.
+    """
+    last_modified = timezone.now()
+    tournaments = models.Tournament.objects.all()
+    if slug is not None:
+        tournaments = tournaments.filter(slug=slug)
+    tournaments.update(last_modified=last_modified)
+
+    key = _version_key(_GLOBAL if slug is None else slug)
+
+    # Bumping before commit would let pages with old data be cached under
+    # the new version by concurrent requests.
+    def bump_now():
+        cache.set(key, _new_version(cache.get(key, 0)), None)
+    transaction.on_commit(bump_now)
+    return last_modified
+
+
+def bump_tournament(tournament_id):
+    return bump(links.slug_by_id(tournament_id))
+
+
+def bump_for(instance):
+    """ Invalidates cached pages showing the model `instance`, see
+        :func:`bump`. """
+    if isinstance(instance, models.FightStage):
+        instance = instance.fight
+    if isinstance(instance, models.Tournament) or \
+            not hasattr(instance, 'tournament_id'):
+        return bump()
+    else:
+        return bump(links.tournament_slug(instance))
+
+
+def request_versions(request, tournament_slug=_GLOBAL, **kwargs):
+    """ Returns :func:`versions` for the `request`, read once per request,
+        as validators, the page cache and
+        :mod:`scifight.tournament_cache` all need them. """
+    if not hasattr(request, '_scifight_versions'):
+        request._scifight_versions = versions(tournament_slug)
+    return request._scifight_versions
+
+
+def _etag(request, *args, **kwargs):
+    return '-'.join(str(v) for v in request_versions(request, **kwargs))
+
+
+def _last_modified(request, *args, **kwargs):
+    version = max(request_versions(request, **kwargs))
+    return datetime.datetime.fromtimestamp(version / 1000.0, timezone.utc)
+
+
+def tournament_page(view):
+    """ Decorator caching pages rendered by `view` for GET and HEAD
+        requests. Pages are keyed by full path and by versions of their
+        tournament, found by `tournament_slug` argument of the view, so
+        a cached page is served with a single cache read of versions and
+        another one of the page, without touching the database.
+
+        Versions also serve as ETag and Last-Modified validators, so that
+        conditional requests for unchanged pages are answered with
+        '304 Not Modified' right away.
+    """
+    @condition(etag_func=_etag, last_modified_func=_last_modified)
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+
+        slug = kwargs.get('tournament_slug', _GLOBAL)
+        path = hashlib.md5(request.get_full_path().encode('utf-8'))
+        key = 'scifight:page:{0}:{1}:{2}'.format(
+            _etag(request, **kwargs), slug, path.hexdigest())
+
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            cache.set(key, (response.content, response['Content-Type']),
+                      PAGE_TIMEOUT)
+        return response
+
+    return wrapper
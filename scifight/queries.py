@@ -0,0 +1,70 @@
+from django.db.models import Prefetch
+
+from scifight import models
+
+# Query builders for public pages. Each of them returns a queryset which
+# preloads everything the corresponding template touches, including
+# 'tournament' references needed by 'scifight_url' filter, so that pages
+# render in a constant number of SQL queries regardless of tournament size.
+# Relations of single objects come from `for_display()` of their models (see
+# `TournamentQuerySet`), builders only add prefetches of related lists.
+
+
+def fights(tournament):
+    return models.Fight.objects.for_tournament(tournament).for_display()
+
+
+def fight_details(tournament):
+    teams = ['team{}__tournament'.format(i) for i in range(1, 5)]
+    return fights(tournament).select_related(*teams)
+
+
+def fight_jury(fight):
+    return fight.jury.for_display()
+
+
+def fight_stages(fight):
+    return fight.fightstage_set.for_display()
+
+
+def rooms(tournament):
+    return models.Room.objects.for_tournament(tournament).for_display()
+
+
+def teams(tournament):
+    return models.Team.objects.for_tournament(tournament).for_display()
+
+
+def team_details(tournament):
+    leaders = models.Leader.objects.select_related('tournament')
+    players = models.Participant.objects.select_related('tournament')
+    return (teams(tournament)
+            .prefetch_related(Prefetch('leader_set',      queryset=leaders),
+                              Prefetch('participant_set', queryset=players)))
+
+
+def participants(tournament):
+    return (models.Participant.objects
+            .for_tournament(tournament)
+            .for_display())
+
+
+def leaders(tournament):
+    return models.Leader.objects.for_tournament(tournament).for_display()
+
+
+def jury(tournament):
+    return models.Juror.objects.for_tournament(tournament).for_display()
+
+
+def problems(tournament):
+    return models.Problem.objects.for_tournament(tournament).for_display()
+
+
+def problem_details(tournament):
+    stages = (models.FightStage.objects
+              .select_related('fight__tournament',
+                              'fight__round',
+                              'fight__room'))
+    return (problems(tournament)
+            .prefetch_related(Prefetch('fightstage_set', queryset=stages)))
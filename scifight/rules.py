@@ -0,0 +1,293 @@
+import collections
+
+from django.db import transaction
+from django.utils.translation import ugettext as _tr
+
+from scifight import models
+
+# Kinds of problem history. The first three are kept per team, the last one
+# per fight.
+REPORTED  = 'reported'
+OPPOSED   = 'opposed'
+REFUSED   = 'refused'
+PRESENTED = 'presented'
+
+
+def problem_nums(mask):
+    """ Converts bit mask of problems (bit N stands for problem number N) to
+        a sorted list of problem numbers. """
+    nums = []
+    num = 0
+    while mask:
+        if mask & 1:
+            nums.append(num)
+        mask >>= 1
+        num += 1
+    return nums
+
+
+class ProblemHistory(object):
+    """ Index of problems reported, opposed and refused by every team of
+        a tournament, and of problems presented in every fight, built with
+        three queries. Each kind of history is a bit mask of problem numbers
+        backed by counters, so that stages and refusals may be added and
+        removed one by one as they are saved and deleted, and checking
+        a stage against tournament rules takes a few bitwise operations.
+
+        Problems with negative numbers have no bit, so they are left out of
+        the index, and :func:`check_stage` rejects them.
+
+        :param tournament_id: Id of the tournament to index.
+    """
+
+    def __init__(self, tournament_id):
+        self.tournament_id = tournament_id
+        # Read before the data, so that changes committed while the index
+        # is being built make it outdated rather than go unnoticed.
+        self.version = _version(tournament_id)
+        self._counts   = collections.Counter()
+        self._masks    = collections.defaultdict(int)
+        self._stages   = {}
+        self._refusals = {}
+
+        self.all_problems = 0
+        for num in models.Problem.objects \
+                .filter(tournament_id=tournament_id) \
+                .values_list('problem_num', flat=True):
+            if num >= 0:
+                self.all_problems |= 1 << num
+
+        for row in models.FightStage.objects \
+                .filter(fight__tournament_id=tournament_id) \
+                .values_list('id', 'fight_id', 'problem__problem_num',
+                             'reporter__team_id', 'opponent__team_id'):
+            self.set_stage(*row)
+
+        for row in models.Refusal.objects \
+                .filter(fight_stage__fight__tournament_id=tournament_id) \
+                .values_list('id', 'problem__problem_num',
+                             'fight_stage__reporter__team_id'):
+            self.set_refusal(*row)
+
+    def _add(self, key):
+        kind, owner, num = key
+        if num is None or num < 0:
+            return
+        self._counts[key] += 1
+        self._masks[kind, owner] |= 1 << num
+
+    def _remove(self, key):
+        if key not in self._counts:
+            return
+        self._counts[key] -= 1
+        if self._counts[key] <= 0:
+            del self._counts[key]
+            kind, owner, num = key
+            self._masks[kind, owner] &= ~(1 << num)
+
+    def set_stage(self, stage_id, fight_id, problem_num, reporter_team_id,
+                  opponent_team_id):
+        """ Adds a fight stage to the index, replacing its previous state. """
+        self.remove_stage(stage_id)
+        keys = [(REPORTED,  reporter_team_id, problem_num),
+                (OPPOSED,   opponent_team_id, problem_num),
+                (PRESENTED, fight_id,         problem_num)]
+        for key in keys:
+            self._add(key)
+        self._stages[stage_id] = keys
+
+    def remove_stage(self, stage_id):
+        for key in self._stages.pop(stage_id, ()):
+            self._remove(key)
+
+    def set_refusal(self, refusal_id, problem_num, team_id):
+        """ Adds a refusal to the index, replacing its previous state. """
+        self.remove_refusal(refusal_id)
+        key = (REFUSED, team_id, problem_num)
+        self._add(key)
+        self._refusals[refusal_id] = key
+
+    def remove_refusal(self, refusal_id):
+        key = self._refusals.pop(refusal_id, None)
+        if key is not None:
+            self._remove(key)
+
+    def stage_teams(self, stage_id):
+        """ Returns pair of reporting and opposing team ids of an indexed
+            stage, or None. """
+        keys = self._stages.get(stage_id)
+        return (keys[0][1], keys[1][1]) if keys else None
+
+    def _mask(self, kind, owner, stage_id):
+        mask = self._masks.get((kind, owner), 0)
+        # The stage being checked must not conflict with itself.
+        for key in self._stages.get(stage_id, ()):
+            if key[:2] == (kind, owner) and self._counts[key] == 1:
+                mask &= ~(1 << key[2])
+        return mask
+
+    def forbidden(self, fight_id, reporter_team_id, opponent_team_id,
+                  stage_id=None):
+        """ Returns list of `(mask, reason)` pairs of problems which can't
+            be reported in a stage of the fight by reporting team against
+            opposing team, ignoring the stage with `stage_id` itself. The
+            opponent may not challenge the reporter on a problem which:
+
+            * was reported by the reporter earlier;
+            * was refused by the reporter earlier;
+            * was opposed by the opponent earlier;
+            * was reported by the opponent earlier;
+            * was presented earlier in this fight.
+        """
+        return [
+            (self._mask(REPORTED, reporter_team_id, stage_id),
+             _tr("it has already been reported by the reporting team")),
+            (self._mask(REFUSED, reporter_team_id, stage_id),
+             _tr("it has already been refused by the reporting team")),
+            (self._mask(OPPOSED, opponent_team_id, stage_id),
+             _tr("it has already been opposed by the opposing team")),
+            (self._mask(REPORTED, opponent_team_id, stage_id),
+             _tr("it has already been reported by the opposing team")),
+            (self._mask(PRESENTED, fight_id, stage_id),
+             _tr("it has already been presented in this fight")),
+        ]
+
+    def allowed(self, fight_id, reporter_team_id, opponent_team_id,
+                stage_id=None):
+        """ Returns bit mask of problems allowed for the stage, see
+            :meth:`forbidden`. """
+        mask = self.all_problems
+        for forbidden, _ in self.forbidden(fight_id, reporter_team_id,
+                                           opponent_team_id, stage_id):
+            mask &= ~forbidden
+        return mask
+
+
+_histories = {}
+""" Process-wide cache mapping tournament id to its :class:`ProblemHistory`.
+    Every index is stamped with the modification time of its tournament,
+    stored in the database and shared by all processes (see
+    :func:`scifight.page_cache.bump`), and is rebuilt when the time
+    differs, so that validation never trusts an index missing changes
+    committed by other processes. Changes made by this process are applied
+    to the index by :mod:`scifight.signals`, which then stamps it with the
+    new modification time (see :func:`is_current` and :func:`stamp`). """
+
+
+def _version(tournament_id, lock=False):
+    tournaments = models.Tournament.objects.filter(pk=tournament_id)
+    if lock and transaction.get_connection().in_atomic_block:
+        # Other processes can't change the tournament until this
+        # transaction ends, as every change updates its modification time.
+        tournaments = tournaments.select_for_update()
+    return tournaments.values_list('last_modified', flat=True).first()
+
+
+def history(tournament_id):
+    """ Returns problem history of the tournament, building it if it's
+        missing or outdated. Checking it takes a single query. """
+    index = _histories.get(tournament_id)
+    if index is None or index.version != _version(tournament_id):
+        index = ProblemHistory(tournament_id)
+        _histories[tournament_id] = index
+    return index
+
+
+def is_current(tournament_id):
+    """ Called before a change of the tournament's data. Returns whether
+        the tournament has an index which is up to date, dropping it
+        otherwise. Inside a transaction the tournament is locked, so that
+        the index stays up to date until the change is made. """
+    index = _histories.get(tournament_id)
+    if index is None:
+        return False
+    if index.version != _version(tournament_id, lock=True):
+        forget(tournament_id)
+        return False
+    return True
+
+
+def stamp(tournament_id, version):
+    """ Called after a change of the tournament's data, which was up to date
+        according to :func:`is_current` and has been applied to the index,
+        with the new modification time of the tournament. If the change
+        is rolled back, the time doesn't match the stored one any more,
+        and the index is rebuilt. """
+    index = _histories.get(tournament_id)
+    if index is not None:
+        index.version = version
+
+
+def forget(tournament_id=None):
+    """ Drops the index of the tournament, or all indexes if `tournament_id`
+        is None. """
+    if tournament_id is None:
+        _histories.clear()
+    else:
+        _histories.pop(tournament_id, None)
+
+
+def stage_tournament(stage_id):
+    """ Returns id of the tournament whose index has the stage, or None. """
+    for index in _histories.values():
+        if stage_id in index._stages:
+            return index.tournament_id
+    return None
+
+
+def stage_saved(stage):
+    index = _histories.get(stage.fight.tournament_id)
+    if index is None:
+        return
+    teams = (stage.reporter.team_id, stage.opponent.team_id)
+    old_teams = index.stage_teams(stage.pk)
+    if old_teams is not None and old_teams[0] != teams[0]:
+        # Refusals of the stage belong to its reporting team.
+        forget(index.tournament_id)
+        return
+    index.set_stage(stage.pk, stage.fight_id, stage.problem.problem_num,
+                    *teams)
+
+
+def stage_deleted(stage):
+    # Stage may be deleted by cascade with its fight, so the tournament is
+    # not looked up; stage ids are unique across indexes anyway.
+    for index in _histories.values():
+        index.remove_stage(stage.pk)
+
+
+def refusal_saved(refusal):
+    index = _histories.get(refusal.tournament_id)
+    if index is not None:
+        index.set_refusal(refusal.pk, refusal.problem.problem_num,
+                          refusal.fight_stage.reporter.team_id)
+
+
+def refusal_deleted(refusal):
+    for index in _histories.values():
+        index.remove_refusal(refusal.pk)
+
+
+def _stage_args(stage):
+    return (stage.fight_id, stage.reporter.team_id, stage.opponent.team_id,
+            stage.pk)
+
+
+def allowed_problems(stage):
+    """ Returns sorted list of numbers of problems which may be reported in
+        `stage` according to tournament rules, given its fight, reporter and
+        opponent. """
+    index = history(stage.fight.tournament_id)
+    return problem_nums(index.allowed(*_stage_args(stage)))
+
+
+def check_stage(stage):
+    """ Returns list of reasons why the problem of `stage` can't be reported
+        in it, empty if the problem is allowed. """
+    num = stage.problem.problem_num
+    if num < 0:
+        return [_tr("problem number must not be negative")]
+    index = history(stage.fight.tournament_id)
+    bit = 1 << num
+    return [reason for mask, reason in index.forbidden(*_stage_args(stage))
+            if mask & bit]
@@ -0,0 +1,461 @@
+import numpy as np
+
+from django.db.models import Count, Sum
+from scifight     import models
+
+REPORTER = 0
+OPPONENT = 1
+REVIEWER = 2
+
+ROLE_WEIGHTS = np.array([3.0, 2.0, 1.0])
+""" Coefficients which average juror marks are multiplied by when computing
+    points of a fight stage, in the order of reporter, opponent and reviewer.
+    These are the traditional IYPT weights: report is the most valuable part
+    of a stage, review is the least one. """
+
+_COLUMNS = (
+    'fight_stage_id',
+    'fight_stage__fight_id',
+    'fight_stage__reporter_id',
+    'fight_stage__opponent_id',
+    'fight_stage__reviewer_id',
+    'fight_stage__reporter__team_id',
+    'fight_stage__opponent__team_id',
+    'fight_stage__reviewer__team_id',
+    'reporter_mark',
+    'opponent_mark',
+    'reviewer_mark')
+
+# Column slices of the raw marks array, see '_COLUMNS' above.
+_STAGE, _FIGHT = 0, 1
+_PERSONS = slice(2, 5)
+_TEAMS   = slice(5, 8)
+_MARKS   = slice(8, 11)
+
+
+class Standings(object):
+    """ Results of a tournament computed from all its juror marks at once.
+        Objects of this class are produced by :func:`compute_standings` and
+        are not supposed to be created directly.
+
+        All scores are weighted average marks, that is, average mark of the
+        role multiplied by the role's coefficient from :data:`ROLE_WEIGHTS`.
+        Roles which nobody has marked yet (e.g. while fight is in progress)
+        contribute zero points.
+
+        :ivar stage_ids: Sorted array of fight stage ids which have marks.
+        :ivar stage_points: Array of shape (stages, 3) with weighted average
+            marks of reporter, opponent and reviewer of each stage, or NaN
+            for roles without marks.
+        :ivar stage_fights: Array of fight ids of each stage.
+        :ivar stage_participants: Array of shape (stages, 3) with ids of
+            reporter, opponent and reviewer, or NaN for absent reviewer.
+        :ivar stage_teams: Same as `stage_participants`, but for teams.
+        :ivar team_points: Dictionary mapping team id to its total points.
+        :ivar fight_points: Dictionary mapping a pair of fight id and team id
+            to points the team earned in that fight.
+        :ivar participant_points: Dictionary mapping participant id to total
+            points earned personally by the participant.
+    """
+
+    def __init__(self, stage_ids, stage_points,
+                 stage_fights, stage_participants, stage_teams,
+                 team_points, fight_points, participant_points):
+        self.stage_ids          = stage_ids
+        self.stage_points       = stage_points
+        self.stage_fights       = stage_fights
+        self.stage_participants = stage_participants
+        self.stage_teams        = stage_teams
+        self.team_points        = team_points
+        self.fight_points       = fight_points
+        self.participant_points = participant_points
+
+    def stage_result(self, stage_id):
+        """ Returns a tuple of weighted average marks of reporter, opponent
+            and reviewer for the given fight stage. Roles without marks are
+            represented by `None`.
+        """
+        pos = np.searchsorted(self.stage_ids, stage_id)
+        if pos == len(self.stage_ids) or self.stage_ids[pos] != stage_id:
+            return None, None, None
+        return tuple(None if np.isnan(x) else float(x)
+                     for x in self.stage_points[pos])
+
+    def team_ranking(self):
+        """ Returns list of `(team_id, points)` pairs, best teams first.
+            Teams having no marks are not included.
+        """
+        return _ranking(self.team_points)
+
+    def participant_ranking(self):
+        """ Returns list of `(participant_id, points)` pairs, best first.
+            Participants having no marks are not included.
+        """
+        return _ranking(self.participant_points)
+
+
+def rank(objects, points_of):
+    """ Sets `points` attribute on each of `objects` (teams or participants)
+        and returns them as a list sorted by points in descending order.
+        Objects with equal points keep their original relative order.
+
+        :param objects: Iterable of model objects.
+        :param points_of: Dictionary mapping object id to points, for example
+            :attr:`Standings.team_points` or :func:`stored_team_points`.
+    """
+    objects = list(objects)
+    for obj in objects:
+        obj.points = points_of.get(obj.pk, 0.0)
+    objects.sort(key=lambda obj: -obj.points)
+    return objects
+
+
+def _ranking(points_of):
+    return sorted(points_of.items(), key=lambda item: (-item[1], item[0]))
+
+
+def _sum_by_key(keys, values):
+    """ Sums `values` grouped by equal `keys`, skipping NaN keys and values.
+        Returns dictionary mapping integer keys to float sums.
+    """
+    good = ~(np.isnan(keys) | np.isnan(values))
+    keys, values = keys[good], values[good]
+    if not len(keys):
+        return {}
+
+    uniq, idx = np.unique(keys, return_inverse=True)
+    sums = np.bincount(idx, weights=values, minlength=len(uniq))
+    return dict(zip(uniq.astype(int).tolist(), sums.tolist()))
+
+
+def compute_standings(tournament):
+    """ Computes stage results, fight results and cumulative standings of
+        the whole `tournament` using a single SQL query. All juror marks are
+        loaded into a NumPy array and aggregated without any per-object work
+        in Python, so this function is cheap enough to be called on every
+        standings page request.
+
+        :param tournament: Object of :class:`scifight.models.Tournament`.
+        :return: Object of :class:`Standings`.
+    """
+    rows = list(models.JurorPoints.objects
+                .filter(fight_stage__fight__tournament=tournament)
+                .order_by()
+                .values_list(*_COLUMNS))
+
+    return standings_from_rows(rows)
+
+
+def standings_from_rows(rows):
+    """ Does the actual job of :func:`compute_standings` for a sequence of
+        value tuples laid out as described by `_COLUMNS`. Missing ids and
+        marks may be given as `None`.
+    """
+    if not rows:
+        return Standings(np.empty(0, dtype=int), np.empty((0, 3)),
+                         np.empty(0), np.empty((0, 3)), np.empty((0, 3)),
+                         {}, {}, {})
+
+    # NumPy converts 'None' to NaN for floating point arrays, which is
+    # exactly what we need for both empty marks and absent reviewers.
+    # All ids are small enough to be represented by doubles exactly.
+    data = np.array(rows, dtype=np.float64)
+
+    stage_ids, first_row, stage_idx = np.unique(
+        data[:, _STAGE], return_index=True, return_inverse=True)
+    num_stages = len(stage_ids)
+
+    marks  = data[:, _MARKS]
+    filled = ~np.isnan(marks)
+    marks  = np.where(filled, marks, 0.0)
+
+    sums   = np.empty((num_stages, 3))
+    counts = np.empty((num_stages, 3))
+    for role in (REPORTER, OPPONENT, REVIEWER):
+        sums[:, role]   = np.bincount(stage_idx, weights=marks[:, role],
+                                      minlength=num_stages)
+        counts[:, role] = np.bincount(stage_idx, weights=filled[:, role],
+                                      minlength=num_stages)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stage_points = sums / counts * ROLE_WEIGHTS
+
+    # Every stage has a single fight and single set of people, so their ids
+    # may be taken from the first row of the stage.
+    stage_fights  = data[first_row, _FIGHT]
+    stage_persons = data[first_row, _PERSONS]
+    stage_teams   = data[first_row, _TEAMS]
+
+    flat_points  = stage_points.ravel()
+    flat_teams   = stage_teams.ravel()
+    flat_persons = stage_persons.ravel()
+    flat_fights  = np.repeat(stage_fights, 3)
+
+    team_points        = _sum_by_key(flat_teams, flat_points)
+    participant_points = _sum_by_key(flat_persons, flat_points)
+
+    # Group by (fight, team) pairs by combining both ids into a single key.
+    good = ~np.isnan(flat_teams)
+    team_uniq, team_idx = np.unique(flat_teams[good], return_inverse=True)
+    pair_keys = np.full(len(flat_teams), np.nan)
+    pair_keys[good] = flat_fights[good] * len(team_uniq) + team_idx
+    fight_points = {
+        (key // len(team_uniq), int(team_uniq[key % len(team_uniq)])): value
+        for key, value in _sum_by_key(pair_keys, flat_points).items()}
+
+    return Standings(stage_ids.astype(int), stage_points,
+                     stage_fights, stage_persons, stage_teams,
+                     team_points, fight_points, participant_points)
+
+
+# --- Persisted standings ---
+#
+# The functions below maintain 'StageScore', 'FightScore' and 'TeamScore'
+# tables, so that standings can be read with a single cheap query instead of
+# aggregating all juror marks of the tournament. Each function recomputes
+# only the rows depending on the changed object and never touches rows which
+# haven't changed. The latter is important when called from signal handlers
+# during cascade deletion: Django has already collected the rows it's going
+# to delete, and re-creating them with new primary keys would break foreign
+# key constraints.
+
+_ROLE_FIELDS = (
+    (REPORTER, 'reporter', 'reporter_mark'),
+    (OPPONENT, 'opponent', 'opponent_mark'),
+    (REVIEWER, 'reviewer', 'reviewer_mark'))
+
+
+def _sync_rows(existing, wanted, model):
+    """ Makes the set of rows in `existing` queryset equal to `wanted`.
+
+        :param existing: Queryset of rows to be synchronized.
+        :param wanted: Dictionary mapping a key tuple to a dictionary of field
+            values. Key tuples must consist of values of `model.sync_key`
+            fields.
+        :param model: Model class of the rows.
+    """
+    key_fields = model.sync_key
+    current = {tuple(getattr(obj, f) for f in key_fields): obj
+               for obj in existing}
+
+    to_create = []
+    for key, values in wanted.items():
+        obj = current.pop(key, None)
+        if obj is None:
+            fields = dict(zip(key_fields, key), **values)
+            to_create.append(model(**fields))
+        elif any(getattr(obj, f) != v for f, v in values.items()):
+            model.objects.filter(pk=obj.pk).update(**values)
+
+    if current:
+        model.objects.filter(pk__in=[obj.pk for obj in current.values()]) \
+                     .delete()
+    if to_create:
+        model.objects.bulk_create(to_create)
+
+
+def refresh_stage(stage_id, update_fight=True):
+    """ Updates stored points of a single fight stage, and then the points of
+        its fight and participating teams. Should be called whenever marks of
+        the stage change.
+
+        :param update_fight: If false, points of the fight and teams are not
+            updated, so that the caller could update many stages of a fight
+            and then call :func:`refresh_fight` once.
+    """
+    stage = (models.FightStage.objects
+             .filter(pk=stage_id)
+             .select_related('fight', 'reporter', 'opponent', 'reviewer')
+             .first())
+
+    existing = models.StageScore.objects.filter(fight_stage_id=stage_id)
+    wanted = {}
+
+    if stage is not None:
+        aggregates = {}
+        for _, _, mark_field in _ROLE_FIELDS:
+            aggregates[mark_field + '_sum'] = Sum(mark_field)
+            aggregates[mark_field + '_count'] = Count(mark_field)
+        totals = (models.JurorPoints.objects
+                  .filter(fight_stage_id=stage_id)
+                  .aggregate(**aggregates))
+
+        for role, person_field, mark_field in _ROLE_FIELDS:
+            person = getattr(stage, person_field)
+            count = totals[mark_field + '_count']
+            if person is None or not count:
+                continue
+            mean = totals[mark_field + '_sum'] / count
+            wanted[(stage_id, role)] = dict(
+                tournament_id  = stage.fight.tournament_id,
+                fight_id       = stage.fight_id,
+                participant_id = person.pk,
+                team_id        = person.team_id,
+                points         = mean * ROLE_WEIGHTS[role])
+    else:
+        # The stage is gone, so its rows are either already deleted by
+        # cascade, or are going to be; find out the fight using them.
+        stage = existing.first()
+
+    _sync_rows(existing, wanted, models.StageScore)
+
+    if stage is not None and update_fight:
+        refresh_fight(stage.fight_id)
+
+
+def refresh_fight(fight_id):
+    """ Updates stored points of all teams in a single fight from stored
+        stage points, and then the total points of these teams. """
+    existing = list(models.FightScore.objects.filter(fight_id=fight_id))
+    totals = (models.StageScore.objects
+              .filter(fight_id=fight_id)
+              .order_by()
+              .values('team_id', 'tournament_id')
+              .annotate(total=Sum('points')))
+
+    wanted = {(fight_id, row['team_id']):
+                  dict(tournament_id = row['tournament_id'],
+                       points        = row['total'])
+              for row in totals}
+
+    _sync_rows(existing, wanted, models.FightScore)
+
+    teams = {obj.team_id for obj in existing} | {k[1] for k in wanted}
+    refresh_teams(teams)
+
+
+def refresh_teams(team_ids):
+    """ Updates stored tournament totals of teams with given ids from stored
+        per-fight points. """
+    team_ids = list(team_ids)
+    if not team_ids:
+        return
+
+    existing = models.TeamScore.objects.filter(team_id__in=team_ids)
+    totals = (models.FightScore.objects
+              .filter(team_id__in=team_ids)
+              .order_by()
+              .values('team_id', 'tournament_id')
+              .annotate(total=Sum('points')))
+
+    wanted = {(row['team_id'],): dict(tournament_id = row['tournament_id'],
+                                      points        = row['total'])
+              for row in totals}
+
+    _sync_rows(existing, wanted, models.TeamScore)
+
+
+def participant_moved(participant_id, team_id):
+    """ Updates stored points after the participant has moved to the team
+        with `team_id`: points of their stages go with them, and totals of
+        both teams are updated. """
+    stages = models.StageScore.objects.filter(participant_id=participant_id)
+    fight_ids = set(stages.values_list('fight_id', flat=True))
+    stages.update(team_id=team_id)
+    # Both teams have stored points in these fights, so they are refreshed
+    # together with the fights.
+    for fight_id in sorted(fight_ids):
+        refresh_fight(fight_id)
+
+
+def stored_rows(tournament):
+    """ Returns stored stage, fight and team points of the `tournament` as
+        three dictionaries keyed the same way as :func:`expected_rows` does.
+    """
+    stages = {(obj.fight_stage_id, obj.role):
+                  dict(tournament_id  = obj.tournament_id,
+                       fight_id       = obj.fight_id,
+                       participant_id = obj.participant_id,
+                       team_id        = obj.team_id,
+                       points         = obj.points)
+              for obj in models.StageScore.objects.filter(
+                  tournament=tournament)}
+    fights = {(obj.fight_id, obj.team_id):
+                  dict(tournament_id = obj.tournament_id,
+                       points        = obj.points)
+              for obj in models.FightScore.objects.filter(
+                  tournament=tournament)}
+    teams  = {(obj.team_id,):
+                  dict(tournament_id = obj.tournament_id,
+                       points        = obj.points)
+              for obj in models.TeamScore.objects.filter(
+                  tournament=tournament)}
+    return stages, fights, teams
+
+
+def expected_rows(tournament, standings=None):
+    """ Returns stage, fight and team points of the `tournament`, computed
+        from scratch by :func:`compute_standings`, in the form suitable for
+        storing into 'StageScore', 'FightScore' and 'TeamScore' tables.
+    """
+    if standings is None:
+        standings = compute_standings(tournament)
+
+    stages = {}
+    for i, stage_id in enumerate(standings.stage_ids.tolist()):
+        for role in (REPORTER, OPPONENT, REVIEWER):
+            points = standings.stage_points[i, role]
+            person = standings.stage_participants[i, role]
+            if np.isnan(points) or np.isnan(person):
+                continue
+            stages[(stage_id, role)] = dict(
+                tournament_id  = tournament.pk,
+                fight_id       = int(standings.stage_fights[i]),
+                participant_id = int(person),
+                team_id        = int(standings.stage_teams[i, role]),
+                points         = float(points))
+
+    fights = {key: dict(tournament_id=tournament.pk, points=points)
+              for key, points in standings.fight_points.items()}
+    teams  = {(team_id,): dict(tournament_id=tournament.pk, points=points)
+              for team_id, points in standings.team_points.items()}
+    return stages, fights, teams
+
+
+def find_drift(stored, expected, tolerance=1e-6):
+    """ Compares two dictionaries of rows produced by :func:`stored_rows` and
+        :func:`expected_rows`. Returns a list of `(key, stored, expected)`
+        triples for each mismatching row, where missing rows are represented
+        by `None`.
+    """
+    drift = []
+    for key in sorted(set(stored) | set(expected)):
+        have, want = stored.get(key), expected.get(key)
+        if have is None or want is None:
+            drift.append((key, have, want))
+            continue
+        for field, value in want.items():
+            if field == 'points':
+                same = abs(have[field] - value) <= tolerance
+            else:
+                same = have[field] == value
+            if not same:
+                drift.append((key, have, want))
+                break
+    return drift
+
+
+def rebuild_tournament(tournament, expected=None):
+    """ Replaces all stored points of the `tournament` with freshly computed
+        ones. Must be called inside a transaction. """
+    if expected is None:
+        expected = expected_rows(tournament)
+
+    tables = (models.StageScore, models.FightScore, models.TeamScore)
+    for model in tables:
+        model.objects.filter(tournament=tournament).delete()
+
+    for model, rows in zip(tables, expected):
+        model.objects.bulk_create([
+            model(**dict(zip(model.sync_key, key), **values))
+            for key, values in rows.items()])
+
+
+def stored_team_points(tournament):
+    """ Returns dictionary mapping team id to its total points in the
+        `tournament`, read from the persisted standings table. The cost of
+        this function is proportional to the number of teams only.
+    """
+    return dict(models.TeamScore.objects
+                .filter(tournament=tournament)
+                .values_list('team_id', 'points'))
@@ -0,0 +1,282 @@
+import contextlib
+
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from scifight import links
+from scifight import live
+from scifight import models
+from scifight import page_cache
+from scifight import rules
+from scifight import scoring
+from scifight import tournament_cache
+
+# Handlers below keep persisted standings (see 'scifight.scoring') and other
+# caches up to date. Raw saves come from fixture loading, when related rows
+# may not exist yet, so they are skipped; run 'rebuild_standings' command
+# after loading.
+
+_deleting_tournaments = set()
+_deleting_fights      = set()
+_deleting_stages      = set()
+""" Ids of tournaments, fights and fight stages being deleted. Objects which
+    belong to them are deleted by cascade, and the handlers below skip
+    refreshing things for every such object: the fight or the tournament
+    is refreshed once when it's gone. """
+
+_batched_stages = set()
+""" Ids of fight stages whose juror points are being changed in a batch,
+    see :func:`marks_batch`. """
+
+
+def _skipped(instance):
+    """ Returns whether `instance` is being deleted by cascade with its
+        tournament, fight or fight stage, or changed in a batch of marks. """
+    if getattr(instance, 'tournament_id', None) in _deleting_tournaments:
+        return True
+    if isinstance(instance, models.FightStage):
+        return instance.fight_id in _deleting_fights
+    stage_id = getattr(instance, 'fight_stage_id', None)
+    return stage_id in _deleting_stages or stage_id in _batched_stages
+
+
+@contextlib.contextmanager
+def marks_batch(fight, stage_ids):
+    """ Context manager for changing many juror points of stages with
+        `stage_ids` of the `fight` at once, including by queries which send
+        no signals. Handlers below skip points of these stages in the block,
+        and standings, the live snapshot and pages of the fight are
+        refreshed once at its end. """
+    stage_ids = set(stage_ids)
+    history_current = rules.is_current(fight.tournament_id)
+    _batched_stages.update(stage_ids)
+    try:
+        yield
+    finally:
+        _batched_stages.difference_update(stage_ids)
+
+    for stage_id in stage_ids:
+        scoring.refresh_stage(stage_id, update_fight=False)
+    scoring.refresh_fight(fight.pk)
+    live.publish_on_commit(fight.pk)
+    last_modified = page_cache.bump_tournament(fight.tournament_id)
+    # Juror points are not a part of problem history.
+    if history_current:
+        rules.stamp(fight.tournament_id, last_modified)
+
+
+@receiver(pre_delete, sender=models.Tournament)
+def _tournament_deleting(sender, instance, **kwargs):
+    _deleting_tournaments.add(instance.pk)
+
+
+@receiver(post_save,   sender=models.JurorPoints)
+@receiver(post_delete, sender=models.JurorPoints)
+def _juror_points_changed(sender, instance, raw=False, **kwargs):
+    if not raw and not _skipped(instance):
+        scoring.refresh_stage(instance.fight_stage_id)
+        live.publish_on_commit(instance.fight_stage.fight_id)
+
+
+@receiver(post_save, sender=models.FightStage)
+def _fight_stage_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        scoring.refresh_stage(instance.pk)
+        rules.stage_saved(instance)
+        live.publish_on_commit(instance.fight_id)
+    else:
+        rules.forget()
+
+
+@receiver(pre_delete, sender=models.FightStage)
+def _fight_stage_deleting(sender, instance, **kwargs):
+    if not _skipped(instance):
+        _deleting_stages.add(instance.pk)
+
+
+@receiver(post_delete, sender=models.FightStage)
+def _fight_stage_deleted(sender, instance, **kwargs):
+    rules.stage_deleted(instance)
+    if not _skipped(instance):
+        _deleting_stages.discard(instance.pk)
+        scoring.refresh_fight(instance.fight_id)
+        live.publish_on_commit(instance.fight_id)
+
+
+@receiver(post_save, sender=models.Fight)
+def _fight_saved(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:
+        scoring.refresh_fight(instance.pk)
+    if not raw:
+        live.publish_on_commit(instance.pk)
+
+
+@receiver(pre_delete, sender=models.Fight)
+def _fight_deleting(sender, instance, **kwargs):
+    _deleting_fights.add(instance.pk)
+    if _skipped(instance):
+        return
+    instance._stage_ids = list(models.FightStage.objects
+                               .filter(fight=instance)
+                               .values_list('id', flat=True))
+    _deleting_stages.update(instance._stage_ids)
+    # Points of the fight are deleted by cascade before 'post_delete' is
+    # sent, so remember which teams are going to lose them.
+    instance._scored_teams = list(models.FightScore.objects
+                                  .filter(fight=instance)
+                                  .values_list('team_id', flat=True))
+
+
+@receiver(post_delete, sender=models.Fight)
+def _fight_deleted(sender, instance, **kwargs):
+    _deleting_fights.discard(instance.pk)
+    _deleting_stages.difference_update(getattr(instance, '_stage_ids', []))
+    if not _skipped(instance):
+        scoring.refresh_teams(getattr(instance, '_scored_teams', []))
+        live.publish_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=models.Refusal)
+def _refusal_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rules.refusal_saved(instance)
+    else:
+        rules.forget()
+
+
+@receiver(post_delete, sender=models.Refusal)
+def _refusal_deleted(sender, instance, **kwargs):
+    rules.refusal_deleted(instance)
+
+
+@receiver(post_save,   sender=models.Problem)
+@receiver(post_delete, sender=models.Problem)
+@receiver(post_save,   sender=models.Participant)
+@receiver(post_delete, sender=models.Participant)
+def _problem_history_changed(sender, instance, **kwargs):
+    # Problem numbers and teams of participants are baked into the index.
+    rules.forget(instance.tournament_id)
+
+
+@receiver(post_save,   sender=models.Tournament)
+@receiver(post_delete, sender=models.Tournament)
+def _tournament_changed(sender, instance, **kwargs):
+    _deleting_tournaments.discard(instance.pk)
+    links.forget_tournaments()
+    tournament_cache.forget()
+
+
+# --- Cached labels of team and person identities ---
+
+_AVATAR_MODELS = (models.Team, models.Participant, models.Leader, models.Juror)
+
+
+def _avatar_saving(sender, instance, raw=False, **kwargs):
+    # Remember the identity the avatar belonged to, so that its label could
+    # be recomputed if the avatar is moved to another identity, and the team
+    # of a participant, whose points go with them to another team.
+    instance._old_identity_id = instance._old_team_id = None
+    if not raw and instance.pk is not None:
+        fields = ['identity_id']
+        if sender is models.Participant:
+            fields.append('team_id')
+        old = (sender.objects
+               .filter(pk=instance.pk)
+               .values_list(*fields)
+               .first()) or [None, None]
+        instance._old_identity_id = old[0]
+        if sender is models.Participant:
+            instance._old_team_id = old[1]
+
+
+def _avatar_saved(sender, instance, raw=False, **kwargs):
+    old_team_id = getattr(instance, '_old_team_id', None)
+    if old_team_id is not None and old_team_id != instance.team_id:
+        scoring.participant_moved(instance.pk, instance.team_id)
+
+    if raw or instance.identity is None:
+        return
+
+    instance.identity.note_avatar(instance)
+
+    old_identity_id = getattr(instance, '_old_identity_id', None)
+    if old_identity_id not in (None, instance.identity_id):
+        identity_model = type(instance.identity)
+        old_identity = identity_model.objects.filter(pk=old_identity_id)
+        for identity in old_identity:
+            identity.refresh_label()
+
+
+def _avatar_deleted(sender, instance, **kwargs):
+    identity_model = sender.identity.field.related_model
+    for identity in identity_model.objects.filter(pk=instance.identity_id):
+        identity.refresh_label()
+
+
+for _model in _AVATAR_MODELS:
+    pre_save.connect(_avatar_saving, sender=_model)
+    post_save.connect(_avatar_saved, sender=_model)
+    post_delete.connect(_avatar_deleted, sender=_model)
+
+
+# --- Versions of cached public pages ---
+
+_PAGE_MODELS = (models.Tournament, models.TournamentRound, models.Room,
+                models.Problem, models.Team, models.Participant,
+                models.Leader, models.Juror, models.Fight, models.FightStage,
+                models.Refusal, models.JurorPoints, models.TeamOrigin,
+                models.PersonOrigin)
+
+
+def _tournament_id(instance):
+    if isinstance(instance, models.FightStage):
+        # Pre-delete signals of stages come before the one of their fight,
+        # so stages deleted by cascade aren't known as such yet. Not to
+        # load the fight of each, the tournament of an existing stage is
+        # taken from problem history; if the stage is missing from it,
+        # there is no up-to-date history to keep.
+        if instance.pk is None:
+            return instance.fight.tournament_id
+        return rules.stage_tournament(instance.pk)
+    if isinstance(instance, models.Tournament):
+        return None
+    return getattr(instance, 'tournament_id', None)
+
+
+def _page_data_changing(sender, instance, raw=False, action='pre_',
+                        **kwargs):
+    if raw or not action.startswith('pre_') or _skipped(instance):
+        return
+    # Problem history of the tournament is checked before the change, as
+    # its modification time is about to be bumped, see 'rules.stamp'.
+    tournament_id = _tournament_id(instance)
+    instance._history_current = (tournament_id is not None and
+                                 rules.is_current(tournament_id))
+
+
+def _page_data_changed(sender, instance, raw=False, action='post_',
+                       **kwargs):
+    if not action.startswith('post_'):
+        # Many-to-many changes are also announced before they are made.
+        return
+    if raw:
+        page_cache.bump()
+        return
+    if _skipped(instance):
+        # Pages are bumped once, when the fight or tournament is deleted.
+        return
+    last_modified = page_cache.bump_for(instance)
+    # Handlers above have applied the change to problem history, if it
+    # affects the history at all.
+    if getattr(instance, '_history_current', False):
+        rules.stamp(_tournament_id(instance), last_modified)
+
+
+for _model in _PAGE_MODELS:
+    pre_save.connect(_page_data_changing, sender=_model)
+    pre_delete.connect(_page_data_changing, sender=_model)
+    post_save.connect(_page_data_changed, sender=_model)
+    post_delete.connect(_page_data_changed, sender=_model)
+m2m_changed.connect(_page_data_changing, sender=models.Fight.jury.through)
+m2m_changed.connect(_page_data_changed, sender=models.Fight.jury.through)
@@ -0,0 +1,86 @@
+(function($) {
+    /* This script is injected into Django admin HTML code by the
+       'IdentitySearchInput' widget. It turns a plain text box into a search
+       field which lazily loads matching team or person identities from the
+       server as the user types, and stores the chosen identity id into the
+       hidden input rendered right before the text box.
+
+       Clearing the text box resets the choice, which means that a new
+       identity will be created when the form is saved. */
+
+    var MIN_TERM_LENGTH = 2;
+    var DELAY_MS        = 250;
+
+    var timer   = null;
+    var request = null;
+
+    function hiddenInputOf($search) {
+        return $search.prev('input[type=hidden]');
+    }
+
+    function closeResults() {
+        $('.scifight-identity-results').remove();
+    }
+
+    function showResults($search, results) {
+        closeResults();
+        if (!results.length)
+            return;
+
+        var offset = $search.offset();
+        var $list  = $('<ul class="scifight-identity-results"></ul>').css({
+            'position':         'absolute',
+            'top':              offset.top + $search.outerHeight(),
+            'left':             offset.left,
+            'min-width':        $search.outerWidth(),
+            'z-index':          1000,
+            'margin':           0,
+            'padding':          0,
+            'list-style':       'none',
+            'background-color': 'white',
+            'border':           '1px solid #ccc'
+        });
+
+        $.each(results, function(_, item) {
+            $('<li></li>')
+                .text(item.text)
+                .css({'padding': '2px 6px', 'cursor': 'pointer'})
+                .on('mousedown', function(event) {
+                    event.preventDefault();
+                    hiddenInputOf($search).val(item.id);
+                    $search.val(item.text);
+                    closeResults();
+                })
+                .appendTo($list);
+        });
+
+        $list.appendTo('body');
+    }
+
+    function search($search) {
+        var term = $.trim($search.val());
+        if (request)
+            request.abort();
+
+        if (term.length < MIN_TERM_LENGTH) {
+            closeResults();
+            return;
+        }
+
+        request = $.getJSON($search.data('search-url'), {q: term})
+            .done(function(data) { showResults($search, data.results); })
+            .always(function() { request = null; });
+    }
+
+    $(document).on('input', '.scifight-identity-search', function() {
+        var $search = $(this);
+
+        // Text no longer matches the chosen identity.
+        hiddenInputOf($search).val('');
+
+        clearTimeout(timer);
+        timer = setTimeout(function() { search($search); }, DELAY_MS);
+    });
+
+    $(document).on('blur', '.scifight-identity-search', closeResults);
+})(django.jQuery);
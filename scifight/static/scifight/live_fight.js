@@ -0,0 +1,68 @@
+(function($) {
+    /* This script keeps the fight page up to date without reloading it. It
+       polls the server every few seconds, or listens to server-sent events of the fight
+       if the server provides them and the browser supports EventSource, and
+       fills elements marked with 'data-live' attributes from received fight
+       snapshots. */
+
+    var $live = $('#live-fight');
+    if (!$live.length)
+        return;
+
+    var POLL_DELAY_MS = ($live.data('poll-delay') || 5) * 1000;
+
+    function field(name) {
+        return $live.find('[data-live="' + name + '"]');
+    }
+
+    function update(data) {
+        if (!data)
+            return;
+
+        field('status_text').text(data.status_text);
+        field('start_time').text(data.start_time || '');
+        field('stop_time').text(data.stop_time || '');
+
+        var stage = data.stage;
+        field('stage').text(stage
+            ? '#' + stage.num + ', ' + stage.problem + ' (' +
+              $.grep([stage.reporter, stage.opponent, stage.reviewer],
+                     Boolean).join(' / ') + ')'
+            : '');
+
+        var $teams = field('teams').empty();
+        $.each(data.teams, function(_, team) {
+            $('<tr></tr>')
+                .append($('<td></td>').text(team.name))
+                .append($('<td></td>').text(team.points.toFixed(2)))
+                .appendTo($teams);
+        });
+    }
+
+    function listen() {
+        var source = new EventSource($live.data('events-url'));
+        source.onmessage = function(event) {
+            update(JSON.parse(event.data));
+        };
+    }
+
+    function poll() {
+        // With 'ifModified' jQuery sends the ETag of the last response, and
+        // the server answers '304 Not Modified' without a body until the
+        // fight changes.
+        $.ajax({url: $live.data('poll-url'), dataType: 'json',
+                ifModified: true})
+            .done(function(response, status) {
+                if (status !== 'notmodified')
+                    update(response.data);
+            })
+            .always(function() {
+                setTimeout(poll, POLL_DELAY_MS);
+            });
+    }
+
+    if (window.EventSource && $live.data('events-url'))
+        listen();
+    else
+        poll();
+})(jQuery);
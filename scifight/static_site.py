@@ -0,0 +1,187 @@
+import collections
+import multiprocessing
+import os
+
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.template.loader import render_to_string
+
+from scifight import links
+from scifight import models
+from scifight import queries
+from scifight import scoring
+
+Page = collections.namedtuple('Page', ['path', 'template', 'context'])
+""" A public page to render: its URL path, template name and template
+    context. """
+
+_pages = []
+""" Pages being published. They are set before worker processes are forked,
+    so workers share the preloaded data with the parent process instead of
+    receiving it pickled. """
+
+
+def load_pages(tournament, tournaments=None):
+    """ Returns a list of :class:`Page` for every public page of the
+        `tournament`, with contexts equal to the ones built by
+        :mod:`scifight.views`. All data are loaded up front with a fixed
+        number of queries and shared by all pages, so that rendering doesn't
+        touch the database at all. The root index page lists `tournaments`,
+        just the `tournament` itself by default.
+    """
+    slug = tournament.slug
+    fights = list(queries.fight_details(tournament))
+    rooms = list(queries.rooms(tournament))
+    teams = list(queries.team_details(tournament))
+    participants = list(queries.participants(tournament))
+    leaders = list(queries.leaders(tournament))
+    jury = list(queries.jury(tournament))
+    problems = list(queries.problem_details(tournament))
+
+    fight_jury = collections.defaultdict(list)
+    jurors = {juror.pk: juror for juror in jury}
+    for fight_id, juror_id in (models.Fight.jury.through.objects
+                               .filter(fight__tournament=tournament)
+                               .order_by('juror_id')
+                               .values_list('fight_id', 'juror_id')):
+        fight_jury[fight_id].append(jurors[juror_id])
+
+    participants_by_id = {p.pk: p for p in participants}
+    problems_by_id = {p.pk: p for p in problems}
+    fight_stages = collections.defaultdict(list)
+    for stage in (models.FightStage.objects
+                  .filter(fight__tournament=tournament)
+                  .order_by('stage_num')):
+        stage.problem = problems_by_id[stage.problem_id]
+        stage.reporter = participants_by_id[stage.reporter_id]
+        stage.opponent = participants_by_id[stage.opponent_id]
+        if stage.reviewer_id is not None:
+            stage.reviewer = participants_by_id[stage.reviewer_id]
+        fight_stages[stage.fight_id].append(stage)
+
+    room_fights = collections.defaultdict(list)
+    for fight in fights:
+        room_fights[fight.room_id].append(fight)
+
+    standings = scoring.compute_standings(tournament)
+    ranked_teams = scoring.rank(teams,
+                                scoring.stored_team_points(tournament))
+    ranked_participants = scoring.rank(participants,
+                                       standings.participant_points)
+
+    def page(view_name, template, **context):
+        context.setdefault('tournament', tournament)
+        return Page(reverse(view_name, args=[slug]), template, context)
+
+    def detail(obj, template, **context):
+        context.setdefault('tournament', tournament)
+        return Page(links.model_url(obj), template, context)
+
+    pages = [
+        Page(reverse('index'), 'scifight/index.html',
+             {'tournaments': tournaments or [tournament],
+              'title': "Willcommen"}),
+        page('scifight:tournament', 'scifight/tournament.html'),
+        page('scifight:schedule', 'scifight/schedule.html',
+             fights=fights, nav_active_item="schedule"),
+        page('scifight:rooms', 'scifight/rooms.html',
+             rooms=rooms, nav_active_item="rooms"),
+        page('scifight:teams', 'scifight/teams.html',
+             teams=ranked_teams, nav_active_item="teams"),
+        page('scifight:participants', 'scifight/participants.html',
+             participants=ranked_participants,
+             nav_active_item="participant"),
+        page('scifight:leaders', 'scifight/leaders.html',
+             leaders=leaders, nav_active_item="leaders"),
+        page('scifight:jury', 'scifight/jury.html',
+             jury=jury, nav_active_item="jury"),
+        page('scifight:problems', 'scifight/problems.html',
+             problems=problems, nav_active_item="problems"),
+    ]
+    pages.extend(detail(fight, 'scifight/fight.html',
+                        fight=fight,
+                        jury=fight_jury[fight.pk],
+                        fightstages=fight_stages[fight.pk],
+                        nav_active_item="schedule",
+                        static_site=True)
+                 for fight in fights)
+    pages.extend(detail(room, 'scifight/room.html',
+                        room=room,
+                        fights=room_fights[room.pk],
+                        nav_active_item="rooms")
+                 for room in rooms)
+    pages.extend(detail(team, 'scifight/team.html',
+                        team=team, nav_active_item="teams")
+                 for team in teams)
+    pages.extend(detail(participant, 'scifight/participant.html',
+                        participant=participant,
+                        nav_active_item="participants")
+                 for participant in participants)
+    pages.extend(detail(leader, 'scifight/leader.html',
+                        leader=leader, nav_active_item="leaders")
+                 for leader in leaders)
+    pages.extend(detail(juror, 'scifight/juror.html',
+                        juror=juror, nav_active_item="jury")
+                 for juror in jury)
+    pages.extend(detail(problem, 'scifight/problem.html',
+                        problem=problem, nav_active_item="problem")
+                 for problem in problems)
+    return pages
+
+
+def _page_file(outdir, path):
+    # Every page is written as 'index.html' in the directory of its path,
+    # so that web servers serve it at the same URL as Django does.
+    return os.path.join(outdir, *(path.strip('/').split('/') +
+                                  ['index.html']))
+
+
+def _published_tournaments(tournament, outdir):
+    # The root index lists tournaments whose pages are already in 'outdir',
+    # so that publishing several tournaments into the same directory doesn't
+    # leave only the last one there, nor links to unpublished ones.
+    return [other for other in models.Tournament.objects.all()
+            if other.pk == tournament.pk or os.path.exists(_page_file(
+                outdir, reverse('scifight:tournament', args=[other.slug])))]
+
+
+def _render_page(args):
+    outdir, index = args
+    page = _pages[index]
+    filename = _page_file(outdir, page.path)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    content = render_to_string(page.template, page.context).encode('utf-8')
+    with open(filename, 'wb') as f:
+        f.write(content)
+    return len(content)
+
+
+def publish(tournament, outdir, jobs=None):
+    """ Renders all public pages of the `tournament` to HTML files under
+        `outdir`, in `jobs` worker processes (as many as there are CPUs by
+        default). Static files are not copied, they are expected to be
+        collected and served at `STATIC_URL` as usual. Pages of other
+        tournaments in `outdir` are kept, and the root index page is
+        rewritten to list all tournaments published there.
+
+        :return: Pair of the number of pages and their total size in bytes.
+    """
+    pages = load_pages(tournament,
+                       _published_tournaments(tournament, outdir))
+    jobs = jobs or os.cpu_count() or 1
+    tasks = [(outdir, index) for index in range(len(pages))]
+
+    _pages[:] = pages
+    try:
+        if jobs > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            # Workers must not share the connection of the parent process;
+            # they don't query the database anyway.
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(jobs) as pool:
+                sizes = pool.map(_render_page, tasks,
+                                 chunksize=max(1, len(tasks) // (jobs * 4)))
+        else:
+            sizes = [_render_page(task) for task in tasks]
+    finally:
+        _pages[:] = []
+    return len(pages), sum(sizes)
@@ -1,22 +1,9 @@
 from django import template
-from scifight import models
-from django.core.urlresolvers import reverse, NoReverseMatch
-import logging
+from scifight import links
 
 
-logger = logging.getLogger(__name__)
 register = template.Library()
 
-_single_arg_views = {
-#   Model type           View name                 Field to pass as arg
-    models.Participant: ("scifight:participant",   'id'),
-    models.Leader:      ("scifight:leader",        'id'),
-    models.Juror:       ("scifight:juror",         'id'),
-    models.Room:        ("scifight:room",          'id'),
-    models.Fight:       ("scifight:fight",         'id'),
-    models.Problem:     ("scifight:problem",       'problem_num')
-}
-
 
 @register.filter(is_safe=True)
 def scifight_url(model):
@@ -46,39 +33,9 @@ def scifight_url(model):
         This filter works only for models specific to the SciFight project,
         like :class:`scifight.models.Problem` or :class:`scifight.models.Fight`,
         and is highly project-specific aid for template shortening.
-    """
-    def wrapped_reverse(view_name, *args, **kwargs):
-        try:
-            return reverse(view_name, args=args, kwargs=kwargs)
-        except NoReverseMatch:
-            logger.error(
-                'NoReverseMatch: model = %s '
-                'model_type = %s '
-                'args = %s '
-                'kwargs = %s ' % (model, type(model), args, kwargs)
-            )
-            return ''
-
-    model_type = type(model)
-
-    if model_type == models.Team:
-        if model.slug:
-            return wrapped_reverse('scifight:team_slug',
-                                   tournament_slug=model.tournament.slug,
-                                   team_slug=model.slug)
-        else:
-            return wrapped_reverse('scifight:team_id',
-                                   tournament_slug=model.tournament.slug,
-                                   team_id=model.id)
 
-    if model_type == models.Tournament:
-        return wrapped_reverse('scifight:tournament', model.slug)
-
-    if model_type in _single_arg_views:
-        (view_name, field_name) = _single_arg_views[model_type]
-        return wrapped_reverse(view_name,
-                               model.tournament.slug,
-                               getattr(model, field_name))
-
-    logger.error("unsupported model passed: %s" % model_type)
-    return ''
+        URLs are built by :func:`scifight.links.model_url`, which doesn't call
+        URL resolver nor query the database for every link, so the filter is
+        cheap to use even on pages with hundreds of links.
+    """
+    return links.model_url(model)
@@ -1,3 +1,1559 @@
-from django.test import TestCase
+import datetime
+import importlib
+import io
+import itertools
+import json
+import os
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.apps import apps
+from django.contrib import admin
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.forms import modelform_factory
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from scifight import admin as sci_admin
+from scifight import archive
+from scifight import checks
+from scifight import draw
+from scifight import identities
+from scifight import rules
+from scifight import scoring
+from scifight import index_audit
+from scifight import instrumentation
+from scifight import jury
+from scifight import links
+from scifight import live
+from scifight import models
+from scifight import page_cache
+from scifight import tournament_cache
+from scifight import tournament_specific
+from scifight import static_site
+from scifight.benchmarks import generator
+from scifight.benchmarks import runner
+
+
+def make_tournament(slug, num_teams, num_rounds, team_size=3,
+                    jurors_per_fight=3):
+    """ Creates a small but complete tournament: teams with participants and
+        leaders, rooms, problems, jury, and fights of three teams with stages
+        and juror marks for each round. Returns the tournament object.
+    """
+    tnmt = models.Tournament.objects.create(
+        full_name    = "Tournament " + slug,
+        short_name   = slug.upper(),
+        slug         = slug,
+        opening_date = datetime.date(2016, 10, 1))
+
+    origin = models.PersonOrigin.objects.create(place_name="Moscow")
+
+    teams, players = [], {}
+    for i in range(num_teams):
+        team = models.Team.objects.create(
+            tournament = tnmt,
+            name       = "Team {}".format(i),
+            slug       = "team{}".format(i) if i % 2 else None)
+        teams.append(team)
+        players[team] = [
+            models.Participant.objects.create(
+                tournament = tnmt,
+                team       = team,
+                full_name  = "Player{}, {}".format(i, j),
+                short_name = "{} Player{}".format(j, i),
+                origin     = origin,
+                is_captain = (j == 0))
+            for j in range(team_size)]
+        models.Leader.objects.create(
+            tournament = tnmt,
+            team       = team,
+            full_name  = "Leader{}, X".format(i),
+            short_name = "X Leader{}".format(i),
+            origin     = origin)
+
+    num_rooms = num_teams // 3
+    rooms = [models.Room.objects.create(tournament=tnmt,
+                                        designation="Room {}".format(i),
+                                        sorting_key=i,
+                                        slug="room{}".format(i))
+             for i in range(num_rooms)]
+    problems = [models.Problem.objects.create(tournament=tnmt,
+                                              problem_num=i + 1,
+                                              title="Problem {}".format(i))
+                for i in range(10)]
+    jurors = [models.Juror.objects.create(tournament=tnmt,
+                                          full_name="Juror{}, Y".format(i),
+                                          short_name="Y Juror{}".format(i),
+                                          origin=origin)
+              for i in range(num_rooms * jurors_per_fight)]
+
+    now = timezone.now()
+    for r in range(num_rounds):
+        tround = models.TournamentRound.objects.create(
+            tournament=tnmt, round_num=r + 1,
+            opening_time=now, closing_time=now)
+        order = teams[r % num_teams:] + teams[:r % num_teams]
+        for k, room in enumerate(rooms):
+            group = order[3 * k: 3 * k + 3]
+            fight = models.Fight.objects.create(
+                tournament=tnmt, round=tround, room=room,
+                team1=group[0], team2=group[1], team3=group[2])
+            panel = jurors[k * jurors_per_fight: (k + 1) * jurors_per_fight]
+            fight.jury.add(*panel)
+            for s in range(3):
+                stage = models.FightStage.objects.create(
+                    fight     = fight,
+                    stage_num = s + 1,
+                    problem   = problems[(r + s + k) % len(problems)],
+                    reporter  = players[group[s]][0],
+                    opponent  = players[group[(s + 1) % 3]][0],
+                    reviewer  = players[group[(s + 2) % 3]][0])
+                for juror in panel:
+                    models.JurorPoints.objects.create(
+                        tournament=tnmt, fight_stage=stage, juror=juror,
+                        reporter_mark=7, opponent_mark=6, reviewer_mark=5)
+    return tnmt
+
+
+class ViewQueryBudgetTest(TestCase):
+    """ Every public page must render in a constant number of SQL queries,
+        no matter how large the tournament is. """
+
+    # View name and a function returning reverse() arguments for it.
+    budgets = [
+        ("scifight:tournament",   0, lambda t: []),
+        ("scifight:schedule",     1, lambda t: []),
+        ("scifight:fight",        3, lambda t: [t.fight_set.last().pk]),
+        ("scifight:rooms",        1, lambda t: []),
+        ("scifight:room",         2, lambda t: [t.room_set.last().pk]),
+        ("scifight:teams",        2, lambda t: []),
+        ("scifight:team_id",      3, lambda t: [t.team_set.first().pk]),
+        ("scifight:team_slug",    3, lambda t: ["team1"]),
+        ("scifight:participants", 2, lambda t: []),
+        ("scifight:participant",  1, lambda t: [t.participant_set.last().pk]),
+        ("scifight:leaders",      1, lambda t: []),
+        ("scifight:leader",       1, lambda t: [t.leader_set.last().pk]),
+        ("scifight:jury",         1, lambda t: []),
+        ("scifight:juror",        1, lambda t: [t.juror_set.last().pk]),
+        ("scifight:problems",     1, lambda t: []),
+        ("scifight:problem",      2, lambda t: [1]),
+        ("scifight:api_tournament",   1, lambda t: []),
+        ("scifight:api_schedule",     1, lambda t: []),
+        ("scifight:api_fight",        3, lambda t: [t.fight_set.last().pk]),
+        ("scifight:api_team_slug",    3, lambda t: ["team1"]),
+        ("scifight:api_participants", 1, lambda t: []),
+        ("scifight:api_marks",        1, lambda t: []),
+        ("scifight:api_standings",    1, lambda t: []),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.small = make_tournament("small", num_teams=3, num_rounds=1)
+        cls.large = make_tournament("large", num_teams=12, num_rounds=3)
+
+    def setUp(self):
+        # Budgets are for rendering pages, not for serving cached ones, and
+        # not for restoring cache versions of tournaments or loading the
+        # tournaments themselves, done once per process.
+        cache.clear()
+        for tnmt in (self.small, self.large):
+            global_version, _ = page_cache.versions(tnmt.slug)
+            tournament_cache.by_slug(tnmt.slug, global_version)
+
+    def test_index(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse("index")).status_code,
+                             200)
+
+    def test_query_budgets(self):
+        for tnmt in (self.small, self.large):
+            for view_name, budget, get_args in self.budgets:
+                url = reverse(view_name, args=[tnmt.slug] + get_args(tnmt))
+                with self.subTest(url=url), self.assertNumQueries(budget):
+                    response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+
+
+class ApiTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tnmt = make_tournament("api", num_teams=6, num_rounds=2)
+
+    def get(self, view_name, *args, **params):
+        url = reverse("scifight:" + view_name,
+                      args=[self.tnmt.slug] + list(args))
+        return self.client.get(url, params)
+
+    def test_cursor_pagination(self):
+        ids, after = [], 0
+        while after is not None:
+            data = self.get("api_marks", after=after, limit=7).json()
+            self.assertLessEqual(len(data["results"]), 7)
+            ids.extend(mark["id"] for mark in data["results"])
+            after = data["next_after"]
+        expected = models.JurorPoints.objects.filter(tournament=self.tnmt) \
+                                             .order_by('pk')
+        self.assertEqual(ids, list(expected.values_list('pk', flat=True)))
+
+    def test_field_selection(self):
+        data = self.get("api_participants", fields="full_name").json()
+        self.assertEqual(set(data["results"][0]), {"full_name"})
+        self.assertIsNone(data["next_after"])
+
+        data = self.get("api_team_slug", "team1", fields="name").json()
+        self.assertEqual(data["name"], "Team 1")
+        self.assertEqual(len(data["participants"]), 3)
+        self.assertNotIn("id", data)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.get("api_teams", fields="nope").status_code,
+                         400)
+        self.assertEqual(self.get("api_marks", limit="x").status_code, 400)
+        self.assertEqual(self.get("api_marks", limit="0").status_code, 400)
+        self.assertEqual(self.get("api_participants", limit="-1")
+                         .status_code, 400)
+        self.assertEqual(self.get("api_participants", after="-1")
+                         .status_code, 400)
+        self.assertEqual(self.get("api_participants", limit="1")
+                         .status_code, 200)
+
+
+class StaticSiteTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tnmt = make_tournament("static", num_teams=6, num_rounds=2)
+
+    def test_pages_render_without_queries(self):
+        pages = static_site.load_pages(self.tnmt)
+        with self.assertNumQueries(0):
+            for page in pages:
+                render_to_string(page.template, page.context)
+
+        paths = {page.path for page in pages}
+        self.assertIn(reverse("scifight:team_slug",
+                              args=[self.tnmt.slug, "team1"]), paths)
+        self.assertEqual(len(paths), len(pages))
+        self.assertEqual(len(pages), 9 + sum([
+            self.tnmt.fight_set.count(), self.tnmt.room_set.count(),
+            self.tnmt.team_set.count(), self.tnmt.participant_set.count(),
+            self.tnmt.leader_set.count(), self.tnmt.juror_set.count(),
+            self.tnmt.problem_set.count()]))
+
+    def test_publish_several_tournaments(self):
+        other = make_tournament("other", num_teams=3, num_rounds=1)
+        unpublished = make_tournament("unpublished", num_teams=3,
+                                      num_rounds=1)
+        with tempfile.TemporaryDirectory() as outdir:
+            static_site.publish(self.tnmt, outdir, jobs=1)
+            static_site.publish(other, outdir, jobs=1)
+            with open(os.path.join(outdir, "index.html")) as f:
+                index = f.read()
+            for tnmt in (self.tnmt, other):
+                self.assertIn(tnmt.full_name, index)
+                path = reverse("scifight:tournament", args=[tnmt.slug])
+                self.assertTrue(os.path.exists(
+                    static_site._page_file(outdir, path)))
+            self.assertNotIn(unpublished.full_name, index)
+
+
+class LinksTest(TestCase):
+    """ URLs formatted by 'links.model_url' from cached templates and slugs
+        are the same as resolved by 'reverse()'. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tnmt = make_tournament("links", num_teams=3, num_rounds=1)
+
+    def setUp(self):
+        links.forget_tournaments()
+
+    def expected_urls(self, slug):
+        """ Yields pairs of objects of the tournament, loaded without the
+            tournament itself, and their URLs given by 'reverse()'. """
+        tnmt = models.Tournament.objects.get(slug=slug)
+        yield tnmt, reverse("scifight:tournament", args=[slug])
+        for team in models.Team.objects.filter(tournament=tnmt):
+            if team.slug:
+                url = reverse("scifight:team_slug", args=[slug, team.slug])
+            else:
+                url = reverse("scifight:team_id", args=[slug, team.pk])
+            yield team, url
+        for model, view_name in [(models.Participant, "participant"),
+                                 (models.Leader,      "leader"),
+                                 (models.Juror,       "juror"),
+                                 (models.Room,        "room"),
+                                 (models.Fight,       "fight")]:
+            obj = model.objects.filter(tournament=tnmt).first()
+            yield obj, reverse("scifight:" + view_name, args=[slug, obj.pk])
+        problem = models.Problem.objects.filter(tournament=tnmt).first()
+        yield problem, reverse("scifight:problem",
+                               args=[slug, problem.problem_num])
+
+    def assertUrlsMatch(self, slug):
+        for obj, url in self.expected_urls(slug):
+            with self.subTest(model=type(obj).__name__):
+                self.assertEqual(links.model_url(obj), url)
+
+    def test_model_urls(self):
+        self.assertUrlsMatch(self.tnmt.slug)
+        with self.assertNumQueries(0):
+            self.assertEqual(links.model_url(models.Room(
+                tournament_id=self.tnmt.pk, pk=1)),
+                reverse("scifight:room", args=[self.tnmt.slug, 1]))
+
+    def test_slug_renamed(self):
+        self.assertUrlsMatch(self.tnmt.slug)
+        tnmt = models.Tournament.objects.get(pk=self.tnmt.pk)
+        tnmt.slug = "renamed"
+        tnmt.save()
+        self.assertUrlsMatch("renamed")
+
+    def test_tournament_deleted(self):
+        other = make_tournament("deleted", num_teams=3, num_rounds=1)
+        self.assertUrlsMatch(other.slug)
+        other.delete()
+        self.assertNotIn(other.pk, links._tournament_slugs)
+        # SQLite may give the id of the deleted tournament to a new one.
+        make_tournament("created", num_teams=3, num_rounds=1)
+        self.assertUrlsMatch("created")
+
+
+class TournamentQuerySetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tnmt = make_tournament("scoped", num_teams=3, num_rounds=1)
+        cls.other = make_tournament("others", num_teams=3, num_rounds=1)
+
+    def test_for_tournament(self):
+        for model in apps.get_app_config("scifight").get_models():
+            if not isinstance(model.objects.all(),
+                              models.TournamentQuerySet):
+                continue
+            with self.subTest(model=model._meta.label):
+                path = getattr(model, "tournament_path", "tournament")
+                objs = list(model.objects.for_tournament(self.tnmt))
+                self.assertEqual(len(objs), model.objects.filter(
+                    **{path: self.tnmt}).count())
+                self.assertEqual(len(objs), model.objects.count() -
+                    model.objects.for_tournament(self.other).count())
+
+    def test_for_display(self):
+        stages = models.FightStage.objects.for_tournament(self.tnmt)
+        with self.assertNumQueries(1):
+            for stage in stages.for_display():
+                str(stage.reporter.tournament)
+                str(stage.problem.tournament)
+
+    def test_user_tournament_changed(self):
+        manager = User.objects.create_user("manager", is_staff=True)
+        models.UserProfile.objects.create(user=manager, tournament=self.tnmt)
+
+        def user_tournament():
+            request = RequestFactory().get("/")
+            request.user = manager
+            return tournament_specific.user_tournament(request)
+
+        self.assertEqual(user_tournament().slug, self.tnmt.slug)
+        with self.assertNumQueries(1):
+            user_tournament()
+
+        # Changes made by other processes don't clear the cache of this one,
+        # but change the modification time, and so the global version.
+        models.Tournament.objects.filter(pk=self.tnmt.pk) \
+            .update(slug="renamed", last_modified=timezone.now())
+        cache.clear()
+        self.assertEqual(user_tournament().slug, "renamed")
+
+        version, _ = page_cache.versions(self.tnmt.slug)
+        self.assertEqual(tournament_cache.by_id(self.other.pk, version),
+                         self.other)
+        with mock.patch.object(tournament_cache, "forget"):
+            models.Tournament.objects.filter(pk=self.other.pk).delete()
+        models.Tournament.objects.update(last_modified=timezone.now())
+        cache.clear()
+        version, _ = page_cache.versions(self.tnmt.slug)
+        self.assertIsNone(tournament_cache.by_id(self.other.pk, version))
+
+    def test_admin_foreign_keys(self):
+        manager = User.objects.create_user("manager", is_staff=True)
+        models.UserProfile.objects.create(user=manager, tournament=self.tnmt)
+        request = RequestFactory().get("/")
+        request.user = manager
+        model_admin = admin.site._registry[models.FightStage]
+        field = models.FightStage._meta.get_field("fight")
+        formfield = model_admin.formfield_for_foreignkey(field, request)
+        self.assertEqual(set(formfield.queryset),
+                         set(self.tnmt.fight_set.all()))
+        self.assertEqual(set(model_admin.get_queryset(request)),
+                         set(models.FightStage.objects.filter(
+                             fight__tournament=self.tnmt)))
+
+
+class RulesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Stage N of the only fight: team N-1 reports problem N, the next
+        # team opposes it.
+        cls.tnmt = make_tournament("rules", num_teams=3, num_rounds=1)
+        cls.fight = cls.tnmt.fight_set.get()
+        cls.stages = list(cls.fight.fightstage_set.order_by("stage_num"))
+        cls.teams = [stage.reporter.team_id for stage in cls.stages]
+
+    def setUp(self):
+        rules.forget()
+
+    def allowed(self, *args, **kwargs):
+        index = rules.ProblemHistory(self.tnmt.pk)
+        return rules.problem_nums(index.allowed(*args, **kwargs))
+
+    def test_allowed(self):
+        # Outside the fight: reported by the reporter (1), opposed and
+        # reported by the opponent (1, 2).
+        self.assertEqual(self.allowed(None, self.teams[0], self.teams[1]),
+                         list(range(3, 11)))
+        # Problems presented in the fight are forbidden too.
+        self.assertEqual(self.allowed(self.fight.pk, self.teams[0],
+                                      self.teams[1]),
+                         list(range(4, 11)))
+        # The stage doesn't conflict with itself.
+        self.assertEqual(self.allowed(self.fight.pk, self.teams[0],
+                                      self.teams[1], self.stages[0].pk),
+                         [1] + list(range(4, 11)))
+
+    def test_forbidden_reasons(self):
+        index = rules.ProblemHistory(self.tnmt.pk)
+        index.set_refusal(-1, 5, self.teams[0])
+        forbidden = index.forbidden(None, self.teams[0], self.teams[1])
+        self.assertEqual([rules.problem_nums(mask) for mask, _ in forbidden],
+                         [[1], [5], [1], [2], []])
+        index.remove_refusal(-1)
+        self.assertNotIn(5, rules.problem_nums(
+            index.forbidden(None, self.teams[0], self.teams[1])[1][0]))
+
+    def test_check_stage(self):
+        stage = self.stages[0]
+        self.assertEqual(rules.check_stage(stage), [])
+        stage.problem = self.tnmt.problem_set.get(problem_num=2)
+        self.assertEqual(len(rules.check_stage(stage)), 2)
+
+    def test_changes_of_other_processes(self):
+        stage = self.stages[0]
+        index = rules.history(self.tnmt.pk)
+        self.assertIs(rules.history(self.tnmt.pk), index)
+        # Another process moves the stage to problem 7 and bumps the
+        # tournament; signals of this process don't see that.
+        new_problem = self.tnmt.problem_set.get(problem_num=7)
+        models.FightStage.objects.filter(pk=stage.pk) \
+                                 .update(problem=new_problem)
+        models.Tournament.objects.filter(pk=self.tnmt.pk) \
+                                 .update(last_modified=timezone.now())
+        index = rules.history(self.tnmt.pk)
+        self.assertEqual(rules.problem_nums(index.allowed(
+                             None, self.teams[0], self.teams[1])),
+                         [1, 3, 4, 5, 6, 8, 9, 10])
+
+    def test_own_changes_applied(self):
+        index = rules.history(self.tnmt.pk)
+        stage = models.FightStage.objects.get(pk=self.stages[0].pk)
+        stage.problem = self.tnmt.problem_set.get(problem_num=7)
+        stage.save()
+        points = models.JurorPoints.objects.filter(fight_stage=stage).first()
+        points.reporter_mark = 9
+        points.save()
+        models.Refusal.objects.create(
+            tournament=self.tnmt, fight_stage=stage,
+            problem=self.tnmt.problem_set.get(problem_num=8))
+        # Changes are applied to the index, which is not rebuilt.
+        with self.assertNumQueries(1):
+            self.assertIs(rules.history(self.tnmt.pk), index)
+        self.assertEqual(rules.problem_nums(index.allowed(
+                             None, self.teams[0], self.teams[1])),
+                         [1, 3, 4, 5, 6, 9, 10])
+
+    def test_changes_while_outdated(self):
+        index = rules.history(self.tnmt.pk)
+        models.Tournament.objects.filter(pk=self.tnmt.pk) \
+                                 .update(last_modified=timezone.now())
+        # The index missed a change of another process, so it's not
+        # stamped as up to date by a change of this one.
+        self.stages[1].save()
+        self.assertIsNot(rules.history(self.tnmt.pk), index)
+
+    def test_negative_problem_num(self):
+        problem = models.Problem.objects.create(
+            tournament=self.tnmt, problem_num=-1, title="Negative")
+        stage = self.stages[0]
+        stage.problem = problem
+        self.assertEqual(len(rules.check_stage(stage)), 1)
+        rules.history(self.tnmt.pk).set_stage(stage.pk, self.fight.pk, -1,
+                                              self.teams[0], self.teams[1])
+        self.assertNotIn(-1, rules.allowed_problems(self.stages[1]))
+
+
+class ArchiveTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tnmt = make_tournament("archived", num_teams=6, num_rounds=2)
+
+    def export(self):
+        stream = io.StringIO()
+        archive.export_tournament(self.tnmt, stream)
+        stream.seek(0)
+        return stream
+
+    def test_round_trip(self):
+        copy, counts = archive.import_tournament(self.export(),
+                                                 slug="restored")
+        self.assertEqual(copy.full_name, "Tournament archived (restored)")
+        self.assertEqual(copy.short_name, "ARCHIVED (restored)")
+        self.assertEqual(counts["fight_stage"], 12)
+
+        for name, model, path in archive._TOURNAMENT_MODELS:
+            with self.subTest(model=name):
+                self.assertEqual(
+                    model.objects.filter(**{path: copy}).count(),
+                    model.objects.filter(**{path: self.tnmt}).count())
+
+        # References point to objects of the copy, not of the original.
+        for stage in models.FightStage.objects.for_tournament(copy) \
+                .select_related("fight", "problem", "reporter", "opponent"):
+            self.assertEqual(stage.problem.tournament_id, copy.pk)
+            self.assertEqual(stage.reporter.tournament_id, copy.pk)
+            self.assertEqual(stage.opponent.tournament_id, copy.pk)
+        for points in models.JurorPoints.objects.for_tournament(copy) \
+                .select_related("juror", "fight_stage__fight"):
+            self.assertEqual(points.juror.tournament_id, copy.pk)
+            self.assertEqual(points.fight_stage.fight.tournament_id, copy.pk)
+
+        def standings(tournament):
+            return sorted(models.TeamScore.objects
+                          .filter(tournament=tournament)
+                          .values_list("team__name", "points"))
+        self.assertEqual(len(standings(copy)), 6)
+        self.assertEqual(standings(copy), standings(self.tnmt))
+
+    def test_names(self):
+        copy, _ = archive.import_tournament(
+            self.export(), slug="renamed", full_name="Renamed",
+            short_name="REN")
+        self.assertEqual((copy.full_name, copy.short_name),
+                         ("Renamed", "REN"))
+        with self.assertRaises(archive.ArchiveError):
+            archive.import_tournament(self.export())
+
+    def test_malformed_records(self):
+        header = json.dumps({"format": archive.FORMAT_NAME,
+                             "version": archive.FORMAT_VERSION})
+        for record in ('{"model": "room", "pk": 1}', '[1, 2]',
+                       '{"model": "room", "pk": 1, "fields": 3}',
+                       '{"model": "nope", "pk": 1, "fields": {}}'):
+            with self.subTest(record=record), \
+                    self.assertRaises(archive.ArchiveError):
+                archive.import_tournament(io.StringIO(
+                    header + "\n" + record + "\n"))
+
+
+class IdentitiesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.old = models.Tournament.objects.create(
+            full_name="Old", short_name="OLD", slug="old",
+            opening_date=datetime.date(2015, 10, 1))
+        cls.new = models.Tournament.objects.create(
+            full_name="New", short_name="NEW", slug="new",
+            opening_date=datetime.date(2016, 10, 1))
+        cls.old_team = models.Team.objects.create(tournament=cls.old,
+                                                  name="Old team")
+        cls.new_team = models.Team.objects.create(tournament=cls.new,
+                                                  name="New team")
+
+    def person(self, model, tournament, full_name, identity=None):
+        fields = dict(tournament=tournament, full_name=full_name,
+                      short_name=full_name, identity=identity)
+        if model is not models.Juror:
+            fields["team"] = (self.old_team if tournament == self.old
+                              else self.new_team)
+        if model is models.Participant:
+            fields["is_captain"] = False
+        return model.objects.create(**fields)
+
+    def test_normalize_name(self):
+        self.assertEqual(
+            identities.normalize_name("Uskov, Grigory Konstantinovich"),
+            "grigory uskov")
+        self.assertEqual(identities.normalize_name("Saint-Exupéry, Antoine"),
+                         "antoine saint exupery")
+        self.assertEqual(identities.normalize_name("  Jean  LUC "),
+                         "jean luc")
+
+    def test_find(self):
+        ivanov = self.person(models.Juror, self.old, "Ivanov, Ivan")
+        self.person(models.Juror, self.old, "Petrov, Petr")
+        index = identities.PeopleIndex()
+        found = index.find("Ivanov, Ivan Ivanovich")
+        self.assertEqual(found, [(ivanov.identity_id, 1.0)])
+        found = index.find("Ivanof, Ivan")
+        self.assertEqual([pk for pk, _ in found], [ivanov.identity_id])
+        self.assertLess(found[0][1], 1.0)
+        self.assertEqual(index.find("Sidorov, Sidor"), [])
+        self.assertEqual(index.find(""), [])
+
+    def test_merge_people(self):
+        target = self.person(models.Juror, self.old, "Ivanov, Ivan")
+        source = self.person(models.Leader, self.new, "Ivanov, Ivan")
+        identities.merge_people(source.identity_id, target.identity_id)
+        self.assertFalse(models.PersonIdentity.objects
+                         .filter(pk=source.identity_id).exists())
+        source.refresh_from_db()
+        self.assertEqual(source.identity_id, target.identity_id)
+        self.assertEqual(source.identity.latest_tournament, self.new)
+
+    def test_one_match_per_identity(self):
+        old = self.person(models.Juror, self.old, "Ivanov, Ivan")
+        leader = self.person(models.Leader, self.new, "Ivanov, Ivan")
+        self.person(models.Juror, self.new, "Ivanov, Ivan",
+                    identity=leader.identity)
+        matches = identities.match_people(self.new)
+        self.assertEqual([(m.avatar.identity_id, m.identity_id)
+                          for m in matches],
+                         [(leader.identity_id, old.identity_id)])
+        identities.merge_people(leader.identity_id, old.identity_id)
+
+    def test_target_taken_by_any_kind(self):
+        # The target already has a juror in the new tournament, so the
+        # source, which has a juror there too, can't be merged into it.
+        old = self.person(models.Juror, self.old, "Ivanov, Ivan")
+        self.person(models.Juror, self.new, "Ivanov, Ivan Petrovich",
+                    identity=old.identity)
+        leader = self.person(models.Leader, self.new, "Ivanov, Ivan")
+        self.person(models.Juror, self.new, "Ivanov, Ivan",
+                    identity=leader.identity)
+        self.assertEqual(identities.match_people(self.new), [])
+
+    def label(self, identity_id, model=models.PersonIdentity):
+        identity = model.objects.get(pk=identity_id)
+        return identity.latest_name, identity.latest_tournament
+
+    def test_label_renamed(self):
+        old = self.person(models.Juror, self.old, "Ivanov")
+        new = self.person(models.Leader, self.new, "Ivanov Jr",
+                          identity=old.identity)
+        self.assertEqual(self.label(old.identity_id), ("Ivanov Jr", self.new))
+        # Renaming an older avatar doesn't change the label.
+        old.short_name = "Ivanov Sr"
+        old.save()
+        self.assertEqual(self.label(old.identity_id), ("Ivanov Jr", self.new))
+        new.short_name = "Ivanov III"
+        new.save()
+        self.assertEqual(self.label(old.identity_id), ("Ivanov III", self.new))
+
+    def test_label_of_moved_avatar(self):
+        old = self.person(models.Juror, self.old, "Ivanov")
+        new = self.person(models.Participant, self.new, "Ivanov Jr",
+                          identity=old.identity)
+        other = self.person(models.Juror, self.old, "Petrov")
+        new.identity = other.identity
+        new.save()
+        self.assertEqual(self.label(old.identity_id), ("Ivanov", self.old))
+        self.assertEqual(self.label(other.identity_id),
+                         ("Ivanov Jr", self.new))
+
+    def test_latest_avatar_deleted(self):
+        old = self.person(models.Juror, self.old, "Ivanov")
+        new = self.person(models.Leader, self.new, "Ivanov Jr",
+                          identity=old.identity)
+        new.delete()
+        self.assertEqual(self.label(old.identity_id), ("Ivanov", self.old))
+        old.delete()
+        self.assertEqual(self.label(old.identity_id), ("", None))
+
+    def test_team_label(self):
+        old_team = models.Team.objects.get(pk=self.old_team.pk)
+        new_team = models.Team.objects.get(pk=self.new_team.pk)
+        left_identity_id = new_team.identity_id
+        new_team.identity = old_team.identity
+        new_team.save()
+        identity_id = old_team.identity_id
+        self.assertEqual(self.label(left_identity_id, models.TeamIdentity),
+                         ("", None))
+        self.assertEqual(self.label(identity_id, models.TeamIdentity),
+                         ("New team", self.new))
+        new_team.name = "Renamed team"
+        new_team.save()
+        self.assertEqual(self.label(identity_id, models.TeamIdentity),
+                         ("Renamed team", self.new))
+        new_team.delete()
+        self.assertEqual(self.label(identity_id, models.TeamIdentity),
+                         ("Old team", self.old))
+
+    def test_search_view(self):
+        ivanov = self.person(models.Juror, self.old, "Ivanov, Ivan")
+        self.person(models.Leader, self.new, "Ivanov, Ivan",
+                    identity=ivanov.identity)
+        self.person(models.Juror, self.old, "Ivashov, Petr")
+        self.person(models.Juror, self.old, "Petrov, Ivan")
+        url = reverse("admin:scifight_personidentity_search")
+
+        # Any staff user may search, with no permissions at all.
+        User.objects.create_user("staff", password="pw", is_staff=True)
+        self.client.login(username="staff", password="pw")
+
+        def found(term, url=url):
+            response = self.client.get(url, {"q": term})
+            return [result["id"] for result in response.json()["results"]]
+
+        self.assertEqual(found("Ivanov"), [ivanov.identity_id])
+        self.assertEqual(len(found("iva")), 2)
+        self.assertEqual(found("HID#{0}".format(ivanov.identity_id)),
+                         [ivanov.identity_id])
+        self.assertEqual(found(" "), [])
+        self.assertEqual(found("Old", reverse(
+                             "admin:scifight_teamidentity_search")),
+                         [self.old_team.identity_id])
+
+        # Others are sent to the login page.
+        User.objects.create_user("user", password="pw")
+        self.client.login(username="user", password="pw")
+        response = self.client.get(url, {"q": "Ivanov"})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse("admin:login"), response["Location"])
+        self.client.logout()
+        self.assertEqual(self.client.get(url, {"q": "Ivanov"}).status_code,
+                         302)
+
+    def test_search_input(self):
+        juror = self.person(models.Juror, self.old, "Ivanov, Ivan")
+        form = modelform_factory(models.Juror, form=sci_admin.PersonForm,
+                                 fields=["identity"])(instance=juror)
+        html = str(form["identity"])
+        self.assertIn(reverse("admin:scifight_personidentity_search"), html)
+        self.assertIn(str(juror.identity), html)
+
+
+class ImportRosterTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tnmt = models.Tournament.objects.create(
+            full_name="Roster", short_name="ROSTER", slug="roster",
+            opening_date=datetime.date(2016, 10, 1))
+        models.Team.objects.create(tournament=cls.tnmt, name="Existing")
+
+    def import_roster(self, records):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "roster.json")
+            with open(path, "w") as f:
+                json.dump(records, f)
+            call_command("import_roster", self.tnmt.slug, path,
+                         stdout=io.StringIO())
+
+    def test_import(self):
+        self.import_roster([
+            {"kind": "participant", "name": "Ivanov, Ivan", "team": "Lyceum",
+             "grade": "10", "captain": "yes", "origin": "Moscow"},
+            {"kind": "team", "name": "Lyceum", "slug": "lyceum"},
+            {"kind": "leader", "name": "Petrov, Petr", "team": "Existing"},
+            {"kind": "juror", "name": "Sidorov, Sidor",
+             "short_name": "S. Sidorov"},
+        ])
+        team = models.Team.objects.get(tournament=self.tnmt, name="Lyceum")
+        self.assertEqual(team.slug, "lyceum")
+        player = models.Participant.objects.get(tournament=self.tnmt)
+        self.assertEqual((player.team, player.short_name, player.grade),
+                         (team, "Ivan Ivanov", "10"))
+        self.assertTrue(player.is_captain)
+        self.assertEqual(player.origin.place_name, "Moscow")
+        self.assertEqual(player.identity.latest_name, "Ivan Ivanov")
+        leader = models.Leader.objects.get(tournament=self.tnmt)
+        self.assertEqual(leader.team.name, "Existing")
+        juror = models.Juror.objects.get(tournament=self.tnmt)
+        self.assertEqual(juror.short_name, "S. Sidorov")
+
+    def test_validation(self):
+        models.Team.objects.create(tournament=self.tnmt, name="Twin")
+        models.Team.objects.create(tournament=self.tnmt, name="Twin")
+        with self.assertRaises(CommandError) as raised:
+            self.import_roster([
+                {"kind": "referee", "name": "Ivanov, Ivan"},
+                {"kind": "team", "name": "Existing"},
+                {"kind": "team", "name": "New", "slug": "not a slug"},
+                {"kind": "participant", "name": "Ivanov, Ivan"},
+                {"kind": "participant", "name": "Ivan", "team": "New"},
+                {"kind": "leader", "name": "Petrov, Petr", "team": "Nowhere"},
+                {"kind": "leader", "name": "Petrov, Petr", "team": "Twin"},
+            ])
+        message = str(raised.exception)
+        self.assertIn("7 error(s) found", message)
+        for error in ("record 1: unknown kind 'referee'",
+                      "record 2: team 'Existing' already exists",
+                      "record 3: invalid slug 'not a slug'",
+                      "record 4: participant must belong to a team",
+                      "record 5: can't guess short name from 'Ivan'",
+                      "record 6: unknown team 'Nowhere'",
+                      "record 7: there are 2 teams named 'Twin'"):
+            self.assertIn(error, message)
+        self.assertFalse(models.Participant.objects.exists())
+        self.assertFalse(models.Team.objects.filter(name="New").exists())
+
+
+class DrawTest(TestCase):
+
+    def test_fight_sizes(self):
+        self.assertEqual(draw.fight_sizes(2), [2])
+        self.assertEqual(draw.fight_sizes(3), [3])
+        self.assertEqual(draw.fight_sizes(4), [4])
+        self.assertEqual(draw.fight_sizes(5), [3, 2])
+        self.assertEqual(draw.fight_sizes(7), [4, 3])
+        self.assertEqual(draw.fight_sizes(11), [4, 4, 3])
+        for num_teams in range(2, 40):
+            self.assertEqual(sum(draw.fight_sizes(num_teams)), num_teams)
+        with self.assertRaises(draw.DrawError):
+            draw.fight_sizes(1)
+
+    def test_too_few_rooms(self):
+        with self.assertRaises(draw.DrawError):
+            draw.make_draw(range(7), [1])
+
+    def test_rounds_without_repeats(self):
+        team_ids = list(range(1, 25))
+        room_ids = list(range(101, 109))
+        origins = {team_id: team_id % 4 for team_id in team_ids}
+        previous, met = [], set()
+        for r in range(5):
+            result = draw.make_draw(team_ids, room_ids, previous, origins,
+                                    seed=r)
+            # The same seed gives the same draw.
+            self.assertEqual(result, draw.make_draw(team_ids, room_ids,
+                                                    previous, origins,
+                                                    seed=r))
+            self.assertEqual(result.repeats, 0)
+            self.assertEqual(sorted(t for _, group in result.fights
+                                    for t in group), team_ids)
+            for room_id, group in result.fights:
+                pairs = {frozenset(pair)
+                         for pair in itertools.combinations(group, 2)}
+                self.assertFalse(pairs & met)
+                met |= pairs
+            previous += result.fights
+
+    def test_draw_round(self):
+        tnmt = make_tournament("draw", num_teams=7, num_rounds=1)
+        tround = models.TournamentRound.objects.create(
+            tournament=tnmt, round_num=2, opening_time=timezone.now(),
+            closing_time=timezone.now())
+        models.Room.objects.create(tournament=tnmt, designation="Extra",
+                                   sorting_key=9)
+        result = draw.draw_round(tround, seed=1)
+        fights = models.Fight.objects.filter(round=tround)
+        self.assertEqual(sorted(fight.team4_id is None for fight in fights),
+                         [False, True])
+        self.assertEqual(len(result.fights), 2)
+        with self.assertRaises(draw.DrawError):
+            draw.draw_round(tround)
+        self.assertEqual(fights.count(), 2)
+
+
+class JuryTest(TestCase):
+
+    def test_min_cost_assignment(self):
+        rng = np.random.RandomState(1)
+        for n, m in [(1, 1), (3, 3), (3, 5), (5, 6), (6, 6)]:
+            cost = rng.randint(0, 20, size=(n, m)).astype(float)
+            best = min(sum(cost[i, j] for i, j in enumerate(columns))
+                       for columns in itertools.permutations(range(m), n))
+            columns = jury.min_cost_assignment(cost)
+            self.assertEqual(len(set(columns)), n)
+            self.assertEqual(sum(cost[i, j] for i, j in enumerate(columns)),
+                             best)
+        with self.assertRaises(ValueError):
+            jury.min_cost_assignment(np.zeros((3, 2)))
+
+    def test_balance(self):
+        fights = [(1, [10, 11, 12]), (2, [13, 14, 15]), (3, [16, 17, None])]
+        # Every juror conflicts with two teams of the first fight, which
+        # still gets its share of them.
+        juror_origins = {j: "a" for j in range(100, 110)}
+        team_origins = {10: {"a"}, 11: {"a"}}
+        result = jury.make_assignment(range(100, 110), fights,
+                                      juror_origins, team_origins)
+        self.assertEqual(sorted(len(p) for p in result.panels.values()),
+                         [3, 3, 4])
+        self.assertEqual(sorted(j for p in result.panels.values() for j in p),
+                         list(range(100, 110)))
+        self.assertEqual(result.conflicts, 2 * len(result.panels[1]))
+
+    def test_repeats_avoided(self):
+        fights = [(1, [10, 11, 12]), (2, [13, 14, 15])]
+        previous = [([10, 11, 12], [100, 101])]
+        result = jury.make_assignment([100, 101, 102, 103], fights,
+                                      previous_panels=previous)
+        self.assertEqual(sorted(result.panels[2]), [100, 101])
+        self.assertEqual(result.repeats, 0)
+
+    def test_fewer_jurors_than_fights(self):
+        fights = [(1, [10, 11, 12]), (2, [13, 14, 15]), (3, [16, 17, 18])]
+        result = jury.make_assignment([100, 101], fights,
+                                      {100: "a", 101: "b"}, {10: {"a"}})
+        self.assertEqual(sorted(len(p) for p in result.panels.values()),
+                         [0, 1, 1])
+        self.assertNotIn(100, result.panels[1])
+        self.assertEqual(result.conflicts, 0)
+        with self.assertRaises(jury.JuryError):
+            jury.make_assignment([100], [])
+
+    def test_assign_round(self):
+        tnmt = make_tournament("jury", num_teams=6, num_rounds=2)
+        first, second = tnmt.tournamentround_set.order_by("round_num")
+        with self.assertRaises(jury.JuryError):
+            jury.assign_round(second)
+        models.Fight.jury.through.objects \
+            .filter(fight__round=second).delete()
+        result = jury.assign_round(second)
+        self.assertEqual(sorted(len(p) for p in result.panels.values()),
+                         [3, 3])
+        self.assertEqual(models.Fight.jury.through.objects
+                         .filter(fight__round=second).count(), 6)
+
+
+def random_rows(rng, num_stages, max_jurors):
+    """ Returns rows of juror marks laid out as 'scoring._COLUMNS' for
+        `num_stages` stages: some marks are missing, some stages have no
+        reviewer, and some have a reviewer nobody has marked yet. """
+    rows = []
+    for stage in range(1, num_stages + 1):
+        persons = [int(p) for p in rng.choice(100, 3, replace=False) + 1]
+        teams = [person % 10 + 1 for person in persons]
+        no_reviewer = rng.rand() < 0.2
+        unmarked_reviewer = rng.rand() < 0.2
+        if no_reviewer:
+            persons[2] = teams[2] = None
+        for _ in range(rng.randint(1, max_jurors + 1)):
+            marks = [None if rng.rand() < 0.1 else int(rng.randint(1, 11))
+                     for _ in range(3)]
+            if no_reviewer or unmarked_reviewer:
+                marks[2] = None
+            rows.append(tuple([stage, (stage - 1) // 3 + 1] + persons +
+                              teams + marks))
+    return rows
+
+
+def brute_force_standings(rows):
+    """ Computes standings from rows of juror marks the obvious way, for
+        checking 'scoring.standings_from_rows'. Returns dictionaries of
+        points of stages, teams, fights and participants. """
+    weights = (3, 2, 1)
+    stages = {}
+    for row in rows:
+        marks = stages.setdefault(row[0], (row, [[], [], []]))[1]
+        for role in range(3):
+            if row[8 + role] is not None:
+                marks[role].append(row[8 + role])
+
+    stage_points, team_points, fight_points, participant_points = \
+        {}, {}, {}, {}
+    for stage, (row, marks) in stages.items():
+        stage_points[stage] = tuple(
+            weights[role] * sum(marks[role]) / len(marks[role])
+            if marks[role] else None
+            for role in range(3))
+        for role, points in enumerate(stage_points[stage]):
+            person, team = row[2 + role], row[5 + role]
+            if points is None or person is None:
+                continue
+            participant_points[person] = \
+                participant_points.get(person, 0) + points
+            team_points[team] = team_points.get(team, 0) + points
+            fight_points[row[1], team] = \
+                fight_points.get((row[1], team), 0) + points
+    return stage_points, team_points, fight_points, participant_points
+
+
+class StandingsTest(TestCase):
+    """ Standings computed with NumPy by 'scoring' are the same as computed
+        the obvious way. """
+
+    def assertPointsEqual(self, have, want):
+        self.assertEqual(set(have), set(want))
+        for key, points in want.items():
+            self.assertAlmostEqual(have[key], points, msg=key)
+
+    def test_weighted_averages(self):
+        rows = random_rows(np.random.RandomState(1), 200, 6)
+        standings = scoring.standings_from_rows(rows)
+        stages, teams, fights, participants = brute_force_standings(rows)
+
+        self.assertEqual(standings.stage_ids.tolist(), sorted(stages))
+        for stage, points in stages.items():
+            result = standings.stage_result(stage)
+            for have, want in zip(result, points):
+                if want is None:
+                    self.assertIsNone(have)
+                else:
+                    self.assertAlmostEqual(have, want)
+        self.assertPointsEqual(standings.team_points, teams)
+        self.assertPointsEqual(standings.fight_points, fights)
+        self.assertPointsEqual(standings.participant_points, participants)
+
+    def test_missing_reviewer_marks(self):
+        # Jurors have marked reporter and opponent, but not reviewer yet.
+        rows = [(1, 1, 11, 12, 13, 1, 2, 3, 8, 6, None),
+                (1, 1, 11, 12, 13, 1, 2, 3, 6, None, None)]
+        standings = scoring.standings_from_rows(rows)
+        self.assertEqual(standings.stage_result(1), (21.0, 12.0, None))
+        self.assertEqual(standings.stage_result(2), (None, None, None))
+        self.assertEqual(standings.team_points, {1: 21.0, 2: 12.0})
+        self.assertEqual(standings.participant_points, {11: 21.0, 12: 12.0})
+        self.assertEqual(standings.team_ranking(), [(1, 21.0), (2, 12.0)])
+
+    def test_tournament(self):
+        tnmt = make_tournament("standings", num_teams=3, num_rounds=1)
+        with self.assertNumQueries(1):
+            standings = scoring.compute_standings(tnmt)
+        for stage in models.FightStage.objects.filter(fight__tournament=tnmt):
+            self.assertEqual(standings.stage_result(stage.pk),
+                             (21.0, 12.0, 5.0))
+        self.assertEqual(scoring.standings_from_rows([]).team_points, {})
+
+    def test_large_tournament(self):
+        # 40 teams in 10 rounds play about 130 fights of three stages, and
+        # some 20000 marks are given by all jurors.
+        rows = random_rows(np.random.RandomState(2), 400, 100)
+        self.assertGreater(len(rows), 18000)
+        elapsed = []
+        for _ in range(3):
+            started = time.perf_counter()
+            scoring.standings_from_rows(rows)
+            elapsed.append(time.perf_counter() - started)
+        self.assertLess(min(elapsed), 0.1)
+
+
+class StandingsCacheTest(TestCase):
+    """ Stored points are kept equal to the ones computed from scratch by
+        signal handlers, see 'scifight.signals'. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tnmt = make_tournament("stored", num_teams=6, num_rounds=2)
+
+    def assertNoDrift(self):
+        for have, want in zip(scoring.stored_rows(self.tnmt),
+                              scoring.expected_rows(self.tnmt)):
+            self.assertEqual(scoring.find_drift(have, want), [])
+
+    def test_marks_changed(self):
+        points = models.JurorPoints.objects.filter(
+            fight_stage__fight__tournament=self.tnmt)
+        mark = points.first()
+        mark.reporter_mark = 10
+        mark.reviewer_mark = None
+        mark.save()
+        self.assertNoDrift()
+        points.last().delete()
+        self.assertNoDrift()
+        stage = models.FightStage.objects.filter(
+            fight__tournament=self.tnmt).first()
+        models.JurorPoints.objects.filter(fight_stage=stage) \
+                                  .update(reviewer_mark=None)
+        scoring.refresh_stage(stage.pk)
+        self.assertNoDrift()
+
+    def test_participant_moved(self):
+        stage = models.FightStage.objects.filter(
+            fight__tournament=self.tnmt).first()
+        player = stage.reporter
+        player.team = self.tnmt.team_set.exclude(pk=player.team_id).first()
+        player.save()
+        self.assertNoDrift()
+
+    def test_deleted(self):
+        first, second = self.tnmt.fight_set.order_by("pk")[:2]
+        first.fightstage_set.first().delete()
+        self.assertNoDrift()
+        # Marks and stages of the fight don't refresh anything one by one.
+        with self.assertNumQueries(19):
+            second.delete()
+        self.assertNoDrift()
+        models.Tournament.objects.get(pk=self.tnmt.pk).delete()
+        for model in (models.StageScore, models.FightScore, models.TeamScore):
+            self.assertFalse(model.objects.exists())
+
+    def test_migration(self):
+        migration = importlib.import_module(
+            "scifight.migrations.0007_fill_standings")
+        models.StageScore.objects.all().delete()
+        models.TeamScore.objects.update(points=0)
+        migration.fill_standings(apps, None)
+        self.assertNoDrift()
+
+
+class AdminQueryBudgetTest(TestCase):
+    """ Every tournament-specific changelist must stay within its query
+        budget when showing hundreds of rows on a single page. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tnmt = make_tournament("admin", num_teams=60, num_rounds=3,
+                                   team_size=9)
+        cls.superuser = User.objects.create_superuser(
+            "root", "root@example.com", "pw")
+        cls.manager = User.objects.create_user("manager", is_staff=True)
+        cls.manager.user_permissions.add(*Permission.objects.filter(
+            content_type__app_label="scifight"))
+        models.UserProfile.objects.create(user=cls.manager,
+                                          tournament=cls.tnmt)
+
+    def test_changelists_within_budget(self):
+        factory = RequestFactory()
+        # The manager's tournament and cached versions are loaded once per
+        # process.
+        global_version, _ = page_cache.versions(self.tnmt.slug)
+        tournament_cache.by_id(self.tnmt.pk, global_version)
+        model_admins = [model_admin
+                        for model_admin in admin.site._registry.values()
+                        if isinstance(model_admin,
+                                      tournament_specific.ModelAdmin)]
+        for model_admin in model_admins:
+            opts = model_admin.model._meta
+            self.assertIsNotNone(model_admin.query_budget, opts.label)
+            url = reverse("admin:{0}_{1}_changelist".format(
+                opts.app_label, opts.model_name))
+            for user in (self.superuser, self.manager):
+                request = factory.get(url)
+                # Fresh user objects, with no permissions cached.
+                request.user = User.objects.get(pk=user.pk)
+                label = "{0} as {1}".format(opts.label, user)
+                with self.subTest(changelist=label), \
+                        mock.patch.object(model_admin, "list_per_page", 500):
+                    with CaptureQueriesContext(connection) as queries:
+                        response = model_admin.changelist_view(request)
+                        response.render()
+                    self.assertLessEqual(len(queries),
+                                         model_admin.query_budget)
+                    if user is self.superuser:
+                        self.assertEqual(
+                            len(response.context_data["cl"].result_list),
+                            min(500, opts.model.objects.count()))
+
+
+@override_settings(SCIFIGHT_INSTRUMENTATION=True)
+class InstrumentationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tnmt = make_tournament("perf", num_teams=3, num_rounds=1)
+
+    def setUp(self):
+        cache.clear()
+        tournament_cache.forget()
+        instrumentation.reset()
+
+    def test_view_costs_recorded(self):
+        for _ in range(2):
+            cache.clear()
+            self.client.get(reverse("scifight:teams", args=[self.tnmt.slug]))
+        rows = {row.view: row for row in instrumentation.summary()}
+        row = rows["scifight:teams"]
+        self.assertEqual(row.requests, 2)
+        # Including queries restoring cached versions of the tournament and
+        # loading the tournament, done by the first request only.
+        self.assertEqual(row.max_queries, 5)
+        self.assertGreater(row.render_time, 0)
+        self.assertGreaterEqual(row.total_time, row.render_time)
+
+    def test_report_for_superusers_only(self):
+        url = reverse("performance_report")
+        User.objects.create_user("staff", password="pw", is_staff=True)
+        self.client.login(username="staff", password="pw")
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        User.objects.create_superuser("root", "root@example.com", "pw")
+        self.client.login(username="root", password="pw")
+        self.client.get(reverse("scifight:rooms", args=[self.tnmt.slug]))
+        self.assertContains(self.client.get(url), "scifight:rooms")
+
+    def test_off_by_default(self):
+        with self.settings(SCIFIGHT_INSTRUMENTATION=False):
+            self.client.get(reverse("scifight:teams", args=[self.tnmt.slug]))
+            self.assertFalse(connection.force_debug_cursor)
+            self.assertEqual(instrumentation.summary(), [])
+
+
+class IndexAuditTest(TestCase):
+
+    def test_public_pages_use_indexes(self):
+        tnmt = make_tournament("audit", num_teams=6, num_rounds=2)
+        # Planners may scan small join tables, but never tables filtered by
+        # tournament.
+        scoped = {model._meta.db_table for model in apps.get_models()
+                  if model._meta.app_label == "scifight" and
+                  any(field.name == "tournament"
+                      for field in model._meta.get_fields())}
+        scans = {(finding.url, finding.table)
+                 for finding in index_audit.audit(tnmt)
+                 if finding.problem == index_audit.FULL_SCAN and
+                 finding.table in scoped}
+        self.assertEqual(scans, set())
+
+
+class LiveFightTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tnmt = make_tournament("live", num_teams=3, num_rounds=1)
+        cls.fight = cls.tnmt.fight_set.get()
+
+    def setUp(self):
+        cache.clear()
+
+    def url(self, name):
+        return reverse("scifight:" + name, args=[self.tnmt.slug,
+                                                 self.fight.pk])
+
+    def test_polling_by_default(self):
+        response = self.client.get(self.url("fight"))
+        self.assertContains(response, self.url("fight_poll"))
+        self.assertNotContains(response, self.url("fight_events"))
+        self.assertEqual(self.client.get(self.url("fight_events"))
+                         .status_code, 404)
+
+        response = self.client.get(self.url("fight_poll"))
+        self.assertEqual(response.json()["data"]["fight"], self.fight.pk)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url("fight_poll"))["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url("fight_poll"),
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        live.publish(self.fight.pk)
+        self.assertEqual(self.client.get(self.url("fight_poll"),
+                                         HTTP_IF_NONE_MATCH=etag)
+                         .status_code, 304)
+        self.fight.stop_time = timezone.now()
+        self.fight.save()
+        live.publish(self.fight.pk)
+        response = self.client.get(self.url("fight_poll"),
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_foreign_fight(self):
+        other = make_tournament("other-live", num_teams=3, num_rounds=1)
+        url = reverse("scifight:fight_poll",
+                      args=[other.slug, self.fight.pk])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse("scifight:fight_poll", args=[self.tnmt.slug, 0])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertIsNone(cache.get(live._key(0)))
+
+    def test_private_cache_expires_soon(self):
+        self.assertEqual(live._timeout(), live.POLL_DELAY)
+        shared = {"default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": "/tmp/scifight_test_cache"}}
+        with self.settings(CACHES=shared):
+            self.assertEqual(live._timeout(), live.CACHE_TIMEOUT)
+
+    def test_events(self):
+        with self.settings(SCIFIGHT_LIVE_EVENTS=True):
+            response = self.client.get(self.url("fight_events"))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(next(response.streaming_content)
+                            .startswith(b"id: "))
+
+    def test_shared_cache_checks(self):
+        self.assertEqual(checks.check_live_events(None), [])
+        with self.settings(SCIFIGHT_LIVE_EVENTS=True):
+            self.assertEqual([e.id for e in checks.check_live_events(None)],
+                             ["scifight.E001"])
+        self.assertEqual([e.id for e in checks.check_shared_cache(None)],
+                         ["scifight.W001"])
+        shared = {"default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": "/tmp/scifight_test_cache"}}
+        with self.settings(SCIFIGHT_LIVE_EVENTS=True, CACHES=shared):
+            self.assertEqual(checks.check_live_events(None), [])
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+
+class PageCacheTest(TransactionTestCase):
+    """ Public pages are served from cache until something in their
+        tournament changes. Versions are bumped on commit, hence the
+        transaction test case. """
+
+    def setUp(self):
+        cache.clear()
+        self.tnmt = make_tournament("cached", num_teams=3, num_rounds=1)
+        self.url = reverse("scifight:teams", args=[self.tnmt.slug])
+
+    def test_cached_until_changed(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, "Team 0")
+
+        team = self.tnmt.team_set.get(name="Team 0")
+        team.name = "Renamed team"
+        team.save()
+        self.assertContains(self.client.get(self.url), "Renamed team")
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+        self.tnmt.team_set.first().save()
+        response = self.client.get(self.url,
+                                   HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(models.Tournament.objects.get(pk=self.tnmt.pk)
+                           .last_modified, self.tnmt.last_modified)
+
+    def test_other_tournament_not_invalidated(self):
+        other = make_tournament("other", num_teams=3, num_rounds=1)
+        self.client.get(self.url)
+        other.team_set.update(name="Whatever")
+        other.team_set.first().save()
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+
+    def test_missing_tournament_not_cached(self):
+        url = reverse("scifight:teams", args=["missing"])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(page_cache.versions("missing")[1], 0)
+        self.assertIsNone(cache.get(page_cache._version_key("missing")))
+        self.assertIsNotNone(cache.get(page_cache._version_key("cached")))
+
+class JurorPointsFormSetTest(TestCase):
+    """ Marks of a stage are validated together: the fight and its jury are
+        loaded once per submission, not once per juror. """
+
+    prefix = "jurorpoints_set"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tnmt = make_tournament("marks", num_teams=3, num_rounds=1,
+                                   jurors_per_fight=7)
+        cls.user = User.objects.create_superuser("admin", "", "admin")
+
+    def make_formset(self, **marks):
+        stage = models.FightStage.objects.get(fight__tournament=self.tnmt,
+                                              stage_num=1)
+        request = RequestFactory().post("/")
+        request.user = self.user
+        inline = sci_admin.JurorPointsInline(models.FightStage, admin.site)
+        formset_class = inline.get_formset(request, stage)
+
+        rows = models.JurorPoints.objects.filter(fight_stage=stage)
+        data = {
+            self.prefix + "-TOTAL_FORMS":   len(rows),
+            self.prefix + "-INITIAL_FORMS": len(rows),
+        }
+        for i, row in enumerate(rows):
+            form_prefix = "{}-{}-".format(self.prefix, i)
+            data[form_prefix + "id"]          = row.pk
+            data[form_prefix + "fight_stage"] = stage.pk
+            data[form_prefix + "juror"]       = row.juror_id
+            for field in ("reporter_mark", "opponent_mark", "reviewer_mark"):
+                data[form_prefix + field] = marks.get(field, 5)
+        return formset_class(data, instance=stage, prefix=self.prefix)
+
+    def test_query_count(self):
+        formset = self.make_formset()
+        # Two queries for the fight and its jury, one for existing marks,
+        # and four per form made by Django itself: form field lookups of the
+        # mark and the juror, juror existence and uniqueness checks.
+        with self.assertNumQueries(3 + 4 * 7):
+            self.assertTrue(formset.is_valid())
+        # Tournament of all marks is taken from the fight loaded once.
+        with self.assertNumQueries(1):
+            formset.save(commit=False)
+
+    def test_mark_range(self):
+        formset = self.make_formset(reporter_mark=models.MAX_MARK + 1)
+        self.assertFalse(formset.is_valid())
+        self.assertIn("reporter_mark", formset.errors[0])
+
+    def test_juror_outside_jury(self):
+        formset = self.make_formset()
+        outsider = models.Juror.objects.create(tournament=self.tnmt,
+                                               full_name="Outsider, Z",
+                                               short_name="Z Outsider")
+        formset.data[self.prefix + "-0-juror"] = outsider.pk
+        self.assertFalse(formset.is_valid())
+        self.assertIn("juror", formset.errors[0])
+
+
+class MarksGridFormTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tnmt = make_tournament("grid", num_teams=3, num_rounds=1)
+        cls.fight = models.Fight.objects.get(tournament=cls.tnmt)
+
+    def setUp(self):
+        self.stages = list(self.fight.fightstage_set.order_by("stage_num"))
+        self.jurors = list(self.fight.jury.order_by("pk"))
+
+    def data(self, cleared=()):
+        """ Returns a grid with all marks set to 6, except for cleared cells
+            given as `(stage, juror)` pairs. """
+        data = {}
+        for stage in self.stages:
+            for juror in self.jurors:
+                for role in sci_admin.MarksGridForm.ROLES:
+                    name = "{0}-{1}-{2}".format(stage.pk, juror.pk, role)
+                    data[name] = "" if (stage, juror) in cleared else 6
+        return data
+
+    def points(self, stage, juror):
+        return models.JurorPoints.objects.filter(fight_stage=stage,
+                                                 juror=juror)
+
+    def test_cleared_cell_refreshes_once(self):
+        stages, jurors = self.stages, self.jurors
+        points = models.JurorPoints.objects \
+            .filter(fight_stage__fight=self.fight)
+        # Marks of the first juror in the first stage are cleared.
+        form = sci_admin.MarksGridForm(self.fight, stages, jurors, points,
+                                       self.data([(stages[0], jurors[0])]))
+        self.assertTrue(form.is_valid())
+        self.assertEqual(len(form.deleted), 1)
+
+        refresh_stage = mock.patch.object(scoring, "refresh_stage",
+                                          wraps=scoring.refresh_stage)
+        refresh_fight = mock.patch.object(scoring, "refresh_fight",
+                                          wraps=scoring.refresh_fight)
+        with refresh_stage as stage_mock, refresh_fight as fight_mock:
+            form.save()
+        self.assertEqual(stage_mock.call_count, 3)
+        self.assertEqual(fight_mock.call_count, 1)
+        self.assertEqual(models.JurorPoints.objects
+                         .filter(fight_stage=stages[0]).count(), 2)
+        # Remaining marks of the first stage are the same as of the second.
+        points = [list(models.StageScore.objects
+                       .filter(fight_stage__fight=self.fight,
+                               fight_stage__stage_num=num)
+                       .values_list("points", flat=True))
+                  for num in (1, 2)]
+        self.assertEqual(points[0], points[1])
+
+    def test_concurrent_changes(self):
+        stages, jurors = self.stages, self.jurors
+        filled, changed, cleared = [(stage, jurors[0])
+                                    for stage in stages[:3]]
+        self.points(*filled).delete()
+        form = sci_admin.MarksGridForm(
+            self.fight, stages, jurors,
+            models.JurorPoints.objects.filter(fight_stage__fight=self.fight),
+            self.data([cleared]))
+        self.assertTrue(form.is_valid())
+
+        # Meanwhile, somebody else fills the cell which was empty, and
+        # clears the cells which this form changes or clears.
+        models.JurorPoints.objects.create(
+            tournament=self.tnmt, fight_stage=filled[0], juror=filled[1],
+            reporter_mark=1, opponent_mark=1, reviewer_mark=1)
+        self.points(*changed).delete()
+        self.points(*cleared).delete()
+
+        # All other cells change from 7/6/5 marks too; the cleared cell is
+        # already gone.
+        self.assertEqual(form.save(), len(stages) * len(jurors) - 1)
+        self.assertEqual(self.points(*filled).get().reporter_mark, 6)
+        self.assertEqual(self.points(*changed).get().reporter_mark, 6)
+        self.assertFalse(self.points(*cleared).exists())
+        self.assertEqual(
+            models.JurorPoints.objects
+            .filter(fight_stage__fight=self.fight).count(),
+            len(stages) * len(jurors) - 1)
+
+    def test_permissions(self):
+        user = User.objects.create_user("marker", is_staff=True)
+        models.UserProfile.objects.create(user=user, tournament=self.tnmt)
+        user.user_permissions.add(*Permission.objects.filter(
+            codename__in=["change_fight"]))
+        self.client.force_login(user)
+        url = reverse("admin:scifight_fight_marks", args=[self.fight.pk])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        user.user_permissions.add(*Permission.objects.filter(
+            codename__in=["change_jurorpoints"]))
+        self.assertEqual(self.client.get(url).status_code, 200)
+        cleared = (self.stages[0], self.jurors[0])
+        self.assertEqual(self.client.post(url, self.data([cleared]))
+                         .status_code, 403)
+        self.assertTrue(self.points(*cleared).exists())
+
+        user.user_permissions.add(*Permission.objects.filter(
+            codename__in=["delete_jurorpoints"]))
+        self.assertEqual(self.client.post(url, self.data([cleared]))
+                         .status_code, 302)
+        self.assertFalse(self.points(*cleared).exists())
+
+
+class BenchmarkTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.size = generator.Size(teams=7, rounds=3, team_size=2,
+                                  jurors_per_fight=2, problems=12)
+        cls.tnmt = generator.generate("bench", cls.size)
+        cls.superuser = User.objects.create_superuser(
+            "root", "root@example.com", "pw")
+
+    def test_generated_tournament(self):
+        # Two rooms, one of them with a fight of four teams.
+        fights = self.tnmt.fight_set.count()
+        self.assertEqual(fights, 2 * self.size.rounds)
+        self.assertEqual(self.tnmt.participant_set.count(), 14)
+        stages = models.FightStage.objects.for_tournament(self.tnmt)
+        self.assertEqual(stages.count(), 7 * self.size.rounds)
+        self.assertEqual(self.tnmt.jurorpoints_set.count(),
+                         2 * stages.count())
+        for stage in stages.select_related("fight", "problem",
+                                           "reporter", "opponent"):
+            self.assertEqual(rules.check_stage(stage), [], stage)
+        stored = scoring.stored_rows(self.tnmt)
+        expected = scoring.expected_rows(self.tnmt)
+        for have, want in zip(stored, expected):
+            self.assertEqual(scoring.find_drift(have, want), [])
+
+    def test_run(self):
+        results = runner.run(self.tnmt, self.superuser, repeat=1,
+                             only="team")
+        names = {result.name for result in results}
+        self.assertIn("team_slug", names)
+        self.assertIn("admin:scifight_team_save", names)
+        self.assertNotIn("admin:scifight_fight_save", names)
+
+    def test_compare(self):
+        result = runner.Result("teams", queries=4, p50=10.0, p90=12.0,
+                               max=15.0)
+        baseline = {"results": {"teams": {"queries": 3, "p50": 5.0,
+                                          "p90": 6.0}}}
+        self.assertEqual(
+            [(r.metric, r.baseline) for r in
+             runner.compare([result], baseline, tolerance=0.5)],
+            [("queries", 3), ("p50", 5.0)])
+        self.assertEqual(runner.compare([result], baseline, tolerance=1), [
+            runner.Regression("teams", "queries", 3, 4)])
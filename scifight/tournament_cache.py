@@ -0,0 +1,61 @@
+from scifight import models
+from scifight import page_cache
+
+_by_slug = {}
+""" Process-wide cache mapping tournament slug to a pair of the global page
+    version (see :mod:`scifight.page_cache`) it was loaded at and the
+    tournament object. Entries of older versions are loaded again, so that
+    changes made by other processes are picked up as soon as they bump the
+    version; changes made by this process clear the cache right away (see
+    :mod:`scifight.signals`). Missing slugs are not cached. """
+
+_by_id = {}
+""" Same as :data:`_by_slug`, but mapping tournament id to a pair of the
+    version and the tournament object. """
+
+
+def forget():
+    """ Clears cached tournaments. """
+    _by_slug.clear()
+    _by_id.clear()
+
+
+def by_slug(slug, version):
+    """ Returns the tournament with `slug`, or None if there is no such
+        tournament. It's taken from the cache if it was loaded at the global
+        page `version`, and is loaded with a single query otherwise. """
+    entry = _by_slug.get(slug)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    tournament = models.Tournament.objects.filter(slug=slug).first()
+    if tournament is not None:
+        _by_slug[slug] = _by_id[tournament.pk] = (version, tournament)
+    return tournament
+
+
+def by_id(tournament_id, version):
+    """ Returns the tournament with `tournament_id`, or None if there is no
+        such tournament, the same way as :func:`by_slug` does. """
+    entry = _by_id.get(tournament_id)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    tournament = models.Tournament.objects.filter(pk=tournament_id).first()
+    if tournament is None:
+        _by_id.pop(tournament_id, None)
+    else:
+        _by_id[tournament_id] = (version, tournament)
+    return tournament
+
+
+def for_request(request, slug):
+    """ Returns the tournament with `slug` for the `request`, resolving it
+        once per request and remembering it as `request.tournament`. It's
+        normally resolved by :class:`scifight.middleware.TournamentMiddleware`
+        before the view is called. """
+    tournament = getattr(request, 'tournament', None)
+    if tournament is None or tournament.slug != slug:
+        global_version, _ = page_cache.request_versions(
+            request, tournament_slug=slug)
+        tournament = by_slug(slug, global_version)
+        request.tournament = tournament
+    return tournament
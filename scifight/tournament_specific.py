@@ -3,9 +3,55 @@ from django.contrib import admin
 from django.forms   import models
 
 from scifight import models as sci_model
+from scifight import page_cache
+from scifight import tournament_cache
+
+
+def display_select_related(model, prefix=""):
+    """ Returns `select_related()` paths needed to show objects of `model`
+        as strings, as declared by its `str_select_related` attribute,
+        prefixed with `prefix`. """
+    return [prefix + path
+            for path in getattr(model, "str_select_related", ())]
+
+
+def user_tournament(request):
+    """ Returns the tournament managed by the user of the `request`, or None
+        if the user manages none. It's looked up once per request, with
+        a single query for the user's profile; the tournament itself comes
+        from the process-wide cache of :mod:`scifight.tournament_cache`,
+        as of the global page version. """
+    if not request:
+        return None
+    if not hasattr(request, "_scifight_user_tournament"):
+        tournament_id = (sci_model.UserProfile.objects
+                         .filter(user_id=request.user.pk)
+                         .values_list("tournament_id", flat=True)
+                         .first())
+        tournament = None
+        if tournament_id is not None:
+            global_version, _ = page_cache.request_versions(request)
+            tournament = tournament_cache.by_id(tournament_id,
+                                                global_version)
+        request._scifight_user_tournament = tournament
+    return request._scifight_user_tournament
 
 
 class InlineFormSet(models.BaseInlineFormSet):
+    """ Inline formset which fills tournament of saved objects. If the model
+        has `load_marks_context()` method (see
+        :class:`scifight.models.JurorPoints`), data needed for validation of
+        its objects is loaded once for the parent object and shared by all
+        forms, instead of being loaded by every form separately. """
+
+    def full_clean(self):
+        # Admin builds inline formsets after the parent form is validated,
+        # so the parent object is complete here.
+        if self.is_bound and hasattr(self.model, "load_marks_context"):
+            context = self.model.load_marks_context(self.instance)
+            for form in self.forms:
+                form.instance.marks_context = context
+        super().full_clean()
 
     def save_new(self, form, commit=True):
         obj = super().save_new(form, commit=False)
@@ -33,6 +79,42 @@ class InlineMixin(object):
 
 
 class ModelAdmin(admin.ModelAdmin):
+    """ Admin of a model belonging to a tournament, showing managers only
+        objects of their own tournament. The model and models of
+        `foreignkey_filtered_fields` must have a manager of
+        :class:`scifight.models.TournamentQuerySet`.
+
+        Changelists load every relation they show with the same query as
+        the rows, so :attr:`query_budget` holds for any number of rows.
+    """
+
+    query_budget = None
+    """ Maximum number of SQL queries of the changelist page, no matter how
+        many rows it shows, including permission checks. Every subclass must
+        declare it, as tests check it for every admin. """
+
+    def get_list_select_related(self, request):
+        """ Returns relations to load along with changelist rows: foreign
+            keys in `list_display` together with relations their string
+            forms read, and paths listed in `list_select_related`, which
+            should name relations read by methods in `list_display`. """
+        related = []
+        if isinstance(self.list_select_related, (list, tuple)):
+            related.extend(self.list_select_related)
+        for name in self.get_list_display(request):
+            if name == "__str__":
+                related.extend(display_select_related(self.model))
+                continue
+            try:
+                field = self.model._meta.get_field(name)
+            except exceptions.FieldDoesNotExist:
+                continue
+            if field.many_to_one or field.one_to_one:
+                related.append(name)
+                related.extend(display_select_related(field.related_model,
+                                                      name + "__"))
+        return sorted(set(related))
+
     def save_model(self, request, obj, form, change):
         self._process_tournament_field(obj, request)
         obj.save()
@@ -42,10 +124,9 @@ class ModelAdmin(admin.ModelAdmin):
             if hasattr(type(self), "foreignkey_filtered_fields"):
                 if db_field.name in type(self).foreignkey_filtered_fields:
                     user_tournament = self._get_user_owned_tournament(request)
-                    model_field = getattr(self.model, db_field.name)
-                    if model_field:
-                        kwargs["queryset"] = model_field.get_queryset().filter(
-                            tournament=user_tournament)
+                    related = db_field.related_model._default_manager
+                    kwargs["queryset"] = related.for_tournament(
+                        user_tournament)
 
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
@@ -55,32 +136,13 @@ class ModelAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
 
         if not request.user.is_superuser:
-            user_tournament = self._get_user_owned_tournament(request)
-            if hasattr(self.model, 'tournament'):
-                qs = qs.filter(tournament=user_tournament)
-            elif hasattr(type(self), 'tournament_alias_field'):
-                alias_field = type(self).tournament_alias_field
-                qs = qs.filter(**{alias_field: user_tournament})
+            qs = qs.for_tournament(self._get_user_owned_tournament(request))
 
         return qs
 
     @staticmethod
     def _get_user_owned_tournament(request):
-
-        if not request:
-            return
-
-        tournament_of_user = None
-
-        # To check if the (OneToOne) relation exists or not,
-        # you can use the hasattr function.
-        # http://stackoverflow.com/questions/3463240
-        if hasattr(request.user, 'scifight_extra'):
-            scifight_user_profile = request.user.scifight_extra
-            if scifight_user_profile.tournament:
-                tournament_of_user = scifight_user_profile.tournament
-
-        return tournament_of_user
+        return user_tournament(request)
 
     @staticmethod
     def _process_tournament_field(obj, request):
@@ -88,12 +150,10 @@ class ModelAdmin(admin.ModelAdmin):
             if hasattr(obj, "fill_tournament"):
                 obj.fill_tournament()
         else:
-            if hasattr(request.user, 'scifight_extra'):
-                scifight_user_profile = request.user.scifight_extra
-                if scifight_user_profile.tournament:
-                    obj.tournament = scifight_user_profile.tournament
-                else:
-                    raise exceptions.PermissionDenied()
+            tournament = user_tournament(request)
+            if tournament is None:
+                raise exceptions.PermissionDenied()
+            obj.tournament = tournament
 
     def _exclude_tournament_field(self):
         if hasattr(self.model, 'tournament'):
@@ -1,11 +1,35 @@
 from django.conf.urls import include, url
+from scifight import api
 from scifight import views
 
 
+api_urls = [
+    url(r'^$',                                           api.tournament,     name='api_tournament'),
+    url(r'^schedule/$',                                  api.schedule,       name='api_schedule'),
+    url(r'^fight/(?P<fight_id>[0-9]+)/$',                api.fight,          name='api_fight'),
+    url(r'^rooms/$',                                     api.rooms,          name='api_rooms'),
+    url(r'^room/(?P<room_id>[0-9]+)/$',                  api.room,           name='api_room'),
+    url(r'^teams/$',                                     api.teams,          name='api_teams'),
+    url(r'^team/(?P<team_id>[0-9]+)/$',                  api.team,           name='api_team_id'),
+    url(r'^team/(?P<team_slug>[\w_-]+)/$',               api.team,           name='api_team_slug'),
+    url(r'^participants/$',                              api.participants,   name='api_participants'),
+    url(r'^participant/(?P<participant_id>[0-9]+)/$',    api.participant,    name='api_participant'),
+    url(r'^leaders/$',                                   api.leaders,        name='api_leaders'),
+    url(r'^leader/(?P<leader_id>[0-9]+)/$',              api.leader,         name='api_leader'),
+    url(r'^jury/$',                                      api.jury,           name='api_jury'),
+    url(r'^juror/(?P<jury_id>[0-9]+)/$',                 api.juror,          name='api_juror'),
+    url(r'^problems/$',                                  api.problems,       name='api_problems'),
+    url(r'^problem/(?P<problem_num>[0-9]+)/$',           api.problem,        name='api_problem'),
+    url(r'^marks/$',                                     api.marks,          name='api_marks'),
+    url(r'^standings/$',                                 api.standings,      name='api_standings'),
+]
+
 tournament_urls = [
     url(r'^$',                                           views.tournament,   name='tournament'),
     url(r'^schedule/$',                                  views.schedule,     name='schedule'),
     url(r'^fight/(?P<fight_id>[0-9]+)/$',                views.fight,        name='fight'),
+    url(r'^fight/(?P<fight_id>[0-9]+)/events/$',         views.fight_events, name='fight_events'),
+    url(r'^fight/(?P<fight_id>[0-9]+)/poll/$',           views.fight_poll,   name='fight_poll'),
     url(r'^rooms/$',                                     views.rooms,        name='rooms'),
     url(r'^room/(?P<room_id>[0-9]+)/$',                  views.room,         name='room'),
     url(r'^teams/$',                                     views.teams,        name='teams'),
@@ -19,6 +43,7 @@ tournament_urls = [
     url(r'^juror/(?P<jury_id>[0-9]+)/$',                 views.juror,        name='juror'),
     url(r'^problems/$',                                  views.problems,     name='problems'),
     url(r'^problem/(?P<problem_num>[0-9]+)/$',           views.problem,      name='problem'),
+    url(r'^api/v1/',                                     include(api_urls)),
 ]
 
 urlpatterns = [
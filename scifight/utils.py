@@ -1,5 +1,7 @@
 import re
 
+from django.db import DatabaseError, connections, router
+
 
 def shorten_text(text, maxchars, ellipsis=' ...'):
     """ Returns first few words from the `text`, but no more than `maxchars`, and appends
@@ -35,3 +37,56 @@ def shorten_text(text, maxchars, ellipsis=' ...'):
     else:
         return text[:maxchars] + ellipsis
 
+
+def convert_name(full_name):
+    """ Converts full name written as "Last, First Middle" into short form
+        "First Last", exactly as 'autopopulate.js' does in admin forms.
+        Returns empty string if the name doesn't follow the convention.
+
+        :param full_name: Full name, like "Uskov, Grigory Konstantinovich".
+        :return: Short name, like "Grigory Uskov".
+    """
+    match = re.match(r'^\s*([^,]+?)\s*,\s*(\S+)', full_name)
+    if not match:
+        return ''
+    return match.group(2) + ' ' + match.group(1)
+
+
+def bulk_create_with_pks(model, objs, batch_size=None):
+    """ Works like `model.objects.bulk_create()`, but also sets primary keys
+        of created objects on database backends which don't return them, so
+        that other objects referring to them could be bulk-created next. Must
+        be called inside a transaction.
+
+        Keys are read back as the range of keys above the largest one which
+        existed before insertion. Should anyone else insert rows concurrently,
+        the number of keys won't match, and :class:`DatabaseError` is raised
+        to roll the transaction back rather than mix objects up.
+
+        :param model: Model class of objects.
+        :param objs: List of unsaved model objects.
+        :return: List of created objects.
+    """
+    objs = list(objs)
+    if not objs:
+        return objs
+
+    connection = connections[router.db_for_write(model)]
+    if getattr(connection.features, 'can_return_ids_from_bulk_insert', False):
+        return model.objects.bulk_create(objs, batch_size)
+
+    last_pk = (model.objects.order_by('-pk')
+                            .values_list('pk', flat=True).first())
+    model.objects.bulk_create(objs, batch_size)
+
+    created = model.objects.order_by('pk')
+    if last_pk is not None:
+        created = created.filter(pk__gt=last_pk)
+    pks = list(created.values_list('pk', flat=True))
+
+    if len(pks) != len(objs):
+        raise DatabaseError("concurrent insertion into '%s' detected"
+                            % model._meta.db_table)
+    for obj, pk in zip(objs, pks):
+        obj.pk = pk
+    return objs
@@ -1,6 +1,14 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
-from django.http import Http404
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from scifight import live
 from scifight import models
+from scifight import page_cache
+from scifight import queries
+from scifight import scoring
+from scifight import tournament_cache
 
 get_or_404 = get_object_or_404
 
@@ -9,64 +17,139 @@ def render_with_context(request, template, **context):
     return render(request, template, context)
 
 
+def tournament_or_404(request, tournament_slug):
+    tournament = tournament_cache.for_request(request, tournament_slug)
+    if tournament is None:
+        raise Http404()
+    return tournament
+
+
+@page_cache.tournament_page
 def index(request):
     return render_with_context(request, 'scifight/index.html',
         tournaments = models.Tournament.objects.all(),
         title       = "Willcommen")
 
 
+@page_cache.tournament_page
 def tournament(request, tournament_slug):
     return render_with_context(request, 'scifight/tournament.html',
-        tournament = get_or_404(models.Tournament, slug=tournament_slug))
+        tournament = tournament_or_404(request, tournament_slug))
 
 
+@page_cache.tournament_page
 def schedule(request, tournament_slug):
-    tnmt = get_or_404(models.Tournament, slug=tournament_slug)
+    tnmt = tournament_or_404(request, tournament_slug)
     return render_with_context(request, 'scifight/schedule.html',
         tournament      = tnmt,
-        fights          = models.Fight.objects.filter(tournament=tnmt),
+        fights          = queries.fights(tnmt),
         nav_active_item = "schedule")
 
 
+@page_cache.tournament_page
 def fight(request, tournament_slug, fight_id):
-    tnmt = get_or_404(models.Tournament, slug=tournament_slug)
+    tnmt  = tournament_or_404(request, tournament_slug)
+    fight = get_or_404(queries.fight_details(tnmt), pk=fight_id)
     return render_with_context(request, 'scifight/fight.html',
         tournament      = tnmt,
-        fight           = get_or_404(models.Fight, pk=fight_id, tournament=tnmt),
+        fight           = fight,
+        jury            = queries.fight_jury(fight),
+        fightstages     = queries.fight_stages(fight),
+        live_events     = settings.SCIFIGHT_LIVE_EVENTS,
+        live_poll_delay = live.POLL_DELAY,
         nav_active_item = "schedule")
 
 
+def _live_fight(request, tournament_slug, fight_id):
+    # Published snapshots know their tournament, so a fight is checked
+    # without queries once somebody watches it.
+    tnmt = tournament_or_404(request, tournament_slug)
+    entry = live.current(int(fight_id))
+    if entry is None or entry.tournament != tnmt.pk:
+        raise Http404()
+    return entry
+
+
+def _version(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def fight_events(request, tournament_slug, fight_id):
+    """ Streams snapshots of the fight (see :mod:`scifight.live`) as
+        server-sent events. Viewers don't touch the database once
+        connected, they only read snapshots published on changes. Every
+        viewer holds a connection for minutes, so streams are served only
+        with `SCIFIGHT_LIVE_EVENTS` setting on, by servers which handle
+        such connections cheaply. """
+    if not settings.SCIFIGHT_LIVE_EVENTS:
+        raise Http404()
+    _live_fight(request, tournament_slug, fight_id)
+    since = _version(request.META.get('HTTP_LAST_EVENT_ID'))
+    response = StreamingHttpResponse(live.event_stream(int(fight_id), since),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def fight_poll(request, tournament_slug, fight_id):
+    """ Returns the latest snapshot of the fight as JSON with its version
+        right away, or '304 Not Modified' if the viewer already has it.
+        Viewers poll it every :data:`scifight.live.POLL_DELAY` seconds,
+        unless event streams are enabled. """
+    entry = _live_fight(request, tournament_slug, fight_id)
+    etag = str(entry.version)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse('{{"version": {0}, "data": {1}}}'.format(
+                                    entry.version, entry.data),
+                                content_type='application/json')
+    response['ETag'] = quote_etag(etag)
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+@page_cache.tournament_page
 def rooms(request, tournament_slug):
-    tnmt = get_or_404(models.Tournament, slug=tournament_slug)
+    tnmt = tournament_or_404(request, tournament_slug)
     return render_with_context(request, 'scifight/rooms.html',
         tournament      = tnmt,
-        rooms           = models.Room.objects.filter(tournament=tnmt),
+        rooms           = queries.rooms(tnmt),
         nav_active_item = "rooms")
 
 
+@page_cache.tournament_page
 def room(request, tournament_slug, room_id):
-    tnmt = get_or_404(models.Tournament, slug=tournament_slug)
+    tnmt = tournament_or_404(request, tournament_slug)
+    room = get_or_404(queries.rooms(tnmt), pk=room_id)
     return render_with_context(request, 'scifight/room.html',
         tournament      = tnmt,
-        room            = get_or_404(models.Room, pk=room_id, tournament=tnmt),
+        room            = room,
+        fights          = queries.fights(tnmt).filter(room=room),
         nav_active_item = "rooms")
 
 
+@page_cache.tournament_page
 def teams(request, tournament_slug):
-    tnmt = get_or_404(models.Tournament, slug=tournament_slug)
+    tnmt   = tournament_or_404(request, tournament_slug)
+    points = scoring.stored_team_points(tnmt)
     return render_with_context(request, 'scifight/teams.html',
         tournament      = tnmt,
-        teams           = models.Team.objects.filter(tournament=tnmt),
+        teams           = scoring.rank(queries.teams(tnmt), points),
         nav_active_item = "teams")
 
 
+@page_cache.tournament_page
 def team(request, tournament_slug, team_id=None, team_slug=None):
-    tnmt = get_or_404(models.Tournament, slug=tournament_slug)
+    tnmt = tournament_or_404(request, tournament_slug)
 
     if team_id:
-        team = get_or_404(models.Team, pk=team_id, tournament=tnmt)
+        team = get_or_404(queries.team_details(tnmt), pk=team_id)
     elif team_slug:
-        team = get_or_404(models.Team, slug=team_slug, tournament=tnmt)
+        team = get_or_404(queries.team_details(tnmt), slug=team_slug)
     else:
         raise Http404()
 
@@ -76,70 +159,80 @@ def team(request, tournament_slug, team_id=None, team_slug=None):
         nav_active_item = "teams")
 
 
+@page_cache.tournament_page
 def participants(request, tournament_slug):
-    tnmt = get_or_404(models.Tournament, slug=tournament_slug)
+    tnmt      = tournament_or_404(request, tournament_slug)
+    standings = scoring.compute_standings(tnmt)
     return render_with_context(request, 'scifight/participants.html',
         tournament      = tnmt,
-        participants    = models.Participant.objects.filter(tournament=tnmt),
+        participants    = scoring.rank(queries.participants(tnmt),
+                                       standings.participant_points),
         nav_active_item = "participant")
 
 
+@page_cache.tournament_page
 def participant(request, tournament_slug, participant_id):
-    tnmt = get_or_404(models.Tournament, slug=tournament_slug)
+    tnmt = tournament_or_404(request, tournament_slug)
     return render_with_context(request, 'scifight/participant.html',
         tournament      = tnmt,
-        participant     = get_or_404(models.Participant,
-                                     pk=participant_id, tournament=tnmt),
+        participant     = get_or_404(queries.participants(tnmt),
+                                     pk=participant_id),
         nav_active_item = "participants")
 
 
+@page_cache.tournament_page
 def leaders(request, tournament_slug):
-    tnmt = get_or_404(models.Tournament, slug=tournament_slug)
+    tnmt = tournament_or_404(request, tournament_slug)
     return render_with_context(request, 'scifight/leaders.html',
         tournament      = tnmt,
-        leaders         = tnmt.leader_set.all(),
+        leaders         = queries.leaders(tnmt),
         nav_active_item = "leaders")
 
 
+@page_cache.tournament_page
 def leader(request, tournament_slug, leader_id):
-    tnmt   = get_or_404(models.Tournament, slug=tournament_slug)
-    leader = get_or_404(models.Leader, pk=leader_id, tournament=tnmt)
+    tnmt   = tournament_or_404(request, tournament_slug)
+    leader = get_or_404(queries.leaders(tnmt), pk=leader_id)
     return render_with_context(request, 'scifight/leader.html',
         tournament      = tnmt,
         leader          = leader,
         nav_active_item = "leaders")
 
 
+@page_cache.tournament_page
 def jury(request, tournament_slug):
-    tnmt = get_or_404(models.Tournament, slug=tournament_slug)
+    tnmt = tournament_or_404(request, tournament_slug)
     return render_with_context(request, 'scifight/jury.html',
         tournament      = tnmt,
-        jury            = models.Juror.objects.filter(tournament=tnmt),
+        jury            = queries.jury(tnmt),
         nav_active_item = "jury")
 
 
+@page_cache.tournament_page
 def juror(request, tournament_slug, jury_id):
-    tnmt  = get_or_404(models.Tournament, slug=tournament_slug)
-    juror = get_or_404(models.Juror, pk=jury_id, tournament=tnmt)
+    tnmt  = tournament_or_404(request, tournament_slug)
+    juror = get_or_404(queries.jury(tnmt), pk=jury_id)
     return render_with_context(request, 'scifight/juror.html',
         tournament      = tnmt,
         juror           = juror,
         nav_active_item = "jury")
 
 
+@page_cache.tournament_page
 def problems(request, tournament_slug):
-    tnmt     = get_or_404(models.Tournament, slug=tournament_slug)
-    problems = models.Problem.objects.filter(tournament=tnmt)
+    tnmt     = tournament_or_404(request, tournament_slug)
+    problems = queries.problems(tnmt)
     return render_with_context(request, 'scifight/problems.html',
         tournament      = tnmt,
         problems        = problems,
         nav_active_item = "problems")
 
 
+@page_cache.tournament_page
 def problem(request, tournament_slug, problem_num):
-    tnmt    = get_or_404(models.Tournament, slug=tournament_slug)
-    problem = get_or_404(models.Problem,
-                         problem_num=problem_num, tournament=tnmt)
+    tnmt    = tournament_or_404(request, tournament_slug)
+    problem = get_or_404(queries.problem_details(tnmt),
+                         problem_num=problem_num)
     return render_with_context(request, 'scifight/problem.html',
         tournament      = tnmt,
         problem         = problem,
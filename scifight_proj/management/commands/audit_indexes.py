@@ -0,0 +1,49 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from scifight import index_audit
+from scifight import models
+
+
+class Command(BaseCommand):
+    help = ("Request public pages of a tournament and admin changelists, "
+            "and check plans of their SQL queries with EXPLAIN, reporting "
+            "full table scans and sorts done without an index. Run it on "
+            "a database filled with realistic data, as planners scan small "
+            "tables anyway.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('tournament_slug', type=str,
+            help='Slug of the tournament whose pages to check.')
+        parser.add_argument('--user', type=str, default=None,
+            help='Check admin changelists as this user (for example, '
+                 'a staff user bound to the tournament).')
+        parser.add_argument('--sql', action='store_true',
+            help='Print queries along with their problems.')
+
+    def handle(self, *args, **options):
+        slug = options['tournament_slug']
+        try:
+            tournament = models.Tournament.objects.get(slug=slug)
+        except models.Tournament.DoesNotExist:
+            raise CommandError("tournament '%s' does not exist" % slug)
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError("user '%s' does not exist"
+                                   % options['user'])
+
+        try:
+            findings = index_audit.audit(tournament, user)
+        except (ValueError, NotImplementedError) as e:
+            raise CommandError(str(e))
+
+        for finding in findings:
+            self.stdout.write("%s: %s of %s" % (
+                finding.url, finding.problem, finding.table or "results"))
+            if options['sql']:
+                self.stdout.write("    " + finding.sql)
+        return "Found %d problem(s)" % len(findings)
@@ -0,0 +1,103 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+from scifight.benchmarks import generator
+from scifight.benchmarks import runner
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(generator.__file__),
+                                'baseline.json')
+
+
+class Command(BaseCommand):
+    help = ("Generate a synthetic tournament in a throwaway SQLite database "
+            "and measure query counts and latency of its public pages and "
+            "admin pages, comparing them against a stored baseline. Run "
+            "with --settings=scifight.benchmarks.settings.")
+
+    def add_arguments(self, parser):
+        size = generator.DEFAULT_SIZE
+        parser.add_argument('--teams', type=int, default=size.teams,
+            help='Number of teams (default: %(default)s).')
+        parser.add_argument('--rounds', type=int, default=size.rounds,
+            help='Number of rounds (default: %(default)s).')
+        parser.add_argument('--team-size', type=int, default=size.team_size,
+            help='Number of participants per team (default: %(default)s).')
+        parser.add_argument('--jurors-per-fight', type=int,
+            default=size.jurors_per_fight,
+            help='Number of jurors marking a fight (default: %(default)s).')
+        parser.add_argument('--problems', type=int, default=size.problems,
+            help='Number of problems (default: %(default)s).')
+        parser.add_argument('--repeat', type=int, default=10,
+            help='Number of requests to every page (default: %(default)s).')
+        parser.add_argument('--only', type=str, default=None,
+            help='Only measure pages with names containing this string.')
+        parser.add_argument('--baseline', type=str, default=DEFAULT_BASELINE,
+            help='Baseline file to compare against (default: %(default)s).')
+        parser.add_argument('--save-baseline', action='store_true',
+            help='Store results as the new baseline instead of comparing.')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+            help='Allowed relative growth of median time before it is '
+                 'reported as a regression (default: %(default)s).')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("benchmarks need an SQLite database, run "
+                               "with --settings=scifight.benchmarks.settings")
+        size = generator.Size(
+            teams            = options['teams'],
+            rounds           = options['rounds'],
+            team_size        = options['team_size'],
+            jurors_per_fight = options['jurors_per_fight'],
+            problems         = options['problems'])
+        if size.teams < 3 or size.problems < 2 or min(size) < 1:
+            raise CommandError("need at least 3 teams, 2 problems, and one "
+                               "round, participant and juror")
+
+        baseline = None
+        if not options['save_baseline']:
+            try:
+                baseline = runner.load_baseline(options['baseline'])
+            except (OSError, ValueError) as e:
+                raise CommandError("can't read baseline: %s" % e)
+            if baseline['size'] != size._asdict():
+                self.stderr.write("Warning: baseline was measured on a "
+                                  "tournament of different size")
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            try:
+                tournament = generator.generate('bench', size)
+                user = User.objects.create_superuser(
+                    'bench', 'bench@example.com', 'bench')
+                results = runner.run(tournament, user, options['repeat'],
+                                     options['only'])
+            except ValueError as e:
+                raise CommandError(str(e))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write("%-48s %7s %9s %9s %9s" % (
+            "page", "queries", "p50, ms", "p90, ms", "max, ms"))
+        for r in results:
+            self.stdout.write("%-48s %7d %9.2f %9.2f %9.2f" % (
+                r.name, r.queries, r.p50, r.p90, r.max))
+
+        if options['save_baseline']:
+            runner.save_baseline(options['baseline'], size, results)
+            return "Baseline saved to %s" % options['baseline']
+
+        regressions = runner.compare(results, baseline, options['tolerance'])
+        for r in regressions:
+            self.stdout.write("%s: %s grew from %s to %s" % (
+                r.name, r.metric, r.baseline, r.current))
+        if regressions:
+            raise CommandError("%d regression(s) found" % len(regressions))
+        return "No regressions in %d page(s)" % len(results)
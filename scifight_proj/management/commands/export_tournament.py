@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scifight import archive
+from scifight import models
+
+
+class Command(BaseCommand):
+    help = ("Export a tournament with all its data into an archive file "
+            "(JSON Lines, gzip-compressed if file name ends with '.gz'), "
+            "which can be restored with 'import_tournament'.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('tournament_slug', type=str,
+            help='Slug of the tournament to export.')
+        parser.add_argument('file', type=str,
+            help='Path to the archive file to write.')
+
+    def handle(self, *args, **options):
+        slug = options['tournament_slug']
+        try:
+            tournament = models.Tournament.objects.get(slug=slug)
+        except models.Tournament.DoesNotExist:
+            raise CommandError("tournament '%s' does not exist" % slug)
+
+        started = time.time()
+        try:
+            with archive.open_archive(options['file'], 'w') as stream:
+                counts = archive.export_tournament(tournament, stream)
+        except OSError as e:
+            raise CommandError("can't write archive: %s" % e)
+
+        return "Exported %d record(s) of '%s' in %.2f s" % (
+            sum(counts.values()), slug, time.time() - started)
@@ -0,0 +1,276 @@
+import collections
+import csv
+import json
+import os
+import time
+
+from django.core import exceptions
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_slug
+from django.db import DatabaseError, transaction
+
+from scifight import models
+from scifight import page_cache
+from scifight import utils
+
+COLUMNS = ('kind', 'name', 'short_name', 'team', 'origin', 'grade',
+           'captain', 'slug')
+
+PERSON_MODELS = {
+    'participant': models.Participant,
+    'leader':      models.Leader,
+    'juror':       models.Juror,
+}
+
+TRUE_VALUES = {'1', 'y', 'yes', 'true', '+'}
+
+
+class Command(BaseCommand):
+    help = ("Import teams, participants, leaders and jurors of a tournament "
+            "from a CSV or JSON file. Each record has the following fields: "
+            "'kind' (team, participant, leader or juror), 'name' (team name "
+            "or person's full name as \"Last, First\"), and optional "
+            "'short_name', 'team', 'origin', 'grade', 'captain' and 'slug'. "
+            "The whole file is validated before anything is written, and is "
+            "imported in a single transaction. Every person gets a new "
+            "identity; use 'match_identities' afterwards to link returning "
+            "people.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('tournament_slug', type=str,
+            help='Slug of the tournament to import roster into.')
+        parser.add_argument('file', type=str,
+            help='Path to CSV file with header line, or JSON file with '
+                 'a list of objects.')
+        parser.add_argument('--format', choices=['csv', 'json'],
+            dest='format', default=None,
+            help='File format, guessed by file extension by default.')
+
+    def handle(self, *args, **options):
+        started = time.time()
+
+        slug = options['tournament_slug']
+        try:
+            tournament = models.Tournament.objects.get(slug=slug)
+        except models.Tournament.DoesNotExist:
+            raise CommandError("tournament '%s' does not exist" % slug)
+
+        path = options['file']
+        fmt = options['format'] or os.path.splitext(path)[1][1:].lower()
+        if fmt not in ('csv', 'json'):
+            raise CommandError("unknown file format '%s'" % fmt)
+
+        records = self._read_csv(path) if fmt == 'csv' \
+            else self._read_json(path)
+        teams, people = self._validate(tournament, records)
+        validated = time.time()
+
+        try:
+            with transaction.atomic():
+                counts = self._import(tournament, teams, people)
+                page_cache.bump(tournament.slug)
+        except DatabaseError as e:
+            raise CommandError("import failed, nothing is saved: %s" % e)
+
+        finished = time.time()
+        return ("Imported %d team(s), %d participant(s), %d leader(s) and "
+                "%d juror(s) in %.2f s (validation %.2f s, saving %.2f s)" % (
+                    counts['team'], counts['participant'], counts['leader'],
+                    counts['juror'], finished - started,
+                    validated - started, finished - validated))
+
+    # --- Reading ---
+
+    @staticmethod
+    def _clean_record(raw):
+        record = {column: '' for column in COLUMNS}
+        for key, value in raw.items():
+            if key is None:
+                continue
+            key = key.strip().lower()
+            if key in record and value is not None:
+                record[key] = str(value).strip()
+        return record
+
+    def _read_csv(self, path):
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                reader = csv.DictReader(f)
+                # Data starts at the second line, after the header.
+                return [("line %d" % (i + 2), self._clean_record(raw))
+                        for i, raw in enumerate(reader)]
+        except (OSError, csv.Error, UnicodeDecodeError) as e:
+            raise CommandError("can't read '%s': %s" % (path, e))
+
+    def _read_json(self, path):
+        try:
+            with open(path, encoding='utf-8-sig') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError("can't read '%s': %s" % (path, e))
+
+        if not isinstance(data, list) or \
+                not all(isinstance(raw, dict) for raw in data):
+            raise CommandError("JSON file must contain a list of objects")
+        return [("record %d" % (i + 1), self._clean_record(raw))
+                for i, raw in enumerate(data)]
+
+    # --- Validation ---
+
+    @staticmethod
+    def _validate(tournament, records):
+        errors = []
+        teams, people = [], []
+
+        # Team names aren't unique in the database, so members can't be
+        # added to a team whose name is shared by several existing teams.
+        existing_teams = collections.Counter(models.Team.objects
+                                             .filter(tournament=tournament)
+                                             .values_list('name', flat=True))
+        existing_slugs = set(models.Team.objects
+                             .filter(tournament=tournament)
+                             .exclude(slug=None)
+                             .values_list('slug', flat=True))
+        new_teams, new_slugs = set(), set()
+
+        def check_length(where, record, field, max_length):
+            if len(record[field]) > max_length:
+                errors.append("%s: '%s' is longer than %d characters"
+                              % (where, field, max_length))
+
+        for where, record in records:
+            kind = record['kind'].lower()
+            name = record['name']
+
+            if kind != 'team' and kind not in PERSON_MODELS:
+                errors.append("%s: unknown kind '%s'" % (where, kind))
+                continue
+            if not name:
+                errors.append("%s: 'name' is empty" % where)
+                continue
+
+            for field in ('name', 'short_name', 'team', 'origin'):
+                check_length(where, record, field, models.NAME_LENGTH)
+
+            if kind == 'team':
+                if name in existing_teams or name in new_teams:
+                    errors.append("%s: team '%s' already exists"
+                                  % (where, name))
+                slug = record['slug']
+                if slug:
+                    check_length(where, record, 'slug', models.SLUG_LENGTH)
+                    try:
+                        validate_slug(slug)
+                    except exceptions.ValidationError:
+                        errors.append("%s: invalid slug '%s'"
+                                      % (where, slug))
+                    if slug in existing_slugs or slug in new_slugs:
+                        errors.append("%s: slug '%s' is already taken"
+                                      % (where, slug))
+                    new_slugs.add(slug)
+                new_teams.add(name)
+                teams.append(record)
+                continue
+
+            record['kind'] = kind
+            if not record['short_name']:
+                record['short_name'] = utils.convert_name(name)
+                if not record['short_name']:
+                    errors.append("%s: can't guess short name from '%s', "
+                                  "write it as \"Last, First\" or give "
+                                  "'short_name'" % (where, name))
+            if kind in ('participant', 'leader') and not record['team']:
+                errors.append("%s: %s must belong to a team"
+                              % (where, kind))
+            check_length(where, record, 'grade', models.GRADE_LENGTH)
+            people.append((where, record))
+
+        # Teams may be listed after their members.
+        for where, record in people:
+            team = record['team']
+            if team and team not in existing_teams \
+                    and team not in new_teams:
+                errors.append("%s: unknown team '%s'" % (where, team))
+            elif existing_teams[team] > 1:
+                errors.append("%s: there are %d teams named '%s'"
+                              % (where, existing_teams[team], team))
+
+        if errors:
+            raise CommandError("%d error(s) found, nothing is imported:\n%s"
+                               % (len(errors), "\n".join(errors)))
+
+        return teams, [record for _, record in people]
+
+    # --- Importing ---
+
+    @staticmethod
+    def _origins(model, names):
+        """ Returns dictionary mapping origin names to ids, creating missing
+            origins. """
+        names = set(names) - {''}
+        cache = dict(model.objects
+                     .filter(place_name__in=names)
+                     .values_list('place_name', 'id'))
+        missing = [model(place_name=name)
+                   for name in sorted(names - set(cache))]
+        for origin in utils.bulk_create_with_pks(model, missing):
+            cache[origin.place_name] = origin.pk
+        return cache
+
+    def _import(self, tournament, teams, people):
+        counts = {kind: 0 for kind in ['team'] + list(PERSON_MODELS)}
+
+        team_origins = self._origins(models.TeamOrigin,
+                                     [r['origin'] for r in teams])
+        person_origins = self._origins(models.PersonOrigin,
+                                       [r['origin'] for r in people])
+
+        # Every imported object is the only avatar of its new identity, so
+        # identity labels are known in advance and set right away.
+        team_identities = utils.bulk_create_with_pks(models.TeamIdentity, [
+            models.TeamIdentity(latest_name=r['name'],
+                                latest_tournament=tournament)
+            for r in teams])
+
+        new_teams = utils.bulk_create_with_pks(models.Team, [
+            models.Team(tournament  = tournament,
+                        identity_id = identity.pk,
+                        name        = r['name'],
+                        slug        = r['slug'] or None,
+                        origin_id   = team_origins.get(r['origin']))
+            for r, identity in zip(teams, team_identities)])
+        counts['team'] = len(new_teams)
+
+        # Validation ensures that names of existing teams referred to by
+        # people are unique, and new teams can't reuse them.
+        team_ids = {team.name: team.pk for team in new_teams}
+        names = {r['team'] for r in people if r['team']} - set(team_ids)
+        team_ids.update(models.Team.objects
+                        .filter(tournament=tournament, name__in=names)
+                        .values_list('name', 'id'))
+
+        person_identities = utils.bulk_create_with_pks(
+            models.PersonIdentity, [
+                models.PersonIdentity(latest_name=r['short_name'],
+                                      latest_tournament=tournament)
+                for r in people])
+
+        avatars = {kind: [] for kind in PERSON_MODELS}
+        for r, identity in zip(people, person_identities):
+            fields = dict(tournament  = tournament,
+                          identity_id = identity.pk,
+                          full_name   = r['name'],
+                          short_name  = r['short_name'],
+                          origin_id   = person_origins.get(r['origin']))
+            if r['kind'] in ('participant', 'leader'):
+                fields['team_id'] = team_ids[r['team']]
+            if r['kind'] == 'participant':
+                fields['grade'] = r['grade']
+                fields['is_captain'] = r['captain'].lower() in TRUE_VALUES
+            avatars[r['kind']].append(PERSON_MODELS[r['kind']](**fields))
+
+        for kind, objs in avatars.items():
+            PERSON_MODELS[kind].objects.bulk_create(objs)
+            counts[kind] = len(objs)
+
+        return counts
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scifight import archive
+
+
+class Command(BaseCommand):
+    help = ("Restore a tournament from an archive file written by "
+            "'export_tournament'. All objects are created anew in a single "
+            "transaction, and standings are rebuilt.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', type=str,
+            help='Path to the archive file to read.')
+        parser.add_argument('--slug', type=str, dest='slug', default=None,
+            help='Slug for the restored tournament, if the archived one '
+                 'is already taken. Archived names which are taken too get '
+                 'the slug appended, unless given with --full-name and '
+                 '--short-name.')
+        parser.add_argument('--full-name', type=str, dest='full_name',
+            default=None,
+            help='Full name for the restored tournament.')
+        parser.add_argument('--short-name', type=str, dest='short_name',
+            default=None,
+            help='Short name for the restored tournament.')
+        parser.add_argument('--reuse-identities', action='store_true',
+            dest='reuse_identities', default=False,
+            help='Link teams and people to existing identities with the '
+                 'same ids. Use only for archives made on this site.')
+
+    def handle(self, *args, **options):
+        started = time.time()
+        try:
+            with archive.open_archive(options['file'], 'r') as stream:
+                tournament, counts = archive.import_tournament(
+                    stream, options['slug'], options['reuse_identities'],
+                    options['full_name'], options['short_name'])
+        except OSError as e:
+            raise CommandError("can't read archive: %s" % e)
+        except archive.ArchiveError as e:
+            raise CommandError("can't restore archive: %s" % e)
+
+        return "Imported %d record(s) as '%s' in %.2f s" % (
+            sum(counts.values()), tournament.slug, time.time() - started)
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from scifight import identities
+from scifight import models
+
+
+class Command(BaseCommand):
+    help = ("Find people of a tournament who have taken part in previous "
+            "tournaments, and link them to their existing identities.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('tournament_slug', type=str,
+            help='Slug of the tournament whose roster should be matched.')
+        parser.add_argument('--apply', action='store_true', dest='apply',
+            default=False,
+            help='Merge matched identities instead of just listing them.')
+        parser.add_argument('--threshold', type=float, dest='threshold',
+            default=identities.MATCH_THRESHOLD,
+            help='Minimum name similarity from 0 to 1 (default: %(default)s).')
+
+    def handle(self, *args, **options):
+        slug = options['tournament_slug']
+        try:
+            tournament = models.Tournament.objects.get(slug=slug)
+        except models.Tournament.DoesNotExist:
+            raise CommandError("tournament '%s' does not exist" % slug)
+
+        started = time.time()
+        matches = identities.match_people(tournament, options['threshold'])
+
+        targets = models.PersonIdentity.objects \
+            .select_related('latest_tournament') \
+            .in_bulk([match.identity_id for match in matches])
+
+        with transaction.atomic():
+            for match in matches:
+                self.stdout.write("%s '%s' (HID#%d) -> %s, score %.2f" % (
+                    type(match.avatar).__name__, match.avatar.full_name,
+                    match.avatar.identity_id, targets[match.identity_id],
+                    match.score))
+                if options['apply']:
+                    identities.merge_people(match.avatar.identity_id,
+                                            match.identity_id)
+
+        return "%d match(es) %s in %.2f s" % (
+            len(matches), "applied" if options['apply'] else "found",
+            time.time() - started)
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from scifight import instrumentation
+
+
+class Command(BaseCommand):
+    help = ("Print costs of views recorded by server processes: number of "
+            "SQL queries, database, template rendering and total time. "
+            "Processes share their records through the cache, so a cache "
+            "shared by all processes must be configured.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order', type=str, default='total_time',
+            choices=instrumentation.Row._fields,
+            help='Column to sort views by (default: total_time).')
+        parser.add_argument('--limit', type=int, default=None,
+            help='Number of views to print (default: all).')
+        parser.add_argument('--reset', action='store_true',
+            help='Clear recorded costs after printing them.')
+
+    def handle(self, *args, **options):
+        rows = instrumentation.summary(options['order'])
+        if options['reset']:
+            instrumentation.reset()
+        if not rows:
+            raise CommandError("no requests have been recorded; note that "
+                               "records are not shared through a per-process "
+                               "cache, like the default local memory one")
+        rows = rows[:options['limit']]
+
+        width = max(len('view'), max(len(row.view) for row in rows))
+        lines = ["{0:<{w}} {1:>8} {2:>8} {3:>8} {4:>9} {5:>9} {6:>9} "
+                 "{7:>9}".format('view', 'requests', 'queries', 'max',
+                                 'db ms', 'render ms', 'total ms', 'p95 ms',
+                                 w=width)]
+        for row in rows:
+            lines.append("{0.view:<{w}} {0.requests:>8} {0.queries:>8.1f} "
+                         "{0.max_queries:>8} {0.db_time:>9.1f} "
+                         "{0.render_time:>9.1f} {0.total_time:>9.1f} "
+                         "{0.p95_time:>9.1f}".format(row, w=width))
+        return "\n".join(lines)
@@ -0,0 +1,46 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scifight import models
+from scifight import static_site
+
+
+class Command(BaseCommand):
+    help = ("Render all public pages of a finished tournament into static "
+            "HTML files, so that it can be served by a plain web server. "
+            "Static files are not copied; run 'collectstatic' for them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('tournament_slug', type=str,
+            help='Slug of the tournament to publish.')
+        parser.add_argument('outdir', type=str,
+            help='Directory to write pages to.')
+        parser.add_argument('--jobs', type=int, default=None,
+            help='Number of worker processes (default: number of CPUs).')
+        parser.add_argument('--force', action='store_true',
+            help='Publish the tournament even if it is not finished yet.')
+
+    def handle(self, *args, **options):
+        slug = options['tournament_slug']
+        try:
+            tournament = models.Tournament.objects.get(slug=slug)
+        except models.Tournament.DoesNotExist:
+            raise CommandError("tournament '%s' does not exist" % slug)
+
+        finished = (tournament.closing_date is not None and
+                    tournament.closing_date < datetime.date.today())
+        if not finished and not options['force']:
+            raise CommandError("tournament '%s' is not finished yet, its "
+                               "pages may still change (use --force)" % slug)
+
+        started = time.time()
+        try:
+            num_pages, size = static_site.publish(
+                tournament, options['outdir'], options['jobs'])
+        except OSError as e:
+            raise CommandError("can't write pages: %s" % e)
+
+        return "Published %d page(s) of '%s' (%d KiB) in %.2f s" % (
+            num_pages, slug, size // 1024, time.time() - started)
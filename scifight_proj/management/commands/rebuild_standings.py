@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from scifight import models
+from scifight import page_cache
+from scifight import scoring
+
+
+class Command(BaseCommand):
+    help = ("Verify incrementally maintained standings of a tournament "
+            "against a full recompute, report drift and rebuild them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('tournament_slug', type=str,
+            help='Slug of the tournament to rebuild standings for.')
+        parser.add_argument('--check', action='store_true', dest='check',
+            default=False,
+            help='Only report drift, do not modify stored standings.')
+
+    def handle(self, *args, **options):
+        slug = options['tournament_slug']
+        try:
+            tournament = models.Tournament.objects.get(slug=slug)
+        except models.Tournament.DoesNotExist:
+            raise CommandError("tournament '%s' does not exist" % slug)
+
+        with transaction.atomic():
+            expected = scoring.expected_rows(tournament)
+            stored   = scoring.stored_rows(tournament)
+
+            tables = ('stage', 'fight', 'team')
+            total_drift = 0
+            for table, have, want in zip(tables, stored, expected):
+                drift = scoring.find_drift(have, want)
+                total_drift += len(drift)
+                for key, have_row, want_row in drift:
+                    self.stdout.write("%s %s: stored %s, expected %s" % (
+                        table, key,
+                        have_row and have_row['points'],
+                        want_row and want_row['points']))
+
+            if total_drift and not options['check']:
+                scoring.rebuild_tournament(tournament, expected)
+                page_cache.bump(tournament.slug)
+
+        if not total_drift:
+            return "Standings of '%s' are consistent" % slug
+        if options['check']:
+            raise CommandError("%d drifted row(s) found" % total_drift)
+        return "Rebuilt standings of '%s', %d row(s) fixed" % (slug,
+                                                                total_drift)
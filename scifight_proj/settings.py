@@ -35,12 +35,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'scifight.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
+    'scifight.middleware.TournamentMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'admin_reorder.middleware.ModelAdminReorder'
@@ -90,6 +92,38 @@ LOCALE_PATHS = (
     os.path.join(BASE_DIR, "scifight/locale"),
 )
 
+# Cache is used for rendered public pages and live fight snapshots, see
+# 'scifight.page_cache' and 'scifight.live'. Local memory cache is private
+# to a process, so use a shared backend for multi-process servers.
+# https://docs.djangoproject.com/en/1.9/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'scifight',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Viewers of fight pages follow fights by polling every few seconds; polls
+# are answered right away, mostly with '304 Not Modified'. Server-sent event
+# streams hold a connection for minutes instead, which would use up workers
+# of a synchronous WSGI server with a few dozen viewers; turn them on only
+# when the events URL ('fight/<id>/events/') is served by asynchronous
+# workers (like gunicorn with gevent) or a proxy holding connections for
+# them. With a per-process cache like the default one, viewers see changes
+# made through other processes only after a few seconds; use a shared cache
+# with several processes, which 'check' command verifies.
+
+SCIFIGHT_LIVE_EVENTS = False
+
+# Recording of costs of every request for the performance report of the
+# admin. It makes database connections log all queries and measures all
+# template rendering, which costs a little on every request, so it's off
+# unless turned on here.
+
+SCIFIGHT_INSTRUMENTATION = False
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/1.9/howto/static-files/
 
@@ -117,7 +151,8 @@ ADMIN_REORDER = ('sites',
          label='Tournament progress',
          models=[
              'scifight.Fight',
-             'scifight.FightStage']),
+             'scifight.FightStage',
+             'scifight.JurorPoints']),
 
     dict(app='auth',
          label='Website administration',
@@ -13,6 +13,7 @@ Including another URLconf
     1. Import the include() function: from django.conf.urls import url, include
     2. Add a URL to urlpatterns:  url(r'^blog/', include('blog.urls'))
 """
+from scifight import admin as scifight_admin
 from scifight import urls
 from django.conf.urls import url, include
 from django.contrib import admin
@@ -20,6 +21,9 @@ from scifight.views import index
 
 urlpatterns = [
     url(r'^$',      index, name='index'),
+    url(r'^admin/performance/$',
+        admin.site.admin_view(scifight_admin.performance_report),
+        name='performance_report'),
     url(r'^admin/', admin.site.urls),
     url(r'^',       include(urls,)),
 ]